@@ -0,0 +1,230 @@
+'''
+    Persistent SQLite index of a COCO json, built once and reused until the json changes (mtime / size stored in a meta table)
+    - Per image lookups by position or image_id, annotation queries filtered by category and area, bulk iteration
+    - The json is streamed into the index (ijson, or a single json.load without it, see convert_coco_to_yolo.coco_items_reader)
+
+    usage:
+        with CocoIndex("./coco_annotations/valid.json") as index:
+            image = index.image(0)
+            anns = index.annotations(image["id"])
+
+        python coco_index.py ./coco_annotations/valid.json  (builds the index and prints a summary)
+'''
+import argparse
+import os
+import sqlite3
+import time
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from convert_coco_to_yolo import coco_items_reader
+
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE categories (position INTEGER PRIMARY KEY, id INTEGER UNIQUE, name TEXT, supercategory TEXT);
+CREATE TABLE images (position INTEGER PRIMARY KEY, id INTEGER UNIQUE, file_name TEXT, width INTEGER, height INTEGER);
+CREATE TABLE annotations (
+    id INTEGER, image_id INTEGER, category_id INTEGER,
+    x REAL, y REAL, w REAL, h REAL, area REAL, iscrowd INTEGER
+);
+"""
+# Created after the bulk insert, much faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX annotations_image ON annotations (image_id);
+CREATE INDEX annotations_category_area ON annotations (category_id, area);
+"""
+
+
+def _source_signature(coco_json_path: str) -> dict:
+    stat = os.stat(coco_json_path)
+    return {"version": str(INDEX_VERSION), "source_size": str(stat.st_size), "source_mtime_ns": str(stat.st_mtime_ns)}
+
+
+def _batched(iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def build_index(coco_json_path: str, index_path: str, batch_size: int = 50_000) -> None:
+    start = time.perf_counter()
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    coco_items = coco_items_reader(coco_json_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The index is rebuilt from scratch on failure, no need for a journal
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+
+        conn.executemany(
+            "INSERT INTO categories VALUES (?, ?, ?, ?)",
+            ((position, cat["id"], cat.get("name"), cat.get("supercategory"))
+             for position, cat in enumerate(coco_items("categories"))),
+        )
+        conn.executemany(
+            "INSERT INTO images VALUES (?, ?, ?, ?, ?)",
+            ((position, img["id"], img["file_name"], img["width"], img["height"])
+             for position, img in enumerate(coco_items("images"))),
+        )
+        for batch in _batched(coco_items("annotations"), batch_size):
+            conn.executemany(
+                "INSERT INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((ann.get("id"), ann["image_id"], ann["category_id"], *ann["bbox"],
+                  ann.get("area", ann["bbox"][2] * ann["bbox"][3]), ann.get("iscrowd", 0)) for ann in batch),
+            )
+        conn.executescript(INDEXES)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", _source_signature(coco_json_path).items())
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, index_path)
+    print(f"Built COCO index {index_path} in {time.perf_counter() - start:.2f}s")
+
+
+class CocoIndex:
+    """
+    Read-only view over the SQLite index of `coco_json_path` (default: "<json>.sqlite" next to it).
+    The index is (re)built automatically when missing or when the json changed.
+    """
+    def __init__(self, coco_json_path: str, index_path: Optional[str] = None, rebuild: bool = False) -> None:
+        self.coco_json_path = coco_json_path
+        self.index_path = index_path or coco_json_path + ".sqlite"
+        if rebuild or not self._is_current():
+            build_index(coco_json_path, self.index_path)
+        self.conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._num_images = self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def _is_current(self) -> bool:
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        return meta == _source_signature(self.coco_json_path)
+
+    def __enter__(self) -> "CocoIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self._num_images
+
+    def categories(self) -> List[dict]:
+        # In coco['categories'] order
+        return [dict(row) for row in self.conn.execute("SELECT id, name, supercategory FROM categories ORDER BY position")]
+
+    def image(self, position: int) -> dict:
+        """
+        Image entry at `position` in coco['images'] (0-based).
+        """
+        if position < 0 or position >= self._num_images:
+            raise IndexError(f"image_index={position} out of range (0..{self._num_images - 1})")
+        return dict(self.conn.execute("SELECT * FROM images WHERE position = ?", (position,)).fetchone())
+
+    def image_by_id(self, image_id: int) -> Optional[dict]:
+        row = self.conn.execute("SELECT * FROM images WHERE id = ?", (image_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def image_by_file_name(self, file_name: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT * FROM images WHERE file_name = ?", (file_name,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def annotations(self, image_id: int) -> List[dict]:
+        """
+        Annotations of one image as COCO dicts (bbox = [x_min, y_min, box_w, box_h]).
+        """
+        rows = self.conn.execute("SELECT * FROM annotations WHERE image_id = ? ORDER BY rowid", (image_id,))
+        return [
+            {
+                "id": row["id"],
+                "image_id": row["image_id"],
+                "category_id": row["category_id"],
+                "bbox": [row["x"], row["y"], row["w"], row["h"]],
+                "area": row["area"],
+                "iscrowd": row["iscrowd"],
+            }
+            for row in rows
+        ]
+
+    def boxes(self, image_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (N, 4) float32 xywh boxes and (N,) category ids of one image.
+        """
+        rows = self.conn.execute("SELECT x, y, w, h, category_id FROM annotations WHERE image_id = ? ORDER BY rowid", (image_id,)).fetchall()
+        table = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        return table[:, :4].astype(np.float32), table[:, 4].astype(np.int64)
+
+    @staticmethod
+    def _filters(category_id: Optional[int], min_area: Optional[float], max_area: Optional[float]) -> Tuple[str, list]:
+        clauses, params = [], []
+        if category_id is not None:
+            clauses.append("category_id = ?")
+            params.append(category_id)
+        if min_area is not None:
+            clauses.append("area >= ?")
+            params.append(min_area)
+        if max_area is not None:
+            clauses.append("area < ?")
+            params.append(max_area)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def images(self, category_id: Optional[int] = None, min_area: Optional[float] = None, max_area: Optional[float] = None) -> Iterator[dict]:
+        """
+        Iterate images in coco['images'] order. With filters: only images with at least one matching annotation.
+        """
+        where, params = self._filters(category_id, min_area, max_area)
+        if where:
+            query = f"SELECT * FROM images WHERE id IN (SELECT image_id FROM annotations{where}) ORDER BY position"
+        else:
+            query = "SELECT * FROM images ORDER BY position"
+        for row in self.conn.execute(query, params):
+            yield dict(row)
+
+    def iter_annotations(self, category_id: Optional[int] = None, min_area: Optional[float] = None,
+                         max_area: Optional[float] = None, batch_size: int = 10_000) -> Iterator[np.ndarray]:
+        """
+        Bulk iteration: yields (B, 8) float64 arrays of [image_id, category_id, x, y, w, h, area, iscrowd].
+        """
+        where, params = self._filters(category_id, min_area, max_area)
+        cursor = self.conn.execute(
+            f"SELECT image_id, category_id, x, y, w, h, area, iscrowd FROM annotations{where} ORDER BY rowid", params
+        )
+        while rows := cursor.fetchmany(batch_size):
+            yield np.array(rows, dtype=np.float64)
+
+    def count_annotations(self, category_id: Optional[int] = None, min_area: Optional[float] = None, max_area: Optional[float] = None) -> int:
+        where, params = self._filters(category_id, min_area, max_area)
+        return self.conn.execute(f"SELECT COUNT(*) FROM annotations{where}", params).fetchone()[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / inspect the SQLite index of a COCO json.")
+    parser.add_argument("coco_json", type=str)
+    parser.add_argument("--index", type=str, default=None, help="Index path (default: <coco_json>.sqlite)")
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    with CocoIndex(args.coco_json, args.index, args.rebuild) as index:
+        print(f"{len(index)} images, {index.count_annotations()} annotations")
+        for category in index.categories():
+            print(f"  {category['id']}: {category['name']} ({index.count_annotations(category['id'])} annotations)")
@@ -1,34 +1,32 @@
 import os
-import json
 from PIL import Image, ImageDraw
 import matplotlib.pyplot as plt
+from coco_index import CocoIndex
 
-def visualize_one_coco_image(coco_json_path, images_dir, image_index=0):
+def visualize_one_coco_image(coco_json_path, images_dir, image_index=0, index=None):
     """
-    Load the COCO-format JSON at coco_json_path, pick the image at position `image_index`
-    in coco['images'], load it from images_dir, draw all its annotations, and show it.
+    Pick the image at position `image_index` in coco['images'], load it from images_dir,
+    draw all its annotations, and show it. Annotations come from the SQLite index (coco_index.py),
+    the JSON is only parsed the first time (or after it changed).
 
     - coco_json_path: path to your valid.json
     - images_dir:      directory where the images live (filenames must match coco['images'][i]['file_name'])
     - image_index:     which entry in coco['images'] to visualize (0-based)
+    - index:           an open CocoIndex to reuse across calls
     """
-    # 1) Load the JSON
-    with open(coco_json_path, "r") as f:
-        coco = json.load(f)
-
-    all_images      = coco["images"]
-    all_annotations = coco["annotations"]
-    # Build a mapping: image_id -> list of annotation dicts
-    anns_by_image = {}
-    for ann in all_annotations:
-        img_id = ann["image_id"]
-        anns_by_image.setdefault(img_id, []).append(ann)
+    # 1) Open (or build) the index
+    own_index = index is None
+    if own_index:
+        index = CocoIndex(coco_json_path)
 
     # 2) Pick one image entry
-    if image_index < 0 or image_index >= len(all_images):
-        raise IndexError(f"image_index={image_index} out of range (0..{len(all_images)-1})")
+    try:
+        img_info = index.image(image_index)
+        anns = index.annotations(img_info["id"])
+    finally:
+        if own_index:
+            index.close()
 
-    img_info = all_images[image_index]
     img_id   = img_info["id"]
     fname    = img_info["file_name"]
     width    = img_info["width"]
@@ -44,7 +42,7 @@ def visualize_one_coco_image(coco_json_path, images_dir, image_index=0):
 
     # 4) Draw every bbox for this img_id
     #    In COCO, bbox = [x_min, y_min, box_w, box_h]
-    for ann in anns_by_image.get(img_id, []):
+    for ann in anns:
         x_min, y_min, box_w, box_h = ann["bbox"]
         x0, y0 = x_min, y_min
         x1 = x_min + box_w
@@ -1,101 +1,166 @@
+'''
+    Convert COCO json annotations to YOLO .txt labels (one file per image)
+    - The annotations array is streamed with ijson (requirements.txt), without it the json is loaded once with json.load
+    - Annotations are handled in fixed size chunks of numpy arrays: image lookup, category mapping and
+      normalization are single vectorized ops, so peak memory depends on the chunk size, not the annotation count
+    - Label files are created empty first, then each chunk's lines are appended per image on a thread pool
+
+    usage: python convert_coco_to_yolo.py --coco_json valid.json --output_dir valid/labels
+'''
 import os
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple
 
-def coco_to_yolo(coco_json_path: str, output_dir: str):
+import numpy as np
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def iter_coco_items(coco_json_path: str, key: str) -> Iterator[dict]:
+    """
+    Yields the entries of coco[key] ("images", "annotations", "categories").
+    """
+    if ijson is not None:
+        with open(coco_json_path, "rb") as f:
+            # use_float: plain floats instead of Decimal
+            yield from ijson.items(f, f"{key}.item", use_float=True)
+    else:
+        with open(coco_json_path, "r") as f:
+            coco = json.load(f)
+        yield from coco.get(key, [])
+
+
+def coco_items_reader(coco_json_path: str) -> Callable[[str], Iterator[dict]]:
+    """
+    items(key) over one COCO json for reading several keys. With ijson every key streams its own array,
+    without it the file is parsed on the first call and every key is served from that single load.
+    """
+    if ijson is not None:
+        return lambda key: iter_coco_items(coco_json_path, key)
+    coco = None
+
+    def items(key: str) -> Iterator[dict]:
+        nonlocal coco
+        if coco is None:
+            with open(coco_json_path, "r") as f:
+                coco = json.load(f)
+        return iter(coco.get(key, []))
+    return items
+
+
+def iter_annotation_chunks(annotations: Iterable[dict], chunk_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Groups annotations into (image_ids, category_ids, bboxes (N, 4)) arrays of at most chunk_size rows.
+    """
+    iterator = iter(annotations)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield (
+            np.fromiter((ann["image_id"] for ann in chunk), dtype=np.int64, count=len(chunk)),
+            np.fromiter((ann["category_id"] for ann in chunk), dtype=np.int64, count=len(chunk)),
+            np.array([ann["bbox"] for ann in chunk], dtype=np.float64).reshape(-1, 4),  # [x_min, y_min, box_width, box_height]
+        )
+
+
+def _lookup(sorted_keys: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Position of every key in sorted_keys and whether it was found.
+    """
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    positions = np.clip(np.searchsorted(sorted_keys, keys), 0, len(sorted_keys) - 1)
+    return positions, sorted_keys[positions] == keys
+
+
+def _append_lines(path: str, text: str) -> None:
+    with open(path, "a") as out_f:
+        out_f.write(text)
+
+
+def _create_empty(path: str) -> None:
+    open(path, "w").close()
+
+
+def _wait_all(futures: list) -> None:
+    # result() re-raises a failed write
+    for future in futures:
+        future.result()
+
+
+def coco_to_yolo(coco_json_path: str, output_dir: str, chunk_size: int = 100_000, workers: int = 16):
     """
     Given a COCO-format JSON file, create YOLO-format .txt files (one per image),
     using normalized bbox coordinates and zero-based class indices.
     """
+    coco_items = coco_items_reader(coco_json_path)
+
+    # 1) Map original COCO category_id -> YOLO class index (0,1,2,…), in the order they appear
+    category_ids = np.array([cat["id"] for cat in coco_items("categories")], dtype=np.int64)
+    category_order = np.argsort(category_ids, kind="stable")
+    sorted_category_ids = category_ids[category_order]
+
+    # 2) Image info as columns, sorted by image_id for vectorized lookups
+    image_ids: List[int] = []
+    sizes: List[Tuple[float, float]] = []
+    label_paths: List[str] = []
+    for img in coco_items("images"):
+        image_ids.append(img["id"])
+        sizes.append((img["width"], img["height"]))
+        base, _ext = os.path.splitext(img["file_name"])
+        label_paths.append(os.path.join(output_dir, f"{base}.txt"))
+    order = np.argsort(np.array(image_ids, dtype=np.int64), kind="stable")
+    sorted_image_ids = np.array(image_ids, dtype=np.int64)[order]
+    image_sizes = np.array(sizes, dtype=np.float64).reshape(-1, 2)[order]
+    label_paths = [label_paths[i] for i in order]
+    has_lines = np.zeros(len(label_paths), dtype=bool)
 
-    # 1) Load COCO JSON
-    with open(coco_json_path, 'r') as f:
-        coco = json.load(f)
-
-    # 2) Build a mapping from original COCO category_id -> YOLO class index (0,1,2,…)
-    #    We enumerate through coco['categories'] in the order they appear.
-    cat_id_to_yolo: dict = {}
-    for idx, cat in enumerate(coco.get("categories", [])):
-        original_id = cat["id"]
-        cat_id_to_yolo[original_id] = idx
-
-    # 3) Gather image info: image_id -> (file_name, width, height)
-    img_info: dict = {}
-    for img in coco.get("images", []):
-        img_id   = img["id"]
-        fname    = img["file_name"]
-        w, h     = img["width"], img["height"]
-        img_info[img_id] = {
-            "file_name": fname,
-            "width": w,
-            "height": h
-        }
-
-    # 4) Group annotations by image_id
-    ann_per_image: dict = {img_id: [] for img_id in img_info.keys()}
-    for ann in coco.get("annotations", []):
-        img_id     = ann["image_id"]
-        bbox       = ann["bbox"]        # [x_min, y_min, box_width, box_height]
-        cat_id     = ann["category_id"] # original COCO category ID
-        # Skip any annotation whose image_id is not in coco['images']
-        if img_id not in ann_per_image:
-            continue
-        ann_per_image[img_id].append({
-            "bbox": bbox,
-            "category_id": cat_id
-        })
-
-    # 5) Ensure output_dir exists
     os.makedirs(output_dir, exist_ok=True)
 
-    # 6) For each image, compute YOLO lines and write a .txt
-    for img_id, info in img_info.items():
-        fname    = info["file_name"]
-        width    = info["width"]
-        height   = info["height"]
-        anns     = ann_per_image.get(img_id, [])
-
-        # Build the text lines:
-        #   <yolo_class_id> <x_center_norm> <y_center_norm> <w_norm> <h_norm>
-        lines = []
-        for ann in anns:
-            x_min, y_min, box_w, box_h = ann["bbox"]
-            original_cat_id = ann["category_id"]
-
-            # Compute center in pixels:
-            x_center = x_min + (box_w / 2.0)
-            y_center = y_min + (box_h / 2.0)
-
-            # Normalize:
-            x_center_norm = x_center / width
-            y_center_norm = y_center / height
-            w_norm        = box_w    / width
-            h_norm        = box_h    / height
-
-            # Map to a zero-based YOLO class index:
-            yolo_cat = cat_id_to_yolo.get(original_cat_id, None)
-            if yolo_cat is None:
-                # If the annotation’s category_id wasn't in coco['categories'], skip it
-                continue
-
-            line = f"{yolo_cat} " \
-                   f"{x_center_norm:.6f} " \
-                   f"{y_center_norm:.6f} " \
-                   f"{w_norm:.6f} " \
-                   f"{h_norm:.6f}"
-            lines.append(line)
-
-        # Write the .txt file (same basename as image, but .txt)
-        base, _ext = os.path.splitext(fname)
-        txt_fname = f"{base}.txt"
-        txt_path  = os.path.join(output_dir, txt_fname)
-
-        with open(txt_path, "w") as out_f:
-            if lines:
-                out_f.write("\n".join(lines))
-            else:
-                # Create an empty file if there are no annotations
-                out_f.write("")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 3) Create every label file empty first: images without annotations still get one, and chunks only append
+        _wait_all([executor.submit(_create_empty, path) for path in label_paths])
+
+        pending: list = []
+        for chunk_image_ids, chunk_category_ids, bboxes in iter_annotation_chunks(coco_items("annotations"), chunk_size):
+            # 4) Skip annotations whose image_id isn't in coco['images'] or whose category_id isn't in coco['categories']
+            image_rows, image_found = _lookup(sorted_image_ids, chunk_image_ids)
+            category_rows, category_found = _lookup(sorted_category_ids, chunk_category_ids)
+            keep = image_found & category_found
+            image_rows = image_rows[keep]
+            yolo_classes = category_order[category_rows[keep]]
+            bboxes = bboxes[keep]
+
+            # 5) Center + normalize the whole chunk at once
+            width_height = image_sizes[image_rows]
+            normalized = np.concatenate([bboxes[:, :2] + bboxes[:, 2:] / 2.0, bboxes[:, 2:]], axis=1) / np.tile(width_height, 2)
+
+            # 6) Group rows per image (stable: annotation order is kept inside a file)
+            group_order = np.argsort(image_rows, kind="stable")
+            image_rows = image_rows[group_order]
+            starts = np.flatnonzero(np.r_[True, image_rows[1:] != image_rows[:-1]]) if len(image_rows) else np.empty(0, dtype=np.int64)
+            lines = [
+                "%d %.6f %.6f %.6f %.6f" % (cls, x, y, w, h)
+                for cls, (x, y, w, h) in zip(yolo_classes[group_order].tolist(), normalized[group_order].tolist())
+            ]
+
+            # Previous chunk's appends must be done before touching the same files again
+            _wait_all(pending)
+            pending = []
+            for start, end in zip(starts.tolist(), np.r_[starts[1:], len(lines)].tolist()):
+                row = image_rows[start]
+                # Lines are "\n"-separated without a trailing newline, same as a single write
+                text = ("\n" if has_lines[row] else "") + "\n".join(lines[start:end])
+                has_lines[row] = True
+                pending.append(executor.submit(_append_lines, label_paths[row], text))
+        _wait_all(pending)
 
     print(f"Converted COCO annotations → YOLO .txt files in: {output_dir}")
 
@@ -105,18 +170,30 @@ if __name__ == "__main__":
         description="Convert COCO-format JSON annotations into YOLO-format .txt labels (one file per image)."
     )
     parser.add_argument(
-        "--coco_json", 
-        type=str, 
+        "--coco_json",
+        type=str,
         required=True,
         help="Path to the COCO-format JSON (e.g. `instances_train2017.json`)."
     )
     parser.add_argument(
-        "--output_dir", 
-        type=str, 
+        "--output_dir",
+        type=str,
         required=True,
         help="Directory where the YOLO-format .txt files will be written. "
              "One .txt per image with same basename as the image."
     )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=100_000,
+        help="Annotations converted per batch (bounds peak memory)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Threads writing label files."
+    )
 
     args = parser.parse_args()
-    coco_to_yolo(args.coco_json, args.output_dir)
+    coco_to_yolo(args.coco_json, args.output_dir, args.chunk_size, args.workers)
@@ -1,128 +1,236 @@
-import os
+'''
+    Convert YOLO txt labels (train / valid / test) to one COCO json per split
+    - Image sizes are read from the file header (JPEG / PNG / WebP / GIF / BMP), PIL is only a fallback
+    - Label files are parsed in bulk with numpy, boxes are converted / clipped as arrays
+    - Files of every split are processed in chunks on one process pool
+    - The json is streamed to disk with compact separators: images go straight to the output file,
+      annotations to a temp file that is appended at the end, so memory stays flat for any dataset size
+
+    usage: python convert_yolo_to_coco.py [--workers 8] [--chunk-size 256]
+'''
+import argparse
 import json
+import os
+import shutil
+import struct
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
-def yolo_to_coco_per_split(split_name, image_dir, label_dir, output_dir):
+# 1‐category: bird → category_id = class_id + 1
+CATEGORIES = [
+    {
+        "id": 0,
+        "name": "non-bird",
+        "supercategory": "none"
+    },
+    {
+        "id": 1,
+        "name": "bird",
+        "supercategory": "none"
+    }
+]
+
+# JPEG start-of-frame markers (DHT 0xC4, JPG 0xC8 and DAC 0xCC share the range but aren't frames)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        # Skip fill bytes up to the next marker
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # markers without a length field
+        if marker == 0xD9:
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) != 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
     """
-    Convert one split (e.g. 'train', 'valid', or 'test') from YOLO txt labels
-    into a COCO-format JSON file. Saves to `{output_dir}/{split_name}.json`.
+    (width, height) from the image header without decoding pixels. Falls back to PIL for other formats, None if unreadable.
     """
-    # 1‐category: person → give it category_id = 1
-    categories = [
-        {
-            "id": 0,
-            "name": "non-bird",
-            "supercategory": "none"
-        },
-        {
-            "id": 1,
-            "name": "bird",
-            "supercategory": "none"
-        }
-    ]
-
-    # Build the COCO dict for “split_name”
-    coco_dict = {
-        "info": {
-            "description": f"{split_name} split converted from YOLO",
-            "version": "1.0",
-            "year": 2025
-        },
-        "licenses": [],
-        "images": [],
-        "annotations": [],
-        "categories": categories
-    }
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+            size = None
+            if head[:2] == b"\xff\xd8":
+                size = _jpeg_size(f)
+            elif head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+                size = struct.unpack(">II", head[16:24])
+            elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                chunk = head[12:16]
+                if chunk == b"VP8 ":
+                    w, h = struct.unpack("<HH", head[26:30])
+                    size = (w & 0x3FFF, h & 0x3FFF)
+                elif chunk == b"VP8L":
+                    bits = int.from_bytes(head[21:25], "little")
+                    size = ((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+                elif chunk == b"VP8X":
+                    size = (int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1)
+            elif head[:4] == b"GIF8":
+                size = struct.unpack("<HH", head[6:10])
+            elif head[:2] == b"BM":
+                w, h = struct.unpack("<ii", head[18:26])
+                size = (w, abs(h))
+            if size is not None and size[0] > 0 and size[1] > 0:
+                return int(size[0]), int(size[1])
+    except (OSError, struct.error):
+        pass
 
-    image_files = sorted(os.listdir(image_dir))
-    ann_id = 1
-    # Loop over images
-    with tqdm(total=len(image_files), desc=f"Processing {split_name}") as pbar:
-        for img_idx, img_fname in enumerate(image_files, start=1):
-            image_path = os.path.join(image_dir, img_fname)
-            try:
-                im = Image.open(image_path)
-            except Exception as e:
-                print(f"Warning: Could not open {image_path}: {e}")
-                pbar.update(1)
-                continue
+    try:
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+def parse_label_file(label_path: str) -> np.ndarray:
+    """
+    Returns a (N, 5) float array of "class_id x_center y_center width height" rows. Rows without exactly 5 values are skipped.
+    """
+    try:
+        with open(label_path, "r") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return np.empty((0, 5))
+
+    # String -> float conversion happens in one numpy call for the whole file
+    rows = [parts for parts in (line.split() for line in text.splitlines()) if len(parts) == 5]
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def yolo_to_coco_boxes(labels: np.ndarray, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Normalized YOLO rows -> (COCO [x, y, w, h] pixel boxes clipped to the image, category ids).
+    """
+    bbox_w = labels[:, 3] * width
+    bbox_h = labels[:, 4] * height
+    # Make sure we don’t go negative / past the image border
+    bbox_x = np.maximum(labels[:, 1] * width - bbox_w / 2, 0.0)
+    bbox_y = np.maximum(labels[:, 2] * height - bbox_h / 2, 0.0)
+    bbox_w = np.where(bbox_x + bbox_w > width, width - bbox_x, bbox_w)
+    bbox_h = np.where(bbox_y + bbox_h > height, height - bbox_y, bbox_h)
+    return np.stack([bbox_x, bbox_y, bbox_w, bbox_h], axis=1), labels[:, 0].astype(np.int64) + 1
+
+
+def convert_chunk(image_dir: str, label_dir: str, image_files: List[str], first_id: int) -> Tuple[list, list]:
+    """
+    Worker: convert a slice of one split. Image ids are the position in the sorted file list (starting at 1).
+    Returns (images, annotations without id), annotation ids are assigned in order by the writer.
+    """
+    images = []
+    annotations = []
+    for img_idx, img_fname in enumerate(image_files, start=first_id):
+        image_path = os.path.join(image_dir, img_fname)
+        size = read_image_size(image_path)
+        if size is None:
+            print(f"Warning: Could not open {image_path}")
+            continue
 
-            width, height = im.size
-            # 1) Add one entry to "images"
-            coco_dict["images"].append({
-                "id": img_idx,
-                "file_name": img_fname,
-                "width": width,
-                "height": height
+        width, height = size
+        images.append({"id": img_idx, "file_name": img_fname, "width": width, "height": height})
+
+        labels = parse_label_file(os.path.join(label_dir, os.path.splitext(img_fname)[0] + ".txt"))
+        if not len(labels):
+            continue
+        boxes, category_ids = yolo_to_coco_boxes(labels, width, height)
+        areas = boxes[:, 2] * boxes[:, 3]
+        for bbox, category_id, area in zip(boxes.tolist(), category_ids.tolist(), areas.tolist()):
+            annotations.append({
+                "image_id": img_idx,
+                "category_id": category_id,
+                "bbox": bbox,
+                "area": area,
+                "iscrowd": 0
             })
+    return images, annotations
 
-            # 2) Read corresponding YOLO‐txt file
-            label_fname = os.path.splitext(img_fname)[0] + ".txt"
-            label_path = os.path.join(label_dir, label_fname)
-            if not os.path.exists(label_path):
-                # If there's no .txt file, skip (or create an empty annotation set)
-                pbar.update(1)
-                continue
 
-            with open(label_path, "r") as f:
-                lines = f.read().strip().splitlines()
-
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) != 5:
-                    # YOLO format is "class_id x_center y_center width height" (all floats)
-                    # If it isn’t length 5, skip
-                    continue
-
-                class_id, x_c, y_c, w_norm, h_norm = parts
-                class_id = int(class_id)       # e.g. 0 for "person"
-                x_c = float(x_c)
-                y_c = float(y_c)
-                w_norm = float(w_norm)
-                h_norm = float(h_norm)
-
-                # Convert normalized YOLO → absolute pixel bbox
-                #   YOLO's (x_c, y_c) are relative to image size (0..1), and w_norm/h_norm are also relative.
-                bbox_w = w_norm * width
-                bbox_h = h_norm * height
-                bbox_x = (x_c * width) - bbox_w / 2
-                bbox_y = (y_c * height) - bbox_h / 2
-
-                # Make sure we don’t go negative
-                if bbox_x < 0:
-                    bbox_x = 0.0
-                if bbox_y < 0:
-                    bbox_y = 0.0
-                if bbox_x + bbox_w > width:
-                    bbox_w = width - bbox_x
-                if bbox_y + bbox_h > height:
-                    bbox_h = height - bbox_y
-
-                area = bbox_w * bbox_h
-
-                coco_dict["annotations"].append({
-                    "id": ann_id,
-                    "image_id": img_idx,
-                    "category_id": class_id + 1,  # assuming class_id=0 → category_id=1
-                    "bbox": [bbox_x, bbox_y, bbox_w, bbox_h],
-                    "area": area,
-                    "iscrowd": 0
-                })
-                ann_id += 1
-
-            pbar.update(1)
-
-    # 3) Write out the JSON
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def yolo_to_coco_per_split(split_name, image_dir, label_dir, output_dir, executor: Optional[Executor] = None, chunk_size=256):
+    """
+    Convert one split (e.g. 'train', 'valid', or 'test') from YOLO txt labels
+    into a COCO-format JSON file. Saves to `{output_dir}/{split_name}.json`.
+    Returns (number of images, number of annotations).
+    """
+    owns_executor = executor is None
+    executor = executor or ProcessPoolExecutor()
+
+    image_files = sorted(os.listdir(image_dir))
+    chunks = [image_files[i:i + chunk_size] for i in range(0, len(image_files), chunk_size)]
+    futures = [executor.submit(convert_chunk, image_dir, label_dir, chunk, 1 + i * chunk_size) for i, chunk in enumerate(chunks)]
+
+    info = {
+        "description": f"{split_name} split converted from YOLO",
+        "version": "1.0",
+        "year": 2025
+    }
     out_path = os.path.join(output_dir, f"{split_name}.json")
-    with open(out_path, "w") as f:
-        json.dump(coco_dict, f, indent=2)
+    tmp_path = out_path + ".tmp"
+    num_images = 0
+    ann_id = 1
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out, tempfile.TemporaryFile("w+", encoding="utf-8", dir=output_dir) as ann_file:
+            out.write(f'{{"info":{_dumps(info)},"licenses":[],"categories":{_dumps(CATEGORIES)},"images":[')
+            with tqdm(total=len(image_files), desc=f"Processing {split_name}") as pbar:
+                # Results are consumed in submission order, so ids and output order stay deterministic
+                for future, chunk in zip(futures, chunks):
+                    images, annotations = future.result()
+                    for image in images:
+                        out.write(("," if num_images else "") + _dumps(image))
+                        num_images += 1
+                    for annotation in annotations:
+                        ann_file.write(("," if ann_id > 1 else "") + _dumps({"id": ann_id, **annotation}))
+                        ann_id += 1
+                    pbar.update(len(chunk))
+
+            out.write('],"annotations":[')
+            ann_file.seek(0)
+            shutil.copyfileobj(ann_file, out)
+            out.write("]}")
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if owns_executor:
+            executor.shutdown()
 
-    return coco_dict
+    return num_images, ann_id - 1
 
 
 if __name__ == "__main__":
-    base = os.path.dirname(__file__)  # wherever convert_yolo_to_coco.py lives
+    parser = argparse.ArgumentParser(description="Convert YOLO labels to COCO json.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Images per worker task")
+    args = parser.parse_args()
+
+    base = os.path.dirname(os.path.abspath(__file__))  # wherever convert_yolo_to_coco.py lives
 
     splits = {
         "train": {
@@ -142,12 +250,13 @@ if __name__ == "__main__":
     output_dir = os.path.join(base, "coco_annotations")
     os.makedirs(output_dir, exist_ok=True)
 
-    for split_name, paths in splits.items():
-        img_dir = paths["images"]
-        lbl_dir = paths["labels"]
-        if not os.path.isdir(img_dir) or not os.path.isdir(lbl_dir):
-            print(f"[Warning] Skipping '{split_name}' because {img_dir} or {lbl_dir} doesn’t exist.")
-            continue
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for split_name, paths in splits.items():
+            img_dir = paths["images"]
+            lbl_dir = paths["labels"]
+            if not os.path.isdir(img_dir) or not os.path.isdir(lbl_dir):
+                print(f"[Warning] Skipping '{split_name}' because {img_dir} or {lbl_dir} doesn’t exist.")
+                continue
 
-        yolo_to_coco_per_split(split_name, img_dir, lbl_dir, output_dir)
-        print(f"→ Saved {split_name}.json to {output_dir}")
+            num_images, num_annotations = yolo_to_coco_per_split(split_name, img_dir, lbl_dir, output_dir, executor, args.chunk_size)
+            print(f"→ Saved {split_name}.json to {output_dir} ({num_images} images, {num_annotations} annotations)")
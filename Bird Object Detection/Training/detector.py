@@ -0,0 +1,387 @@
+'''
+    One detector API over the ONNX Runtime and TFLite exports of the bird YOLO model
+    - Backends load a model and read what they need from the model itself: input layout (NHWC / NCHW), input size,
+      static or dynamic batch, input dtype and quantization (uint8 TFLite), class names and image size metadata
+    - Detector: preprocess (plain resize or letterbox) -> backend -> decode / NMS (postprocess.py) -> pixel xyxy boxes.
+      detect(batch) returns boxes in model input pixels for every export (TFLite boxes come out normalized to 0-1),
+      __call__(images) returns them in original image pixels
+    - benchmark / select_model time every candidate export on this host and remember the fastest one per host
+
+    usage: python detector.py --benchmark bestfp32_nhwc.onnx best_saved_model/best_float16.tflite [--batch-size 1]
+           python infer.py <inputs ...> --model bestfp32_nhwc.onnx best_saved_model/best_float16.tflite  (fastest is used)
+'''
+import argparse
+import ast
+import json
+import os
+import platform
+import time
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import onnxruntime
+
+from postprocess import postprocess_output
+
+BENCHMARK_CACHE = "./detector_benchmark.json"
+ONNX_INPUT_TYPES = {"tensor(float)": np.float32, "tensor(float16)": np.float16, "tensor(uint8)": np.uint8}
+
+# (scale_x, scale_y, pad_x, pad_y): model input pixel = image pixel * scale + pad
+Transform = Tuple[float, float, float, float]
+
+
+def create_session(model_path: str, providers: Optional[List[str]] = None, num_threads: Optional[int] = None) -> onnxruntime.InferenceSession:
+    # Load cuda and cudnn dlls. If not installed, import torch with CUDA support before import onnxruntime
+    sess_options = onnxruntime.SessionOptions()
+    if num_threads:
+        sess_options.intra_op_num_threads = num_threads
+    sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.log_severity_level = 3
+    return onnxruntime.InferenceSession(model_path, sess_options, providers=providers or ['CPUExecutionProvider']) #TensorrtExecutionProvider
+
+
+def input_layout(session: onnxruntime.InferenceSession) -> Tuple[str, Tuple[int, int], Optional[int]]:
+    """
+    Returns (layout "NHWC" / "NCHW", (height, width), fixed batch size or None if the batch axis is dynamic), read from the input shape.
+    """
+    return layout_from_shape(session.get_inputs()[0].shape)
+
+
+def layout_from_shape(shape, default_size: Tuple[int, int] = (640, 640)) -> Tuple[str, Tuple[int, int], Optional[int]]:
+    # Dynamic axes are strings (ONNX) / None / -1 (TFLite signature)
+    def static(value):
+        return int(value) if isinstance(value, (int, np.integer)) and value > 0 else None
+
+    batch = static(shape[0])
+    if static(shape[1]) == 3:
+        layout, height, width = "NCHW", shape[2], shape[3]
+    else:
+        layout, height, width = "NHWC", shape[1], shape[2]
+    # Dynamic spatial axes: fall back to the training size
+    return layout, (static(height) or default_size[0], static(width) or default_size[1]), batch
+
+
+def preprocess(image, input_size=(640, 640), layout="NHWC"):
+    """
+    Preprocess the image: convert BGR to RGB, resize, normalize, and reformat dimensions.
+    Returns one (H, W, C) or (C, H, W) float32 tensor without the batch dimension.
+    """
+    # Convert to RGB
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    # Resize to model input size (cv2 takes (width, height))
+    resized = cv2.resize(image_rgb, (input_size[1], input_size[0]))
+    # Normalize (0-255 -> 0-1)
+    normalized = resized.astype(np.float32) / 255.0
+    if layout == "NCHW":
+        # Change shape from (H, W, C) to (C, H, W)
+        normalized = np.ascontiguousarray(np.transpose(normalized, (2, 0, 1)))
+    return normalized
+
+
+def letterbox(image: np.ndarray, input_size=(640, 640), fill_value: int = 114) -> Tuple[np.ndarray, Transform]:
+    """
+    Resize keeping the aspect ratio and pad to input_size, centered like Ultralytics LetterBox(auto=False).
+    Returns the padded BGR image and its transform.
+    """
+    ih, iw = image.shape[:2]
+    h, w = input_size
+    scale = min(h / ih, w / iw)
+    nw, nh = int(round(iw * scale)), int(round(ih * scale))
+    pad_x, pad_y = (w - nw) / 2, (h - nh) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    if (nw, nh) != (iw, ih):
+        image = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(fill_value,) * 3)
+    return padded, (scale, scale, float(left), float(top))
+
+
+def quantize(batch: np.ndarray, dtype, quantization: Optional[Tuple[float, int]]) -> np.ndarray:
+    """
+    float32 0-1 batch -> model input dtype. Integer inputs use q = x / scale + zero_point (TFLite convention).
+    """
+    if not np.issubdtype(dtype, np.integer):
+        return batch.astype(dtype, copy=False)
+    scale, zero_point = quantization or (1 / 255.0, 0)
+    limits = np.iinfo(dtype)
+    return np.clip(np.rint(batch / scale + zero_point), limits.min, limits.max).astype(dtype)
+
+
+def parse_metadata(metadata: Dict[str, str]) -> Dict:
+    # Ultralytics stores python reprs ("{0: 'bird'}", "[640, 640]") in ONNX metadata and JSON in TFLite
+    parsed = {}
+    for key, value in metadata.items():
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                try:
+                    value = ast.literal_eval(value)
+                except (ValueError, SyntaxError):
+                    pass
+        parsed[key] = value
+    if isinstance(parsed.get("names"), dict):
+        parsed["names"] = {int(k): v for k, v in parsed["names"].items()}
+    return parsed
+
+
+def read_tflite_metadata(model_path: str) -> Dict:
+    """
+    Ultralytics appends a zip holding metadata.json (or metadata.txt) to its .tflite files.
+    """
+    try:
+        with zipfile.ZipFile(model_path) as archive:
+            for name in archive.namelist():
+                if name.startswith("metadata"):
+                    return parse_metadata(json.loads(archive.read(name).decode("utf-8")))
+    except (zipfile.BadZipFile, ValueError, OSError):
+        pass
+    return {}
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+class OnnxBackend:
+    """
+    ONNX Runtime. Boxes come out in model input pixels.
+    """
+    name = "onnx"
+    normalized = False
+
+    def __init__(self, model_path: str, providers: Optional[List[str]] = None, num_threads: Optional[int] = None) -> None:
+        self.session = create_session(model_path, providers, num_threads)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        self.metadata = parse_metadata(self.session.get_modelmeta().custom_metadata_map)
+        imgsz = self.metadata.get("imgsz") or 640
+        imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+        self.layout, self.input_size, self.fixed_batch = layout_from_shape(model_input.shape, imgsz)
+        self.input_dtype = ONNX_INPUT_TYPES.get(model_input.type, np.float32)
+        # A uint8 ONNX input takes raw pixels
+        self.input_quantization = (1 / 255.0, 0) if self.input_dtype == np.uint8 else None
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        batch = quantize(batch, self.input_dtype, self.input_quantization)
+        return self.session.run([self.output_name], {self.input_name: batch})[0].astype(np.float32, copy=False)
+
+
+def tflite_interpreter():
+    # tflite_runtime is the small install for edge devices, full TensorFlow works too
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteBackend:
+    """
+    TFLite Interpreter. Ultralytics TFLite exports normalize boxes by the input size, detect() scales them back.
+    """
+    name = "tflite"
+    normalized = True
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None) -> None:
+        self.interpreter = tflite_interpreter()(model_path=model_path, num_threads=num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.metadata = read_tflite_metadata(model_path)
+        signature = self.input_details.get("shape_signature", self.input_details["shape"])
+        self.layout, self.input_size, self.fixed_batch = layout_from_shape(list(signature))
+        self.input_dtype = self.input_details["dtype"]
+        scale, zero_point = self.input_details["quantization"]
+        self.input_quantization = (scale, zero_point) if scale else None
+        self._batch = int(self.input_details["shape"][0])
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        if len(batch) != self._batch:
+            # Dynamic batch signature: reshape the interpreter to this batch
+            self.interpreter.resize_tensor_input(self.input_details["index"], [len(batch), *batch.shape[1:]])
+            self.interpreter.allocate_tensors()
+            self._batch = len(batch)
+        self.interpreter.set_tensor(self.input_details["index"], quantize(batch, self.input_dtype, self.input_quantization))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_details["index"])
+        scale, zero_point = self.output_details["quantization"]
+        if np.issubdtype(output.dtype, np.integer) and scale:
+            return (output.astype(np.float32) - zero_point) * scale
+        return output.astype(np.float32, copy=False)
+
+
+def load_backend(model_path: str, backend: Optional[str] = None, providers: Optional[List[str]] = None,
+                 num_threads: Optional[int] = None):
+    """
+    backend: "onnx", "tflite" or None to pick from the file extension.
+    """
+    backend = backend or ("tflite" if model_path.lower().endswith(".tflite") else "onnx")
+    if backend == "onnx":
+        return OnnxBackend(model_path, providers, num_threads)
+    if backend == "tflite":
+        return TFLiteBackend(model_path, num_threads)
+    raise ValueError(f"Unknown backend {backend}, expected 'onnx' or 'tflite'")
+
+
+# ── Detector ──────────────────────────────────────────────────────────────────
+class Detector:
+    """
+    detect(batch): preprocessed float32 0-1 batch -> list of (N, 6) [x1, y1, x2, y2, score, class_id] in model input pixels.
+    Batches are split / padded to the model's fixed batch size when its batch axis is static.
+    Not thread safe (TFLite interpreters aren't), call it from one thread.
+    """
+    def __init__(
+        self,
+        model_path: str,
+        backend: Optional[str] = None,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.7,
+        letterbox: bool = False,
+        providers: Optional[List[str]] = None,
+        num_threads: Optional[int] = None,
+    ) -> None:
+        self.model_path = model_path
+        self.backend = load_backend(model_path, backend, providers, num_threads)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.letterbox = letterbox
+        self.layout = self.backend.layout
+        self.input_size = self.backend.input_size
+        self.fixed_batch = self.backend.fixed_batch
+        self.names = self.backend.metadata.get("names")
+
+    def __repr__(self) -> str:
+        return (f"Detector({self.backend.name}, {os.path.basename(self.model_path)}, {self.layout} {self.input_size}, "
+                f"batch {self.fixed_batch or 'dynamic'}, input {np.dtype(self.backend.input_dtype).name})")
+
+    def preprocess(self, image: np.ndarray) -> Tuple[np.ndarray, Transform]:
+        """
+        BGR image -> (tensor without batch dim, transform from image pixels to model input pixels).
+        """
+        if self.letterbox:
+            image, transform = letterbox(image, self.input_size)
+        else:
+            h, w = image.shape[:2]
+            transform = (self.input_size[1] / w, self.input_size[0] / h, 0.0, 0.0)
+        return preprocess(image, self.input_size, self.layout), transform
+
+    def detect(self, batch: np.ndarray, conf_threshold: Optional[float] = None) -> List[np.ndarray]:
+        conf_threshold = self.conf_threshold if conf_threshold is None else conf_threshold
+        step = self.fixed_batch or len(batch)
+        detections = []
+        for start in range(0, len(batch), step):
+            chunk = batch[start:start + step]
+            if self.fixed_batch is not None and len(chunk) < self.fixed_batch:
+                # Static batch axis: pad the last batch
+                chunk = np.concatenate([chunk, np.zeros((self.fixed_batch - len(chunk),) + chunk.shape[1:], chunk.dtype)])
+            output = self.backend.run(chunk)
+            for det in postprocess_output(output, conf_threshold, self.iou_threshold)[:min(step, len(batch) - start)]:
+                if self.backend.normalized:
+                    det[:, [0, 2]] *= self.input_size[1]
+                    det[:, [1, 3]] *= self.input_size[0]
+                detections.append(det)
+        return detections
+
+    @staticmethod
+    def scale(detections: np.ndarray, transform: Transform, orig_size: Tuple[int, int]) -> np.ndarray:
+        """
+        Model input pixels -> original (height, width) image pixels, clamped to the image.
+        """
+        scale_x, scale_y, pad_x, pad_y = transform
+        detections = detections.copy()
+        detections[:, [0, 2]] = np.clip((detections[:, [0, 2]] - pad_x) / scale_x, 0, orig_size[1] - 1)
+        detections[:, [1, 3]] = np.clip((detections[:, [1, 3]] - pad_y) / scale_y, 0, orig_size[0] - 1)
+        return detections
+
+    def __call__(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        BGR images -> list of (N, 6) detections in image pixels.
+        """
+        tensors, transforms = zip(*(self.preprocess(image) for image in images))
+        return [self.scale(det, transform, image.shape[:2])
+                for det, transform, image in zip(self.detect(np.stack(tensors)), transforms, images)]
+
+
+# ── Per-host backend selection ────────────────────────────────────────────────
+def benchmark(detector: Detector, batch_size: int = 1, warmup: int = 3, runs: int = 20) -> Dict[str, float]:
+    """
+    Times detect() (inference + decode) on random input, returns latency in ms per batch and images / second.
+    """
+    h, w = detector.input_size
+    shape = (batch_size, h, w, 3) if detector.layout == "NHWC" else (batch_size, 3, h, w)
+    batch = np.random.default_rng(0).random(shape, dtype=np.float32)
+    for _ in range(warmup):
+        detector.detect(batch)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        detector.detect(batch)
+        times.append(time.perf_counter() - start)
+    times_ms = np.array(times) * 1000
+    return {
+        "mean_ms": float(times_ms.mean()),
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "images_per_second": float(batch_size * 1000 / times_ms.mean()),
+    }
+
+
+def host_key() -> str:
+    return f"{platform.node()}|{platform.machine()}|{platform.processor() or platform.system()}|{os.cpu_count()} cpus"
+
+
+def select_model(
+    model_paths: List[str],
+    batch_size: int = 1,
+    cache_path: Optional[str] = BENCHMARK_CACHE,
+    refresh: bool = False,
+    providers: Optional[List[str]] = None,
+    num_threads: Optional[int] = None,
+) -> Tuple[str, Dict[str, Dict[str, float]]]:
+    """
+    Benchmarks every candidate export on this host and returns (fastest model path, results per path).
+    Results are cached per host / model file (size + mtime) / batch size, so only new or changed models are timed.
+    Models that fail to load (e.g. no TFLite runtime installed) are skipped.
+    """
+    cache: Dict = {}
+    if cache_path and os.path.isfile(cache_path) and not refresh:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    host_results = cache.setdefault(host_key(), {})
+
+    results = {}
+    for path in model_paths:
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|batch {batch_size}"
+        if key not in host_results:
+            try:
+                host_results[key] = benchmark(Detector(path, providers=providers, num_threads=num_threads), batch_size)
+            except (ImportError, RuntimeError, ValueError) as e:
+                print(f"[Warning] Skipping {path}: {e}")
+                continue
+        results[path] = host_results[key]
+    if not results:
+        raise RuntimeError("None of the candidate models could be loaded")
+
+    if cache_path:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+    fastest = max(results, key=lambda path: results[path]["images_per_second"])
+    return fastest, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark detector exports on this host and report the fastest.")
+    parser.add_argument("--benchmark", type=str, nargs="+", required=True, help="Candidate .onnx / .tflite models")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads (default: all cores)")
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    parser.add_argument("--cache", type=str, default=BENCHMARK_CACHE)
+    parser.add_argument("--refresh", action="store_true", help="Re-time models already in the cache")
+    args = parser.parse_args()
+
+    fastest, results = select_model(args.benchmark, args.batch_size, args.cache, args.refresh, args.providers, args.threads)
+    for path, result in sorted(results.items(), key=lambda item: -item[1]["images_per_second"]):
+        print(f"{path}: {result['mean_ms']:.1f} ms / batch (p95 {result['p95_ms']:.1f}), {result['images_per_second']:.1f} img/s")
+    print(f"Fastest on {host_key()}: {fastest}")
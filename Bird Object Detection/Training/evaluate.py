@@ -0,0 +1,322 @@
+'''
+    Accuracy + speed evaluation of the exported detectors on the COCO validation split
+    - Every --models export (FP32 / FP16 ONNX, FP16 TFLite, ...) runs through detector.Detector over coco_annotations/valid.json:
+      images are decoded / preprocessed on a thread pool, the model runs on batches of --batch-size
+    - COCO bbox metrics in numpy with the pycocotools COCOeval protocol: IoU 0.50:0.95, 101 recall points, 100 detections
+      per image, small / medium / large areas, crowd boxes ignored. The IoU matching is vectorized over all 10 thresholds
+    - mAP is reported next to single image latency (p50 / p95) and batched throughput for each export, --report writes JSON
+
+    usage: python evaluate.py --models bestfp32_nhwc.onnx bestfp16_nhwc.onnx best_saved_model/best_float16.tflite
+                              [--coco ./coco_annotations/valid.json] [--images ./valid/images] [--batch-size 8] [--report eval.json]
+'''
+import argparse
+import json
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from coco_index import CocoIndex
+from detector import Detector, benchmark
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+AREA_RANGES = {"all": (0.0, 1e10), "small": (0.0, 32.0 ** 2), "medium": (32.0 ** 2, 96.0 ** 2), "large": (96.0 ** 2, 1e10)}
+MAX_DETECTIONS = 100
+
+
+# ── COCO bbox metrics ─────────────────────────────────────────────────────────
+def box_iou_xywh(detections: np.ndarray, ground_truth: np.ndarray, iscrowd: np.ndarray) -> np.ndarray:
+    """
+    (D, 4) x (G, 4) xywh -> (D, G) IoU. For crowd boxes the union is the detection area (pycocotools convention).
+    """
+    top_left = np.maximum(detections[:, None, :2], ground_truth[None, :, :2])
+    bottom_right = np.minimum(detections[:, None, :2] + detections[:, None, 2:], ground_truth[None, :, :2] + ground_truth[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    det_area = np.prod(detections[:, 2:], axis=1)[:, None]
+    union = np.where(iscrowd[None, :], det_area, det_area + np.prod(ground_truth[:, 2:], axis=1)[None, :] - intersection)
+    return intersection / np.maximum(union, 1e-12)
+
+
+def match_image(ious: np.ndarray, gt_ignore: np.ndarray, gt_crowd: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Greedy COCO matching of one image / category for all IoU thresholds at once.
+    ious: (D, G) with detections sorted by decreasing score and ground truth sorted non-ignored first.
+    Returns (matched (T, D), matched_to_ignored (T, D)) booleans.
+    """
+    num_thresholds, (num_dets, num_gts) = len(IOU_THRESHOLDS), ious.shape
+    matched = np.zeros((num_thresholds, num_dets), dtype=bool)
+    matched_ignored = np.zeros((num_thresholds, num_dets), dtype=bool)
+    if not num_gts:
+        return matched, matched_ignored
+    gt_taken = np.zeros((num_thresholds, num_gts), dtype=bool)
+    thresholds = np.minimum(IOU_THRESHOLDS, 1 - 1e-10)[:, None]
+
+    for d in range(num_dets):
+        # (T, G): ground truth still free (crowd boxes can match many detections) and overlapping enough
+        candidates = (~gt_taken | gt_crowd[None, :]) & (ious[d][None, :] >= thresholds)
+        # Like COCOeval: a regular ground truth always wins over an ignored one, then the highest IoU (last one on ties)
+        regular = candidates & ~gt_ignore[None, :]
+        pool = np.where(regular.any(axis=1, keepdims=True), regular, candidates)
+        scores = np.where(pool, ious[d][None, :], -1.0)
+        best = num_gts - 1 - np.argmax(scores[:, ::-1], axis=1)
+        found = pool.any(axis=1)
+        rows = np.flatnonzero(found)
+        gt_taken[rows, best[rows]] = True
+        matched[:, d] = found
+        matched_ignored[:, d] = found & gt_ignore[best]
+    return matched, matched_ignored
+
+
+class CocoEvaluator:
+    """
+    Accumulates per image results and computes the COCOeval bbox summary.
+    add(ground truth, detections) for each image, then summarize().
+    """
+    def __init__(self, category_ids: List[int]) -> None:
+        self.category_ids = category_ids
+        # (category, area range) -> lists of per image arrays
+        self._scores: Dict[Tuple[int, str], List[np.ndarray]] = defaultdict(list)
+        self._matched: Dict[Tuple[int, str], List[np.ndarray]] = defaultdict(list)
+        self._ignored: Dict[Tuple[int, str], List[np.ndarray]] = defaultdict(list)
+        self._num_gt: Dict[Tuple[int, str], int] = defaultdict(int)
+
+    def add(self, gt_boxes: np.ndarray, gt_categories: np.ndarray, gt_areas: np.ndarray, gt_crowd: np.ndarray,
+            det_boxes: np.ndarray, det_scores: np.ndarray, det_categories: np.ndarray) -> None:
+        """
+        Boxes are COCO xywh in image pixels.
+        """
+        for category_id in self.category_ids:
+            gt_mask, det_mask = gt_categories == category_id, det_categories == category_id
+            if not gt_mask.any() and not det_mask.any():
+                continue
+            g_boxes, g_areas, g_crowd = gt_boxes[gt_mask], gt_areas[gt_mask], gt_crowd[gt_mask].astype(bool)
+            order = np.argsort(-det_scores[det_mask], kind="mergesort")[:MAX_DETECTIONS]
+            d_boxes, d_scores = det_boxes[det_mask][order], det_scores[det_mask][order]
+            d_areas = np.prod(d_boxes[:, 2:], axis=1)
+            ious_all = box_iou_xywh(d_boxes, g_boxes, g_crowd)
+
+            for area_name, (low, high) in AREA_RANGES.items():
+                gt_ignore = g_crowd | (g_areas < low) | (g_areas > high)
+                gt_order = np.argsort(gt_ignore, kind="mergesort")
+                matched, matched_ignored = match_image(ious_all[:, gt_order], gt_ignore[gt_order], g_crowd[gt_order])
+                # Unmatched detections outside the area range don't count as false positives
+                outside = (d_areas < low) | (d_areas > high)
+                ignored = matched_ignored | (~matched & outside[None, :])
+                key = (category_id, area_name)
+                self._scores[key].append(d_scores)
+                self._matched[key].append(matched)
+                self._ignored[key].append(ignored)
+                self._num_gt[key] += int((~gt_ignore).sum())
+
+    def _precision_recall(self, key: Tuple[int, str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (T, R) interpolated precision at the recall thresholds and (T,) final recall, -1 where the category has no ground truth.
+        """
+        num_thresholds = len(IOU_THRESHOLDS)
+        num_gt = self._num_gt.get(key, 0)
+        if not num_gt:
+            return -np.ones((num_thresholds, len(RECALL_THRESHOLDS))), -np.ones(num_thresholds)
+        if not self._scores.get(key):
+            return np.zeros((num_thresholds, len(RECALL_THRESHOLDS))), np.zeros(num_thresholds)
+        scores = np.concatenate(self._scores[key])
+        order = np.argsort(-scores, kind="mergesort")
+        matched = np.concatenate(self._matched[key], axis=1)[:, order]
+        ignored = np.concatenate(self._ignored[key], axis=1)[:, order]
+        true_positives = np.cumsum(matched & ~ignored, axis=1, dtype=np.float64)
+        false_positives = np.cumsum(~matched & ~ignored, axis=1, dtype=np.float64)
+
+        recall = true_positives / num_gt
+        precision = true_positives / np.maximum(true_positives + false_positives, np.spacing(1))
+        final_recall = recall[:, -1] if recall.shape[1] else np.zeros(num_thresholds)
+        # Precision envelope (max precision at any higher recall), then sample it at the recall thresholds
+        envelope = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+        sampled = np.zeros((num_thresholds, len(RECALL_THRESHOLDS)))
+        for t in range(num_thresholds):
+            positions = np.searchsorted(recall[t], RECALL_THRESHOLDS, side="left")
+            valid = positions < recall.shape[1]
+            sampled[t, valid] = envelope[t, positions[valid]]
+        return sampled, final_recall
+
+    def summarize(self) -> Dict[str, float]:
+        def mean_valid(values: np.ndarray) -> float:
+            values = values[values > -1]
+            return float(values.mean()) if values.size else -1.0
+
+        results = {}
+        for area_name in AREA_RANGES:
+            per_category = [self._precision_recall((category_id, area_name)) for category_id in self.category_ids]
+            precision = np.stack([p for p, _ in per_category], axis=-1)   # (T, R, K)
+            recall = np.stack([r for _, r in per_category], axis=-1)      # (T, K)
+            if area_name == "all":
+                results["mAP50-95"] = mean_valid(precision)
+                results["mAP50"] = mean_valid(precision[0])
+                results["mAP75"] = mean_valid(precision[5])
+                results["AR100"] = mean_valid(recall)
+            else:
+                results[f"mAP_{area_name}"] = mean_valid(precision)
+                results[f"AR100_{area_name}"] = mean_valid(recall)
+        return results
+
+
+# ── Ground truth / inference ──────────────────────────────────────────────────
+def load_ground_truth(index: CocoIndex) -> Dict[int, np.ndarray]:
+    """
+    image_id -> (N, 7) [category_id, x, y, w, h, area, iscrowd], bulk read from the index.
+    """
+    chunks = list(index.iter_annotations())
+    table = np.concatenate(chunks) if chunks else np.zeros((0, 8))
+    order = np.argsort(table[:, 0], kind="stable")
+    table = table[order]
+    image_ids, starts = np.unique(table[:, 0], return_index=True)
+    return {int(image_id): rows[:, 1:] for image_id, rows in zip(image_ids, np.split(table, starts[1:]))}
+
+
+def iter_prefetched(images: List[dict], images_dir: str, detector: Detector, executor: ThreadPoolExecutor,
+                    prefetch: int) -> Iterator[Tuple[dict, Optional[tuple]]]:
+    """
+    Yields (image entry, (tensor, transform, (h, w)) or None if unreadable) in order, decoding at most `prefetch` ahead.
+    """
+    def load(image: dict):
+        frame = cv2.imread(os.path.join(images_dir, image["file_name"]))
+        if frame is None:
+            return None
+        tensor, transform = detector.preprocess(frame)
+        return tensor, transform, frame.shape[:2]
+
+    remaining = iter(images)
+    pending = deque((image, executor.submit(load, image)) for image in islice(remaining, prefetch))
+    while pending:
+        image, future = pending.popleft()
+        next_image = next(remaining, None)
+        if next_image is not None:
+            pending.append((next_image, executor.submit(load, next_image)))
+        yield image, future.result()
+
+
+def evaluate_model(
+    model_path: str,
+    index: CocoIndex,
+    images_dir: str,
+    ground_truth: Dict[int, np.ndarray],
+    batch_size: int = 8,
+    workers: int = 8,
+    conf_threshold: float = 0.001,
+    iou_threshold: float = 0.7,
+    letterbox: bool = False,
+    max_images: Optional[int] = None,
+    latency_runs: int = 50,
+    providers: Optional[List[str]] = None,
+    num_threads: Optional[int] = None,
+) -> dict:
+    detector = Detector(model_path, None, conf_threshold, iou_threshold, letterbox, providers, num_threads)
+    if detector.fixed_batch is not None:
+        batch_size = detector.fixed_batch
+    category_ids = [category["id"] for category in index.categories()]
+    evaluator = CocoEvaluator(category_ids)
+    images = list(islice(index.images(), max_images))
+    empty_gt = np.zeros((0, 7))
+
+    batch_times, missing = [], 0
+    items, tensors = [], []
+
+    def flush() -> None:
+        if not items:
+            return
+        start = time.perf_counter()
+        batch_detections = detector.detect(np.stack(tensors))
+        batch_times.append(time.perf_counter() - start)
+        for (image, transform, size), detections in zip(items, batch_detections):
+            detections = detector.scale(detections, transform, size).astype(np.float64)
+            gt = ground_truth.get(image["id"], empty_gt)
+            det_boxes = np.concatenate([detections[:, :2], detections[:, 2:4] - detections[:, :2]], axis=1)
+            # Class ids map to COCO ids as in convert_yolo_to_coco / infer.CocoWriter
+            evaluator.add(gt[:, 1:5], gt[:, 0].astype(np.int64), gt[:, 5], gt[:, 6],
+                          det_boxes, detections[:, 4], detections[:, 5].astype(np.int64) + 1)
+        items.clear()
+        tensors.clear()
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for image, loaded in tqdm(iter_prefetched(images, images_dir, detector, executor, prefetch=4 * batch_size),
+                                  total=len(images), desc=os.path.basename(model_path)):
+            if loaded is None:
+                missing += 1
+                continue
+            tensor, transform, size = loaded
+            items.append((image, transform, size))
+            tensors.append(tensor)
+            if len(items) == batch_size:
+                flush()
+        flush()
+    wall_time = time.perf_counter() - start_time
+    if missing:
+        print(f"[Warning] {missing} images could not be read and were left out of the evaluation")
+
+    num_images = len(images) - missing
+    batch_ms = np.array(batch_times) * 1000 if batch_times else np.zeros(1)
+    latency = benchmark(detector, batch_size=1, runs=latency_runs) if latency_runs else {}
+    return {
+        "model": model_path,
+        "backend": detector.backend.name,
+        "input": f"{detector.layout} {detector.input_size[0]}x{detector.input_size[1]} {np.dtype(detector.backend.input_dtype).name}",
+        "images": num_images,
+        **evaluator.summarize(),
+        "latency_p50_ms": latency.get("p50_ms"),
+        "latency_p95_ms": latency.get("p95_ms"),
+        "batch_size": batch_size,
+        "batch_mean_ms": float(batch_ms.mean()),
+        "batch_p95_ms": float(np.percentile(batch_ms, 95)),
+        "model_images_per_second": num_images / max(sum(batch_times), 1e-9),
+        "end_to_end_images_per_second": num_images / max(wall_time, 1e-9),
+    }
+
+
+def print_table(results: List[dict]) -> None:
+    header = f"{'model':<36} {'backend':<7} {'mAP50-95':>8} {'mAP50':>6} {'mAP75':>6} {'AR100':>6} {'lat p50':>8} {'lat p95':>8} {'img/s':>7}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        latency_p50 = f"{result['latency_p50_ms']:.1f}ms" if result["latency_p50_ms"] is not None else "-"
+        latency_p95 = f"{result['latency_p95_ms']:.1f}ms" if result["latency_p95_ms"] is not None else "-"
+        print(f"{os.path.basename(result['model']):<36} {result['backend']:<7} {result['mAP50-95']:>8.4f} {result['mAP50']:>6.4f} "
+              f"{result['mAP75']:>6.4f} {result['AR100']:>6.4f} {latency_p50:>8} {latency_p95:>8} {result['end_to_end_images_per_second']:>7.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="COCO mAP + latency / throughput of exported detectors on the validation split.")
+    parser.add_argument("--models", type=str, nargs="+", required=True, help=".onnx / .tflite exports to compare")
+    parser.add_argument("--coco", type=str, default="./coco_annotations/valid.json")
+    parser.add_argument("--images", type=str, default="./valid/images")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8, help="Decode / preprocess threads")
+    parser.add_argument("--conf", type=float, default=0.001, help="Confidence threshold (low for mAP, as Ultralytics val)")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold for exports without NMS")
+    parser.add_argument("--letterbox", action="store_true")
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--latency-runs", type=int, default=50, help="Single image latency runs per model, 0 to skip")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    parser.add_argument("--report", type=str, default=None, help="Write all results as JSON")
+    args = parser.parse_args()
+
+    with CocoIndex(args.coco) as index:
+        ground_truth = load_ground_truth(index)
+        print(f"{len(index)} images, {index.count_annotations()} annotations in {args.coco}")
+        results = [
+            evaluate_model(model_path, index, args.images, ground_truth, args.batch_size, args.workers, args.conf, args.iou,
+                           args.letterbox, args.max_images, args.latency_runs, args.providers, args.threads)
+            for model_path in args.models
+        ]
+
+    print_table(results)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {args.report}")
@@ -0,0 +1,351 @@
+'''
+    Reproducible ONNX export of the detector: one command replaces the export.py / cleans.py / convert.py / nhcw.ipynb steps
+    1. export      best.pt -> best.onnx (Ultralytics, dynamic batch axis, raw head or --nms)
+    2. simplify    onnxslim (constant folding, redundant op removal)
+    3. cleanup     graphsurgeon: fold constants, dead node cleanup, toposort, IR version capped to what onnxruntime
+                   loads (instead of forcing ir_version = 10), model metadata (imgsz / names) kept -> bestfp32.onnx
+    4. variants    bestfp16.onnx (FP16 weights, FP32 I/O), bestint8_static.onnx (QDQ Conv, calibrated on validation
+                   images), bestint8_dynamic.onnx, and an NHWC input copy of each (*_nhwc.onnx, dynamic batch kept)
+    5. checks      detection parity against bestfp32.onnx (matched boxes at IoU >= 0.9, score drift) on validation images,
+                   and latency (batch 1 p50 / p95) + throughput per variant -> export_report.json
+
+    Needs: onnx, onnxruntime, onnxslim, onnx-graphsurgeon, onnxconverter-common (+ ultralytics for step 1)
+
+    usage: python export_pipeline.py --weights best.pt [--images ./valid/images] [--variants fp32 fp16 int8_static] [--nms]
+           python export_pipeline.py --onnx best.onnx  (start from an existing export, skips step 1)
+'''
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from detector import Detector, benchmark
+from postprocess import box_iou
+
+MAX_IR_VERSION = 10  # Highest ONNX IR version the deployed onnxruntime builds load
+INPUT_NAME = "images"
+ALL_VARIANTS = ("fp32", "fp16", "int8_static", "int8_dynamic")
+VARIANT_FILES = {
+    "fp32": "bestfp32.onnx",
+    "fp16": "bestfp16.onnx",
+    "int8_static": "bestint8_static.onnx",
+    "int8_dynamic": "bestint8_dynamic.onnx",
+}
+# Minimum fraction of the reference detections a variant must reproduce
+PARITY_RECALL = {"fp32": 0.999, "fp16": 0.98, "int8_static": 0.9, "int8_dynamic": 0.9}
+PARITY_IOU = 0.9
+
+
+def _require(module: str, package: str):
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise ImportError(f"The export pipeline needs {package}: pip install {package}") from e
+
+
+def nhwc_path(path: str) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}_nhwc{extension}"
+
+
+def copy_metadata(source_path: str, target_path: str) -> None:
+    """
+    Ultralytics metadata (imgsz, names, ...) is dropped by graphsurgeon / quantization, Detector reads it back.
+    """
+    onnx = _require("onnx", "onnx")
+    source, target = onnx.load(source_path), onnx.load(target_path)
+    existing = {prop.key for prop in target.metadata_props}
+    missing = [prop for prop in source.metadata_props if prop.key not in existing]
+    if missing:
+        target.metadata_props.extend(missing)
+        onnx.save(target, target_path)
+
+
+# ── Steps ─────────────────────────────────────────────────────────────────────
+def export_detector(weights: str, output_path: str, imgsz: int = 640, opset: Optional[int] = None, nms: bool = False) -> None:
+    from ultralytics import YOLO
+
+    exported = YOLO(weights).export(format="onnx", dynamic=True, simplify=False, half=False, nms=nms, imgsz=imgsz,
+                                    opset=opset, device="cpu")
+    if os.path.abspath(exported) != os.path.abspath(output_path):
+        shutil.move(exported, output_path)
+
+
+def simplify(model_path: str, output_path: str) -> None:
+    onnxslim = _require("onnxslim", "onnxslim")
+    onnxslim.slim(model_path, output_path)
+
+
+def cleanup(model_path: str, output_path: str, max_ir_version: int = MAX_IR_VERSION) -> None:
+    onnx = _require("onnx", "onnx")
+    gs = _require("onnx_graphsurgeon", "onnx-graphsurgeon")
+
+    original = onnx.load(model_path)
+    graph = gs.import_onnx(original)
+    graph.fold_constants().cleanup().toposort()
+    model = gs.export_onnx(graph)
+    # Newer onnx packages stamp an IR version older onnxruntime releases refuse, only lower it when needed
+    model.ir_version = min(model.ir_version, max_ir_version)
+    model.metadata_props.extend(original.metadata_props)
+    onnx.checker.check_model(model)
+    onnx.save(model, output_path)
+
+
+def to_fp16(model_path: str, output_path: str) -> None:
+    """
+    FP16 weights / compute with FP32 inputs and outputs (same as convert.py).
+    """
+    onnx = _require("onnx", "onnx")
+    converter = _require("onnxconverter_common", "onnxconverter-common")
+    onnx.save(converter.convert_float_to_float16(onnx.load(model_path), keep_io_types=True), output_path)
+
+
+def to_nhwc(model_path: str, output_path: str, input_name: str = INPUT_NAME) -> None:
+    """
+    NHWC input (nhcw.ipynb): a Transpose (NHWC -> NCHW) is inserted after the input, dynamic axes keep their names.
+    """
+    onnx = _require("onnx", "onnx")
+    gs = _require("onnx_graphsurgeon", "onnx-graphsurgeon")
+
+    original = onnx.load(model_path)
+    graph = gs.import_onnx(original)
+    input_var = next((inp for inp in graph.inputs if inp.name == input_name), None)
+    if input_var is None:
+        raise ValueError(f"Input '{input_name}' not found in {model_path}")
+    batch, channels, height, width = input_var.shape
+    transposed = gs.Variable(name=f"{input_name}_nchw", dtype=input_var.dtype, shape=[batch, channels, height, width])
+    input_var.shape = [batch, height, width, channels]
+
+    # Every consumer of the input reads the transposed tensor instead
+    for node in graph.nodes:
+        node.inputs = [transposed if inp is input_var else inp for inp in node.inputs]
+    graph.nodes.insert(0, gs.Node(op="Transpose", name="Transpose_NHWC_to_NCHW", inputs=[input_var], outputs=[transposed],
+                                  attrs={"perm": [0, 3, 1, 2]}))
+    graph.cleanup().toposort()
+    model = gs.export_onnx(graph)
+    model.ir_version = min(model.ir_version, MAX_IR_VERSION)
+    model.metadata_props.extend(original.metadata_props)
+    onnx.save(model, output_path)
+
+
+def quantize_dynamic_int8(model_path: str, output_path: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared = output_path + ".prep.onnx"
+    quant_pre_process(model_path, prepared, skip_symbolic_shape=False)
+    try:
+        quantize_dynamic(model_input=prepared, model_output=output_path, weight_type=QuantType.QUInt8)
+    finally:
+        os.remove(prepared)
+    copy_metadata(model_path, output_path)
+
+
+def quantize_static_int8(model_path: str, output_path: str, calibration: np.ndarray, batch_size: int = 8) -> None:
+    """
+    Static QDQ INT8 (per-channel weights) on the Conv layers only: the decode tail (box scaling, sigmoid scores,
+    concat of boxes with scores) stays in float, one uint8 scale can't cover 0-640 pixel boxes and 0-1 scores.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class Reader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self._batches = iter([calibration[i:i + batch_size] for i in range(0, len(calibration), batch_size)])
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {INPUT_NAME: batch}
+
+    prepared = output_path + ".prep.onnx"
+    quant_pre_process(model_path, prepared, skip_symbolic_shape=False)
+    try:
+        quantize_static(model_input=prepared, model_output=output_path, calibration_data_reader=Reader(),
+                        quant_format=QuantFormat.QDQ, op_types_to_quantize=["Conv"], per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.MinMax)
+    finally:
+        os.remove(prepared)
+    copy_metadata(model_path, output_path)
+
+
+# ── Data / checks ─────────────────────────────────────────────────────────────
+def sample_images(images_dir: str, count: int, seed: int = 0) -> List[np.ndarray]:
+    """
+    `count` BGR images from images_dir, sampled with a fixed seed.
+    """
+    names = sorted(name for name in os.listdir(images_dir) if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+    if not names:
+        raise FileNotFoundError(f"No images found in '{images_dir}'")
+    chosen = np.random.default_rng(seed).choice(len(names), size=min(count, len(names)), replace=False)
+    images = [cv2.imread(os.path.join(images_dir, names[i])) for i in np.sort(chosen)]
+    return [image for image in images if image is not None]
+
+
+def run_detector(detector: Detector, images: List[np.ndarray], batch_size: int = 8) -> List[np.ndarray]:
+    detections = []
+    for start in range(0, len(images), batch_size):
+        tensors = [detector.preprocess(image)[0] for image in images[start:start + batch_size]]
+        detections.extend(detector.detect(np.stack(tensors)))
+    return detections
+
+
+def parity(reference: List[np.ndarray], detections: List[np.ndarray], iou_threshold: float = PARITY_IOU) -> Dict[str, float]:
+    """
+    Greedy one-to-one matching per image (same class, IoU >= iou_threshold, highest reference score first).
+    recall: matched / reference detections, precision: matched / variant detections.
+    """
+    matched, reference_total, variant_total = 0, 0, 0
+    score_diffs, ious = [], []
+    for ref, det in zip(reference, detections):
+        reference_total += len(ref)
+        variant_total += len(det)
+        if not len(ref) or not len(det):
+            continue
+        iou = box_iou(ref[:, :4], det[:, :4])
+        iou[ref[:, None, 5] != det[None, :, 5]] = 0.0
+        used = np.zeros(len(det), dtype=bool)
+        for i in np.argsort(-ref[:, 4], kind="stable"):
+            candidates = np.where(~used & (iou[i] >= iou_threshold))[0]
+            if len(candidates):
+                j = candidates[iou[i, candidates].argmax()]
+                used[j] = True
+                matched += 1
+                score_diffs.append(abs(ref[i, 4] - det[j, 4]))
+                ious.append(iou[i, j])
+    return {
+        "reference_detections": reference_total,
+        "detections": variant_total,
+        "recall": matched / reference_total if reference_total else 1.0,
+        "precision": matched / variant_total if variant_total else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 1.0,
+        "max_score_diff": float(np.max(score_diffs)) if score_diffs else 0.0,
+    }
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+def run_pipeline(
+    output_dir: str = ".",
+    weights: Optional[str] = None,
+    onnx_path: Optional[str] = None,
+    images_dir: str = "./valid/images",
+    variants: List[str] = ("fp32", "fp16", "int8_static"),
+    nhwc: bool = True,
+    imgsz: int = 640,
+    opset: Optional[int] = None,
+    nms: bool = False,
+    letterbox: bool = False,
+    conf_threshold: float = 0.25,
+    parity_images: int = 64,
+    calibration_images: int = 200,
+    batch_size: int = 8,
+    skip_simplify: bool = False,
+    providers: Optional[List[str]] = None,
+) -> dict:
+    os.makedirs(output_dir, exist_ok=True)
+    timings: Dict[str, float] = {}
+    report: dict = {"variants": {}, "steps_seconds": timings, "parity_reference": "fp32"}
+
+    def step(name: str, function, *args) -> None:
+        start = time.perf_counter()
+        function(*args)
+        timings[name] = round(time.perf_counter() - start, 2)
+        print(f"[export] {name} done in {timings[name]:.1f}s")
+
+    # 1-3: FP32 base
+    exported = os.path.join(output_dir, "best.onnx")
+    if onnx_path is None:
+        if weights is None:
+            raise ValueError("Pass --weights (export with Ultralytics) or --onnx (start from an existing export)")
+        step("export", export_detector, weights, exported, imgsz, opset, nms)
+    elif os.path.abspath(onnx_path) != os.path.abspath(exported):
+        shutil.copyfile(onnx_path, exported)
+    fp32_path = os.path.join(output_dir, VARIANT_FILES["fp32"])
+    if skip_simplify:
+        shutil.copyfile(exported, fp32_path)
+    else:
+        step("simplify", simplify, exported, fp32_path)
+        copy_metadata(exported, fp32_path)
+    step("cleanup", cleanup, fp32_path, fp32_path)
+
+    def load(path: str) -> Detector:
+        return Detector(path, backend="onnx", conf_threshold=conf_threshold, letterbox=letterbox, providers=providers)
+
+    # 4: variants
+    paths = {"fp32": fp32_path}
+    for variant in variants:
+        path = os.path.join(output_dir, VARIANT_FILES[variant])
+        if variant == "fp16":
+            step("fp16", to_fp16, fp32_path, path)
+        elif variant == "int8_dynamic":
+            step("int8_dynamic", quantize_dynamic_int8, fp32_path, path)
+        elif variant == "int8_static":
+            # Calibrate on the same preprocessing the deployed Detector applies
+            fp32_detector = load(fp32_path)
+            calibration = np.stack([fp32_detector.preprocess(image)[0] for image in sample_images(images_dir, calibration_images, seed=1)])
+            step("int8_static", quantize_static_int8, fp32_path, path, calibration, batch_size)
+        paths[variant] = path
+    if nhwc:
+        for variant in list(paths):
+            paths[f"{variant}_nhwc"] = nhwc_path(paths[variant])
+            step(f"{variant}_nhwc", to_nhwc, paths[variant], paths[f"{variant}_nhwc"])
+
+    # 5: checks
+    images = sample_images(images_dir, parity_images) if parity_images else []
+    reference = run_detector(load(fp32_path), images, batch_size) if images else None
+    all_passed = True
+    for name, path in paths.items():
+        detector = load(path)
+        entry = {"path": path, "size_mb": round(os.path.getsize(path) / 2 ** 20, 2)}
+        if reference is not None:
+            entry.update(parity(reference, run_detector(detector, images, batch_size)))
+            entry["parity_passed"] = entry["recall"] >= PARITY_RECALL[name.replace("_nhwc", "")]
+            all_passed &= entry["parity_passed"]
+        single = benchmark(detector, batch_size=1, runs=30)
+        batched = benchmark(detector, batch_size=batch_size, runs=10)
+        entry.update({"latency_p50_ms": single["p50_ms"], "latency_p95_ms": single["p95_ms"], "batch_size": batch_size,
+                      "images_per_second": batched["images_per_second"]})
+        report["variants"][name] = entry
+        print(f"[export] {name:<18} {entry['size_mb']:>8.1f} MB  p50 {entry['latency_p50_ms']:.1f} ms  "
+              f"{entry['images_per_second']:.1f} img/s" + (f"  recall {entry['recall']:.4f}  max score diff {entry['max_score_diff']:.3f}"
+                                                           f"  {'PASS' if entry['parity_passed'] else 'FAIL'}" if "parity_passed" in entry else ""))
+    report["parity_passed"] = all_passed
+
+    with open(os.path.join(output_dir, "export_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[export] Report written to {os.path.join(output_dir, 'export_report.json')}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, simplify, clean, convert and check the detector ONNX variants.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--weights", type=str, help="Ultralytics weights (e.g. best.pt)")
+    source.add_argument("--onnx", type=str, help="Existing FP32 export, skips the Ultralytics export")
+    parser.add_argument("--output-dir", type=str, default=".")
+    parser.add_argument("--images", type=str, default="./valid/images", help="Images for calibration and the parity check")
+    parser.add_argument("--variants", type=str, nargs="+", default=["fp32", "fp16", "int8_static"], choices=ALL_VARIANTS)
+    parser.add_argument("--no-nhwc", action="store_true", help="Don't emit the NHWC input copies")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--opset", type=int, default=None)
+    parser.add_argument("--nms", action="store_true", help="Export with NMS in the graph instead of the raw head")
+    parser.add_argument("--letterbox", action="store_true", help="Letterbox preprocessing for calibration / parity")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold of the parity detections")
+    parser.add_argument("--parity-images", type=int, default=64, help="0 to skip the parity check")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--skip-simplify", action="store_true")
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    parser.add_argument("--strict", action="store_true", help="Exit with an error when a variant fails its parity check")
+    args = parser.parse_args()
+
+    report = run_pipeline(args.output_dir, args.weights, args.onnx, args.images, args.variants, not args.no_nhwc, args.imgsz,
+                          args.opset, args.nms, args.letterbox, args.conf, args.parity_images, args.calibration_images,
+                          args.batch_size, args.skip_simplify, args.providers)
+    if args.strict and not report["parity_passed"]:
+        raise SystemExit("Parity check failed, see export_report.json")
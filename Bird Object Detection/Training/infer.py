@@ -1,106 +1,378 @@
 '''
     Inference with NMS embedded on the model (Nvidia TensorRT , Cuda and CPU)
+    Exports without NMS (raw (1, 4 + nc, N) head) are decoded and NMS'd in numpy, see postprocess.py
+    ONNX Runtime and TFLite models both run through detector.Detector
+    - Inputs: image files, directories (recursive), glob patterns and video files
+    - Decode + preprocess run on a thread pool feeding a bounded queue, the model runs on batches of --batch-size
+    - Detections stream to JSONL (one line per image / frame) and / or a COCO json, annotated images are optional
+
+    usage: python infer.py <inputs ...> [--model ./bestfp32_nhwc.onnx] [--jsonl detections.jsonl] [--coco detections.json]
+                           [--annotate-dir annotated] [--batch-size 8] [--video-stride 5] [--show]
+           python infer.py <inputs ...> --tile-size 1280 [--tile-overlap 0.2] [--merge wbf]  (sliced inference, see tiling.py)
+           python infer.py --stream 0 [--target-fps 15] [--show]  (real-time camera / video mode, see stream.py)
+           python infer.py <inputs ...> --model best.onnx best_float16.tflite  (fastest export on this host, see detector.py)
 '''
+import argparse
+import glob
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union
+
 import cv2
 import numpy as np
-import onnxruntime
-import time
-import os
 
-# Load cuda and cudnn dlls. If not installed, import torch with CUDA support before import onnxruntime
-model_path = "./bestfp32_nhwc.onnx"
-sess_options = onnxruntime.SessionOptions()
-sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
-sess_options.log_severity_level = 1
-session = onnxruntime.InferenceSession(model_path, sess_options, providers=['CPUExecutionProvider']) #TensorrtExecutionProvider
-# Print optimized graph
+from detector import Detector, preprocess, select_model
 
-# get the outputs metadata as a list of :class:`onnxruntime.NodeArg`
-output_name = session.get_outputs()[0].name
+MODEL_PATH = "./bestfp32_nhwc.onnx"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".mpg", ".mpeg", ".wmv")
 
-# get the inputs metadata as a list of :class:`onnxruntime.NodeArg`
-input_name = session.get_inputs()[0].name
+class_names = ['bird']
 
-class_names = ['bird']  
 
-def preprocess(image, input_size=(640, 640)):
+def draw_detections(frame, detections: np.ndarray):
+    for x1, y1, x2, y2, score, class_id in detections:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        # Draw the bounding box
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{class_names[int(class_id)]}: {score:.2f}"
+        cv2.putText(frame, label, (x1 + 5, y1 + 17), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    return frame
+
+
+# ── Inputs ────────────────────────────────────────────────────────────────────
+def expand_inputs(inputs: List[str]) -> List[str]:
     """
-    Preprocess the image: convert BGR to RGB, resize, normalize, and reformat dimensions.
+    Files, directories (recursive) and glob patterns -> sorted list of image / video files.
     """
-    # Convert to RGB
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    # Resize to model input size
-    resized = cv2.resize(image_rgb, input_size)
-    print(f"Resized image shape: {resized.shape}")  # Debugging line to check resized shape
-    # Normalize (0-255 -> 0-1)
-    normalized = resized.astype(np.float32) / 255.0
-    # Change shape from (H, W, C) to (C, H, W)
-    #transposed = np.transpose(normalized, (2, 0, 1))
-    # Add batch dimension: (1, C, H, W)
-    input_tensor = np.expand_dims(normalized, axis=0)
-    return input_tensor
-
-def postprocess(outputs, conf_threshold):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _dirs, files in os.walk(item):
+                paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            matches = [path for path in glob.glob(item, recursive=True) if os.path.isfile(path)]
+            if not matches:
+                print(f"[Warning] No files match '{item}'")
+            paths.extend(matches)
+    return sorted(dict.fromkeys(paths))
+
+
+def iter_frames(paths: List[str], video_stride: int = 1) -> Iterator[Tuple[str, int, Optional[np.ndarray]]]:
     """
-    Postprocess ONNX model output with expected output shape (1, 300, 6).
+    Yields (path, frame index, frame). Images are yielded undecoded (frame None, decoded on the pool),
+    video frames are read here in order, keeping one frame every `video_stride`.
     """
-    # Remove the batch dimension: shape becomes (300, 6)
-    detections = np.squeeze(outputs[0], axis=0)
-    
-    boxes = []
-    for det in detections:
-        # det is expected to be an array with 6 elements: [x1, y1, x2, y2, score, class_id]
-        x1, y1, x2, y2, score, class_id = det
-        
-        if score >= conf_threshold:
-            boxes.append([x1, y1, x2, y2, score, int(class_id)])
-            
-    return boxes
-
-# Open a connection to the webcam
-image_path = './_MG_4080_jpg.rf.d8fa547169cc0ca415f30a1cdd440a91.jpg'  # <-- replace with your image path
-frame = cv2.imread(image_path)
-
-if frame is None:
-    raise FileNotFoundError(f"Image not found: {image_path}")
-
-try:
-    # Preprocess the frame to match model input
-    input_tensor = preprocess(frame, input_size=(640, 640))
-
-    # Run inference with the ONNX model
-    import time
-    start_time = time.perf_counter()
-    outputs = session.run([output_name], {input_name: input_tensor})
-    end_time = time.perf_counter()
-    print(f"Inference time: {end_time - start_time:.4f} seconds")
-
-    # Postprocess outputs: filter detections by confidence
-    detections = postprocess(outputs, conf_threshold=0.25)
-
-
-    # Draw detections on the original frame
-    for det in detections:
-        x1, y1, x2, y2, score, class_id = det
-
-        # If the model's coordinates are based on the resized input,
-        # scale them back to the original frame dimensions:
-        h_orig, w_orig = frame.shape[:2]
-        x_scale = w_orig / 640
-        y_scale = h_orig / 640
-        x1 = int(x1 * x_scale)
-        y1 = int(y1 * y_scale)
-        x2 = int(x2 * x_scale)
-        y2 = int(y2 * y_scale)
+    for path in paths:
+        if not path.lower().endswith(VIDEO_EXTENSIONS):
+            yield path, 0, None
+            continue
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            print(f"[Warning] Could not open video {path}")
+            continue
+        index = 0
+        try:
+            while True:
+                # grab() skips decoding frames that aren't used
+                if not capture.grab():
+                    break
+                if index % video_stride == 0:
+                    ok, frame = capture.retrieve()
+                    if ok:
+                        yield path, index, frame
+                index += 1
+        finally:
+            capture.release()
 
-        # Draw the bounding box
-        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        label = f"{class_names[class_id]}: {score:.2f}"
-        cv2.putText(frame, label, (x1 + 5, y1 + 17), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
-    # Display the frame with drawn detections
-    cv2.imshow("output", frame)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
+def load_and_preprocess(path: str, frame_index: int, frame: Optional[np.ndarray], detector: Detector):
+    if frame is None:
+        frame = cv2.imread(path)
+        if frame is None:
+            raise FileNotFoundError(f"Image not found or unreadable: {path}")
+    return (path, frame_index, frame) + detector.preprocess(frame)
+
+
+# ── Outputs ───────────────────────────────────────────────────────────────────
+class CocoWriter:
+    """
+    Streams detections as a COCO json: images are written directly, annotations go to a temp file appended on close().
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._out = open(path + ".tmp", "w", encoding="utf-8")
+        self._annotations = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._num_images = 0
+        self._num_annotations = 0
+        categories = [{"id": idx + 1, "name": name, "supercategory": "none"} for idx, name in enumerate(class_names)]
+        self._out.write(f'{{"info":{{"description":"detections"}},"licenses":[],"categories":{json.dumps(categories)},"images":[')
+
+    def add(self, file_name: str, width: int, height: int, detections: np.ndarray) -> None:
+        self._num_images += 1
+        image = {"id": self._num_images, "file_name": file_name, "width": width, "height": height}
+        self._out.write(("," if self._num_images > 1 else "") + json.dumps(image, separators=(",", ":")))
+        for x1, y1, x2, y2, score, class_id in detections.tolist():
+            self._num_annotations += 1
+            annotation = {
+                "id": self._num_annotations,
+                "image_id": self._num_images,
+                "category_id": int(class_id) + 1,  # same mapping as convert_yolo_to_coco
+                "bbox": [round(x1, 2), round(y1, 2), round(x2 - x1, 2), round(y2 - y1, 2)],
+                "area": round((x2 - x1) * (y2 - y1), 2),
+                "score": round(score, 5),
+                "iscrowd": 0,
+            }
+            self._annotations.write(("," if self._num_annotations > 1 else "") + json.dumps(annotation, separators=(",", ":")))
+
+    def close(self) -> None:
+        self._out.write('],"annotations":[')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._out)
+        self._out.write("]}")
+        self._annotations.close()
+        self._out.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class Annotator:
+    """
+    Writes annotated copies: images as files in `output_dir`, video frames into one .mp4 per video.
+    Outputs keep the input paths relative to their common folder, so same-named files from different folders don't collide.
+    Videos keep the source frame rate (divided by video_stride, so the duration matches).
+    """
+    def __init__(self, output_dir: str, executor: ThreadPoolExecutor, paths: List[str], video_stride: int = 1) -> None:
+        self.output_dir = output_dir
+        self.executor = executor
+        self.video_stride = video_stride
+        self._root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else ""
+        self._videos: dict = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def output_path(self, path: str) -> str:
+        out_path = os.path.join(self.output_dir, os.path.relpath(os.path.abspath(path), self._root))
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        return out_path
+
+    def add(self, path: str, frame: np.ndarray, detections: np.ndarray, is_video: bool) -> None:
+        if not is_video:
+            out_path = self.output_path(path)
+            # imwrite releases the GIL, encoding runs on the pool
+            self.executor.submit(lambda: cv2.imwrite(out_path, draw_detections(frame, detections)))
+            return
+        writer = self._videos.get(path)
+        if writer is None:
+            height, width = frame.shape[:2]
+            capture = cv2.VideoCapture(path)
+            fps = (capture.get(cv2.CAP_PROP_FPS) or 25.0) / self.video_stride
+            capture.release()
+            out_path = os.path.splitext(self.output_path(path))[0] + "_detections.mp4"
+            writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            self._videos[path] = writer
+        writer.write(draw_detections(frame, detections))
+
+    def close(self) -> None:
+        for writer in self._videos.values():
+            writer.release()
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+def run(
+    inputs: List[str],
+    model_path: Union[str, List[str]] = MODEL_PATH,
+    conf_threshold: float = 0.25,
+    batch_size: int = 8,
+    workers: int = 8,
+    queue_size: int = 64,
+    video_stride: int = 1,
+    jsonl_path: Optional[str] = None,
+    coco_path: Optional[str] = None,
+    annotate_dir: Optional[str] = None,
+    show: bool = False,
+    providers: Optional[List[str]] = None,
+    tile_size: Optional[int] = None,
+    tile_overlap: float = 0.2,
+    merge: str = "nms",
+    skip_empty_tiles: bool = True,
+    lowres_conf: float = 0.05,
+    iou_threshold: float = 0.7,
+    backend: Optional[str] = None,
+    letterbox: bool = False,
+    num_threads: Optional[int] = None,
+) -> dict:
+    """
+    model_path: one model, or several candidate exports (.onnx / .tflite) of which the fastest on this host is used.
+    """
+    if not isinstance(model_path, str):
+        if len(model_path) > 1:
+            model_path, results = select_model(model_path, batch_size, providers=providers, num_threads=num_threads)
+            print(f"Fastest export on this host: {model_path} ({results[model_path]['images_per_second']:.1f} img/s)")
+        else:
+            model_path = model_path[0]
+    detector = Detector(model_path, backend, conf_threshold, iou_threshold, letterbox, providers, num_threads)
+    layout, input_size, fixed_batch = detector.layout, detector.input_size, detector.fixed_batch
+    full_conf = conf_threshold
+
+    tiler = None
+    if tile_size:
+        from tiling import TiledDetector
+        # The full image pass doubles as the low-res pass, so it keeps weaker boxes for the empty tile check
+        full_conf = min(conf_threshold, lowres_conf)
+        tiler = TiledDetector(detector.detect, lambda image: preprocess(image, input_size, layout), input_size, tile_size,
+                              tile_overlap, conf_threshold, merge=merge, skip_empty=skip_empty_tiles, lowres_conf=lowres_conf)
+    if fixed_batch is not None and fixed_batch != batch_size:
+        print(f"Model has a fixed batch size of {fixed_batch}, using it instead of {batch_size}")
+        batch_size = fixed_batch
+
+    if not (jsonl_path or coco_path or annotate_dir or show):
+        print("[Warning] No output selected (--jsonl, --coco, --annotate-dir or --show), only printing a summary")
+
+    paths = expand_inputs(inputs)
+    video_paths = {path for path in paths if path.lower().endswith(VIDEO_EXTENSIONS)}
+    print(f"{len(paths) - len(video_paths)} images, {len(video_paths)} videos, {detector}, batch {batch_size}")
+
+    jsonl_file = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+    coco_writer = CocoWriter(coco_path) if coco_path else None
+
+    # Futures in submission order: the bounded queue keeps decoding at most `queue_size` items ahead of the model
+    pending: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    stats = {"images": 0, "detections": 0, "infer_time": 0.0}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        annotator = Annotator(annotate_dir, executor, paths, video_stride) if annotate_dir else None
+
+        def produce():
+            try:
+                for path, frame_index, frame in iter_frames(paths, video_stride):
+                    if stop.is_set():
+                        break
+                    pending.put(executor.submit(load_and_preprocess, path, frame_index, frame, detector))
+            finally:
+                pending.put(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        def handle(items: list, tensors: list) -> None:
+            if not items:
+                return
+            start = time.perf_counter()
+            batch_detections = detector.detect(np.stack(tensors), full_conf)
+            stats["infer_time"] += time.perf_counter() - start
+
+            for (path, frame_index, frame, transform), detections in zip(items, batch_detections):
+                detections = detector.scale(detections, transform, frame.shape[:2])
+                if tiler:
+                    start = time.perf_counter()
+                    detections = tiler(frame, detections)
+                    stats["infer_time"] += time.perf_counter() - start
+                height, width = frame.shape[:2]
+                is_video = path in video_paths
+                stats["images"] += 1
+                stats["detections"] += len(detections)
+                if jsonl_file:
+                    record = {"file": path, "frame": frame_index if is_video else None, "width": width, "height": height,
+                              "detections": np.round(detections.astype(np.float64), 3).tolist()}
+                    jsonl_file.write(json.dumps(record) + "\n")
+                if coco_writer:
+                    coco_writer.add(f"{path}#{frame_index}" if is_video else path, width, height, detections)
+                if annotator:
+                    annotator.add(path, frame, detections, is_video)
+                if show:
+                    # Display the frame with drawn detections
+                    cv2.imshow("output", draw_detections(frame.copy(), detections))
+                    cv2.waitKey(1 if is_video else 0)
+
+        start_time = time.perf_counter()
+        items: list = []
+        tensors: list = []
+        try:
+            while (future := pending.get()) is not None:
+                try:
+                    path, frame_index, frame, tensor, transform = future.result()
+                except Exception as e:
+                    print(f"[Warning] {e}")
+                    continue
+                items.append((path, frame_index, frame, transform))
+                tensors.append(tensor)
+                if len(items) == batch_size:
+                    handle(items, tensors)
+                    items, tensors = [], []
+            handle(items, tensors)
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue
+            while producer.is_alive():
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    time.sleep(0.01)
+            if annotator:
+                annotator.close()
+            if jsonl_file:
+                jsonl_file.close()
+            if coco_writer:
+                coco_writer.close()
+            if show:
+                cv2.destroyAllWindows()
+
+    elapsed = time.perf_counter() - start_time
+    if tiler:
+        print(f"Tiles: ran {tiler.tiles_run} of {tiler.tiles_total} ({tiler.tiles_total - tiler.tiles_run} skipped as empty)")
+    print(f"{stats['images']} images, {stats['detections']} detections in {elapsed:.1f}s "
+          f"({stats['images'] / max(elapsed, 1e-9):.1f} img/s, model {stats['infer_time']:.1f}s)")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the YOLO ONNX detector over images, folders, globs and videos.")
+    parser.add_argument("inputs", nargs="*", default=["./_MG_4080_jpg.rf.d8fa547169cc0ca415f30a1cdd440a91.jpg"])
+    parser.add_argument("--stream", type=str, default=None, help="Real-time mode on a camera index or video file (see stream.py)")
+    parser.add_argument("--target-fps", type=float, default=15.0, help="--stream: processed frames per second to aim for")
+    parser.add_argument("--realtime", action="store_true", help="--stream: read a video file at its own frame rate, like a camera")
+    parser.add_argument("--model", type=str, nargs="+", default=[MODEL_PATH],
+                        help="Model, or several exports (.onnx / .tflite) to benchmark on this host and use the fastest")
+    parser.add_argument("--backend", type=str, default=None, choices=["onnx", "tflite"], help="Default: from the file extension")
+    parser.add_argument("--letterbox", action="store_true", help="Keep the aspect ratio (pad to the model input) instead of stretching")
+    parser.add_argument("--threads", type=int, default=None, help="Inference threads (default: runtime's choice / all cores for TFLite)")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold for exports without NMS (Ultralytics default)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8, help="Decode / preprocess threads")
+    parser.add_argument("--queue-size", type=int, default=64, help="Max preprocessed items waiting for the model")
+    parser.add_argument("--video-stride", type=int, default=1, help="Run on every n-th video frame")
+    parser.add_argument("--jsonl", type=str, default=None, help="Write one JSON line of detections per image / frame")
+    parser.add_argument("--coco", type=str, default=None, help="Write detections as a COCO json")
+    parser.add_argument("--annotate-dir", type=str, default=None, help="Save images / videos with drawn boxes here")
+    parser.add_argument("--show", action="store_true", help="Display every result in a window")
+    parser.add_argument("--providers", type=str, nargs="+", default=None, help="e.g. CUDAExecutionProvider CPUExecutionProvider")
+    parser.add_argument("--tile-size", type=int, default=None, help="Sliced inference with tiles of this many pixels (see tiling.py)")
+    parser.add_argument("--tile-overlap", type=float, default=0.2, help="Tile overlap as a fraction of the tile size")
+    parser.add_argument("--merge", type=str, default="nms", choices=["nms", "wbf"], help="How boxes of overlapping tiles are merged")
+    parser.add_argument("--all-tiles", action="store_true", help="Run every tile, even those the low-res pass marks as empty")
+    parser.add_argument("--lowres-conf", type=float, default=0.05, help="Low-res confidence that marks a tile as worth running")
+    args = parser.parse_args()
+
+    if args.stream is not None:
+        from stream import run_stream
+        output_video = None
+        if args.annotate_dir:
+            os.makedirs(args.annotate_dir, exist_ok=True)
+            output_video = os.path.join(args.annotate_dir, "stream_detections.mp4")
+        run_stream(args.stream, args.model[0], args.conf, args.target_fps, args.realtime, args.show,
+                   output_video, args.jsonl, providers=args.providers, iou_threshold=args.iou, backend=args.backend,
+                   letterbox=args.letterbox, num_threads=args.threads)
+        raise SystemExit(0)
+
+    run(args.inputs, args.model, args.conf, args.batch_size, args.workers, args.queue_size, args.video_stride,
+        args.jsonl, args.coco, args.annotate_dir, args.show, args.providers, args.tile_size, args.tile_overlap,
+        args.merge, not args.all_tiles, args.lowres_conf, args.iou, args.backend, args.letterbox, args.threads)
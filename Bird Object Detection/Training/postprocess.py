@@ -0,0 +1,180 @@
+'''
+    NumPy postprocessing for detector outputs
+    - box_iou: pairwise IoU matrix
+    - nms / batched_nms: greedy NMS, class aware through per-class coordinate offsets
+    - weighted_boxes_fusion: merges overlapping boxes into score weighted averages (used to merge tiles, see tiling.py)
+    - decode_yolo_head: raw YOLO head (exported with nms=False) -> detections, same steps and defaults as
+      Ultralytics non_max_suppression (confidence prefilter, max_nms, class offsets of max_wh, max_det)
+    - postprocess_output: dispatches on the output shape (NMS embedded (B, 300, 6) vs raw head (B, 4 + nc, N) / (B, N, 4 + nc))
+    All boxes are xyxy, detections are (N, 6) [x1, y1, x2, y2, score, class_id].
+'''
+from typing import List, Optional
+
+import numpy as np
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU of (N, 4) and (M, 4) xyxy boxes -> (N, M).
+    """
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:4] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:4] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.45, max_det: Optional[int] = None) -> np.ndarray:
+    """
+    Greedy NMS, returns kept indices sorted by decreasing score.
+    Each step suppresses every remaining box overlapping the current best one in a single vectorized IoU.
+    """
+    order = np.argsort(-scores, kind="stable")
+    areas = np.prod(boxes[:, 2:4] - boxes[:, :2], axis=1)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if max_det is not None and len(keep) >= max_det:
+            break
+        rest = order[1:]
+        top_left = np.maximum(boxes[best, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[best, 2:4], boxes[rest, 2:4])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float = 0.45,
+                max_det: Optional[int] = None, max_wh: float = 7680.0) -> np.ndarray:
+    """
+    Class aware NMS: boxes of different classes are shifted apart by class_id * max_wh so they never overlap,
+    then one NMS runs over everything (same trick as Ultralytics / torchvision).
+    """
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64)
+    offset_boxes = boxes[:, :4] + (classes.astype(boxes.dtype) * max_wh)[:, None]
+    return nms(offset_boxes, scores, iou_threshold, max_det)
+
+
+def nms_detections(detections: np.ndarray, iou_threshold: float = 0.45, max_det: Optional[int] = None) -> np.ndarray:
+    keep = batched_nms(detections[:, :4], detections[:, 4], detections[:, 5], iou_threshold, max_det)
+    return detections[keep]
+
+
+def weighted_boxes_fusion(detections: np.ndarray, iou_threshold: float = 0.55, skip_threshold: float = 0.0) -> np.ndarray:
+    """
+    Weighted boxes fusion for one model: boxes (same class) overlapping a fused box by more than iou_threshold are merged
+    into it, coordinates are averaged with the scores as weights and the fused score is the mean score of the cluster.
+    Unlike NMS the result uses every overlapping box, good for the partial boxes two neighbouring tiles produce.
+    """
+    detections = detections[detections[:, 4] >= skip_threshold]
+    if not len(detections):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    order = np.argsort(-detections[:, 4], kind="stable")
+    # Running sums per cluster: score weighted coordinates, score sum, count
+    weighted = np.zeros((len(order), 4))
+    score_sum = np.zeros(len(order))
+    counts = np.zeros(len(order))
+    fused = np.zeros((len(order), 4))
+    classes = np.zeros(len(order))
+    num_clusters = 0
+
+    for index in order:
+        box, score, class_id = detections[index, :4].astype(np.float64), float(detections[index, 4]), detections[index, 5]
+        match = -1
+        if num_clusters:
+            ious = box_iou(box[None], fused[:num_clusters])[0]
+            ious[classes[:num_clusters] != class_id] = -1.0
+            best = int(np.argmax(ious))
+            if ious[best] > iou_threshold:
+                match = best
+        if match < 0:
+            match = num_clusters
+            classes[match] = class_id
+            num_clusters += 1
+        weighted[match] += box * score
+        score_sum[match] += score
+        counts[match] += 1
+        fused[match] = weighted[match] / score_sum[match]
+
+    result = np.concatenate([
+        fused[:num_clusters],
+        (score_sum[:num_clusters] / counts[:num_clusters])[:, None],
+        classes[:num_clusters, None],
+    ], axis=1)
+    return result[np.argsort(-result[:, 4], kind="stable")].astype(np.float32)
+
+
+def xywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    half = boxes[..., 2:4] / 2
+    return np.concatenate([boxes[..., :2] - half, boxes[..., :2] + half], axis=-1)
+
+
+def is_anchor_count(n: int) -> bool:
+    """
+    Anchors of a 3 level (strides 8, 16, 32) head: (h/8 * w/8) + (h/16 * w/16) + (h/32 * w/32) = 21 * (h/32) * (w/32).
+    """
+    return n > 0 and n % 21 == 0
+
+
+def is_raw_head(output: np.ndarray, max_det: int = 300) -> bool:
+    """
+    (B, max_det, 6) is an NMS-embedded export, (B, 4 + nc, N) / (B, N, 4 + nc) with N anchors (8400 at 640) is a raw head.
+    A transposed raw head with 2 classes is (B, N, 6) too, the anchor count tells them apart.
+    """
+    if output.shape[-1] != 6:
+        return True
+    return output.shape[1] != max_det and is_anchor_count(output.shape[1])
+
+
+def decode_yolo_head(
+    output: np.ndarray,
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.7,
+    max_det: int = 300,
+    max_nms: int = 30000,
+    max_wh: float = 7680.0,
+    agnostic: bool = False,
+) -> List[np.ndarray]:
+    """
+    Raw YOLOv8 / YOLO11 head (B, 4 + nc, N) [cx, cy, w, h, class scores...] -> list of (K, 6) detections per image.
+    Mirrors ultralytics.utils.ops.non_max_suppression (single label per box): boxes whose best class score
+    is above conf_threshold, at most max_nms of them by score, class aware NMS, at most max_det kept.
+    """
+    if output.shape[1] > output.shape[2]:
+        output = output.transpose(0, 2, 1)  # (B, N, 4 + nc) -> (B, 4 + nc, N)
+    results = []
+    for prediction in output:
+        class_scores = prediction[4:]                       # (nc, N)
+        # Confidence prefilter before anything is transposed or copied
+        candidates = np.flatnonzero(class_scores.max(axis=0) > conf_threshold)
+        if not len(candidates):
+            results.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+        boxes = xywh_to_xyxy(prediction[:4, candidates].T)
+        scores = class_scores[:, candidates]
+        class_ids = scores.argmax(axis=0)
+        confidences = scores[class_ids, np.arange(len(candidates))]
+
+        if len(candidates) > max_nms:
+            top = np.argsort(-confidences, kind="stable")[:max_nms]
+            boxes, confidences, class_ids = boxes[top], confidences[top], class_ids[top]
+
+        keep = batched_nms(boxes, confidences, np.zeros_like(class_ids) if agnostic else class_ids, iou_threshold, max_det, max_wh)
+        results.append(np.concatenate([
+            boxes[keep], confidences[keep, None], class_ids[keep, None].astype(boxes.dtype)
+        ], axis=1).astype(np.float32))
+    return results
+
+
+def postprocess_output(output: np.ndarray, conf_threshold: float = 0.25, iou_threshold: float = 0.7, max_det: int = 300) -> List[np.ndarray]:
+    """
+    Model output -> list of (K, 6) detections per image, whether NMS is embedded in the export or not.
+    """
+    if is_raw_head(output, max_det):
+        return decode_yolo_head(output, conf_threshold, iou_threshold, max_det)
+    return [det[det[:, 4] >= conf_threshold] for det in output]
@@ -0,0 +1,341 @@
+'''
+    Real-time detection on a camera or video stream
+    - capture -> preprocess -> infer -> draw run on their own threads, connected by small bounded queues
+    - Frames are dropped at capture when preprocessing can't keep up, and an adaptive stride keeps the model near --target-fps
+    - Input tensors come from a fixed pool of preallocated buffers (no per-frame allocation)
+    - The model runs through detector.Detector: ONNX Runtime or TFLite exports, letterboxing, fixed batch and quantized inputs
+    - Per stage latency (mean / p95) and end to end latency are reported every few seconds
+
+    A video file stands in for the camera with --realtime (frames are read at the file's own frame rate).
+
+    usage: python stream.py [--source 0] [--model ./bestfp32_nhwc.onnx] [--target-fps 15] [--show]
+           python infer.py --stream 0 ...
+'''
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from detector import Detector, Transform, letterbox
+from infer import MODEL_PATH, draw_detections
+
+STAGES = ("capture", "preprocess", "infer", "draw")
+
+
+class StageTimer:
+    """
+    Rolling latency window per stage (seconds), thread safe.
+    """
+    def __init__(self, window: int = 200) -> None:
+        self.samples: Dict[str, deque] = {stage: deque(maxlen=window) for stage in STAGES + ("end_to_end",)}
+        self.counts: Dict[str, int] = {stage: 0 for stage in STAGES + ("dropped",)}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+            if stage in self.counts:
+                self.counts[stage] += 1
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = []
+            for stage, samples in self.samples.items():
+                if samples:
+                    values = np.array(samples) * 1000
+                    parts.append(f"{stage} {values.mean():.1f}/{np.percentile(values, 95):.1f}ms")
+            return " | ".join(parts) + f" | processed {self.counts['infer']}, dropped {self.counts['dropped']}"
+
+
+class BufferPool:
+    """
+    Fixed set of preallocated input tensors. acquire() blocks until one is free, so it also bounds the frames in flight.
+    """
+    def __init__(self, shape, size: int) -> None:
+        self._free: queue.Queue = queue.Queue()
+        for _ in range(size):
+            self._free.put(np.empty(shape, dtype=np.float32))
+
+    def acquire(self, timeout: Optional[float] = None) -> np.ndarray:
+        return self._free.get(timeout=timeout)
+
+    def release(self, buffer: np.ndarray) -> None:
+        self._free.put(buffer)
+
+
+def preprocess_into(frame: np.ndarray, out: np.ndarray, resized: np.ndarray, detector: Detector) -> Transform:
+    """
+    Same as Detector.preprocess (optional letterbox, BGR -> RGB, resize, / 255) but writes into the `out` (1, ...) tensor.
+    `resized` is a per-thread (H, W, 3) uint8 scratch buffer. Returns the transform for Detector.scale.
+    """
+    input_size = detector.input_size
+    if detector.letterbox:
+        frame, transform = letterbox(frame, input_size)
+    else:
+        h, w = frame.shape[:2]
+        transform = (input_size[1] / w, input_size[0] / h, 0.0, 0.0)
+    cv2.resize(frame, (input_size[1], input_size[0]), dst=resized)
+    cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=resized)
+    target = out[0] if detector.layout == "NHWC" else out[0].transpose(1, 2, 0)  # (H, W, C) view on the NCHW buffer
+    np.multiply(resized, np.float32(1 / 255.0), out=target, casting="unsafe")
+    return transform
+
+
+class StrideController:
+    """
+    Adaptive frame skipping: keeps one frame every `stride` so that processed frames / second stays near target_fps.
+    Live sources: the stride follows the measured source rate and pipeline throughput.
+    Offline files (`offline_fps` set): every frame is waited for, the stride only converts the file rate to target_fps.
+    """
+    def __init__(self, target_fps: float, max_stride: int = 30, offline_fps: Optional[float] = None) -> None:
+        self.target_fps = target_fps
+        self.max_stride = max_stride
+        self.offline = offline_fps is not None
+        self.stride = 1
+        if self.offline and target_fps:
+            self.stride = int(np.clip(round(offline_fps / target_fps), 1, max_stride))
+        self._source_times: deque = deque(maxlen=60)
+        self._infer_seconds: deque = deque(maxlen=30)
+
+    def on_frame(self, timestamp: float) -> None:
+        self._source_times.append(timestamp)
+
+    def on_infer(self, seconds: float) -> None:
+        self._infer_seconds.append(seconds)
+        if self.offline or len(self._source_times) < 2:
+            return
+        source_fps = (len(self._source_times) - 1) / max(self._source_times[-1] - self._source_times[0], 1e-6)
+        # The slowest of the two limits: requested rate and what the model can actually sustain
+        achievable_fps = min(self.target_fps or float("inf"), 1.0 / max(float(np.mean(self._infer_seconds)), 1e-6))
+        self.stride = int(np.clip(np.ceil(source_fps / achievable_fps), 1, self.max_stride))
+
+
+def open_source(source: str) -> cv2.VideoCapture:
+    # A plain integer is a camera index
+    capture = cv2.VideoCapture(int(source)) if source.isdigit() else cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Could not open video source {source}")
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # camera: always hand out the latest frame
+    return capture
+
+
+def run_stream(
+    source: str = "0",
+    model_path: str = MODEL_PATH,
+    conf_threshold: float = 0.25,
+    target_fps: float = 15.0,
+    realtime: bool = False,
+    show: bool = False,
+    output_video: Optional[str] = None,
+    jsonl_path: Optional[str] = None,
+    report_interval: float = 5.0,
+    max_frames: Optional[int] = None,
+    providers: Optional[List[str]] = None,
+    iou_threshold: float = 0.7,
+    backend: Optional[str] = None,
+    letterbox: bool = False,
+    num_threads: Optional[int] = None,
+) -> StageTimer:
+    # Only the infer thread calls the detector (TFLite interpreters aren't thread safe)
+    detector = Detector(model_path, backend, conf_threshold, iou_threshold, letterbox, providers, num_threads)
+    input_size = detector.input_size
+    tensor_shape = (1, input_size[0], input_size[1], 3) if detector.layout == "NHWC" else (1, 3, input_size[0], input_size[1])
+    print(f"[stream] {detector}")
+
+    capture = open_source(source)
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    is_camera = source.isdigit()
+
+    timer = StageTimer()
+    live = realtime or is_camera
+    stride = StrideController(target_fps, offline_fps=None if live else source_fps)
+    buffers = BufferPool(tensor_shape, size=4)
+    stop = threading.Event()
+
+    # Small queues: a full queue means the next stage is behind, frames get dropped instead of piling up latency
+    frames_queue: queue.Queue = queue.Queue(maxsize=2)
+    tensors_queue: queue.Queue = queue.Queue(maxsize=2)
+    results_queue: queue.Queue = queue.Queue(maxsize=4)
+
+    def put_or_stop(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get_or_stop(q: queue.Queue):
+        # None once stop is set: after shutdown the upstream sentinel may never arrive
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def capture_stage():
+        index = 0
+        start = time.perf_counter()
+        try:
+            while not stop.is_set() and (max_frames is None or index < max_frames):
+                if realtime and not is_camera:
+                    # Pace the file like a camera would deliver it
+                    delay = start + index / source_fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                t0 = time.perf_counter()
+                if not capture.grab():
+                    break
+                captured_at = time.perf_counter()
+                stride.on_frame(captured_at)
+                index += 1
+                if (index - 1) % stride.stride:
+                    timer.count("dropped")
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                timer.add("capture", time.perf_counter() - t0)
+                item = (index - 1, captured_at, frame)
+                if live:
+                    # Live source: never wait, drop the frame if preprocessing is busy
+                    try:
+                        frames_queue.put_nowait(item)
+                    except queue.Full:
+                        timer.count("dropped")
+                elif not put_or_stop(frames_queue, item):
+                    break
+        finally:
+            put_or_stop(frames_queue, None)
+
+    def preprocess_stage():
+        resized = np.empty((input_size[0], input_size[1], 3), dtype=np.uint8)
+        try:
+            while (item := get_or_stop(frames_queue)) is not None:
+                frame_index, captured_at, frame = item
+                t0 = time.perf_counter()
+                buffer = None
+                while buffer is None and not stop.is_set():
+                    try:
+                        buffer = buffers.acquire(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                if buffer is None:
+                    break
+                transform = preprocess_into(frame, buffer, resized, detector)
+                timer.add("preprocess", time.perf_counter() - t0)
+                if not put_or_stop(tensors_queue, (frame_index, captured_at, frame, buffer, transform)):
+                    buffers.release(buffer)
+                    break
+        finally:
+            put_or_stop(tensors_queue, None)
+
+    def infer_stage():
+        try:
+            while (item := get_or_stop(tensors_queue)) is not None:
+                frame_index, captured_at, frame, buffer, transform = item
+                t0 = time.perf_counter()
+                try:
+                    detections = detector.detect(buffer)[0]
+                finally:
+                    buffers.release(buffer)
+                detections = detector.scale(detections, transform, frame.shape[:2])
+                seconds = time.perf_counter() - t0
+                timer.add("infer", seconds)
+                stride.on_infer(seconds)
+                if not put_or_stop(results_queue, (frame_index, captured_at, frame, detections)):
+                    break
+        finally:
+            put_or_stop(results_queue, None)
+
+    threads = [threading.Thread(target=stage, daemon=True) for stage in (capture_stage, preprocess_stage, infer_stage)]
+    for thread in threads:
+        thread.start()
+
+    # Draw / display / write stays on the main thread (cv2.imshow has to run there on most platforms)
+    writer = None
+    jsonl_file = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+    last_report = time.perf_counter()
+    try:
+        while (item := results_queue.get()) is not None:
+            frame_index, captured_at, frame, detections = item
+            t0 = time.perf_counter()
+            if jsonl_file:
+                record = {"frame": frame_index, "time": round(captured_at, 4), "detections": np.round(detections.astype(np.float64), 3).tolist()}
+                jsonl_file.write(json.dumps(record) + "\n")
+            if show or output_video:
+                draw_detections(frame, detections)
+                if output_video:
+                    if writer is None:
+                        height, width = frame.shape[:2]
+                        writer = cv2.VideoWriter(output_video, cv2.VideoWriter_fourcc(*"mp4v"), min(source_fps, target_fps or source_fps), (width, height))
+                    writer.write(frame)
+                if show:
+                    cv2.imshow("output", frame)
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+            now = time.perf_counter()
+            timer.add("draw", now - t0)
+            timer.add("end_to_end", now - captured_at)
+
+            if now - last_report >= report_interval:
+                print(f"[stream] stride {stride.stride} | {timer.summary()}")
+                last_report = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        # Drain so no stage stays blocked on a full queue
+        for q in (frames_queue, tensors_queue, results_queue):
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+        for thread in threads:
+            thread.join(timeout=2)
+        capture.release()
+        if writer is not None:
+            writer.release()
+        if jsonl_file:
+            jsonl_file.close()
+        if show:
+            cv2.destroyAllWindows()
+
+    print(f"[stream] final: {timer.summary()}")
+    return timer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time detection on a camera index or video file.")
+    parser.add_argument("--source", type=str, default="0", help="Camera index or video path")
+    parser.add_argument("--model", type=str, default=MODEL_PATH)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold for exports without NMS")
+    parser.add_argument("--backend", type=str, default=None, choices=["onnx", "tflite"], help="Default: from the file extension")
+    parser.add_argument("--letterbox", action="store_true", help="Keep the aspect ratio (pad to the model input) instead of stretching")
+    parser.add_argument("--threads", type=int, default=None, help="Inference threads (default: runtime's choice / all cores for TFLite)")
+    parser.add_argument("--target-fps", type=float, default=15.0, help="0 = as fast as possible")
+    parser.add_argument("--realtime", action="store_true", help="Read a video file at its own frame rate, like a camera")
+    parser.add_argument("--show", action="store_true")
+    parser.add_argument("--output-video", type=str, default=None)
+    parser.add_argument("--jsonl", type=str, default=None)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    args = parser.parse_args()
+
+    run_stream(args.source, args.model, args.conf, args.target_fps, args.realtime, args.show,
+               args.output_video, args.jsonl, max_frames=args.max_frames, providers=args.providers,
+               iou_threshold=args.iou, backend=args.backend, letterbox=args.letterbox, num_threads=args.threads)
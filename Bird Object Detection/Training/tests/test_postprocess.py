@@ -0,0 +1,51 @@
+import numpy as np
+
+from postprocess import decode_yolo_head, is_raw_head, postprocess_output
+
+
+def raw_head(num_classes: int, num_anchors: int = 8400) -> np.ndarray:
+    """
+    (1, 4 + nc, N) head with two confident boxes of the last class and background everywhere else.
+    """
+    head = np.zeros((1, 4 + num_classes, num_anchors), dtype=np.float32)
+    head[0, :4] = np.array([[320.0], [320.0], [10.0], [10.0]])
+    head[0, :4, 0] = [100.0, 100.0, 40.0, 40.0]
+    head[0, :4, 1] = [400.0, 300.0, 60.0, 80.0]
+    head[0, 3 + num_classes, [0, 1]] = [0.9, 0.8]
+    return head
+
+
+def test_nms_embedded_output_is_not_raw():
+    """
+    (B, 300, 6) NMS-embedded exports keep their boxes as they are.
+    """
+    output = np.zeros((1, 300, 6), dtype=np.float32)
+    output[0, 0] = [10, 10, 50, 50, 0.9, 0]
+    assert not is_raw_head(output)
+    detections = postprocess_output(output, conf_threshold=0.25)
+    assert len(detections[0]) == 1
+
+
+def test_raw_head_layouts_are_raw():
+    """
+    (B, 4 + nc, N) and (B, N, 4 + nc) raw heads, including the two class head whose transposed shape ends in 6.
+    """
+    assert is_raw_head(raw_head(1))
+    assert is_raw_head(raw_head(2))
+    assert is_raw_head(raw_head(2).transpose(0, 2, 1))  # (1, 8400, 6)
+    assert is_raw_head(raw_head(2, num_anchors=21 * 20 * 15).transpose(0, 2, 1))  # 640 x 480 input
+
+
+def test_transposed_two_class_raw_head_is_decoded():
+    """
+    A (1, 8400, 6) raw head decodes to the same detections as its (1, 6, 8400) layout.
+    """
+    head = raw_head(2)
+    transposed = head.transpose(0, 2, 1)
+    assert transposed.shape == (1, 8400, 6)
+
+    detections = postprocess_output(transposed, conf_threshold=0.25)[0]
+    expected = decode_yolo_head(head, conf_threshold=0.25)[0]
+    assert detections.shape == (2, 6)
+    np.testing.assert_allclose(detections, expected)
+    np.testing.assert_allclose(detections[0], [80, 80, 120, 120, 0.9, 1], rtol=1e-6)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from tracker import ClassificationScheduler, SortTracker
+
+
+def test_scheduler_forgets_dropped_tracks():
+    """
+    Votes of a track the tracker dropped don't outlive it.
+    """
+    tracker = SortTracker(max_age=2, min_hits=1)
+    scheduler = ClassificationScheduler()
+    tracks = tracker.update(np.array([[10, 10, 50, 50, 0.9, 0]], dtype=np.float32))
+    scheduler.add(tracks, np.array([[0.2, 0.8]]), 0)
+    assert scheduler.label(1)[0] == 1
+
+    empty = np.zeros((0, 6), dtype=np.float32)
+    for _ in range(4):
+        tracker.update(empty)
+        scheduler.forget(tracker.dropped)
+    assert len(tracker) == 0
+    assert not scheduler.votes and not scheduler.last_frame and not scheduler.last_confidence
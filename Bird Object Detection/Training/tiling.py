@@ -0,0 +1,110 @@
+'''
+    Sliced (tiled) inference for small birds in high resolution images
+    - The image is cut into overlapping --tile-size tiles, every tile is resized to the model input and all of them
+      go through the detector as one batch
+    - A low resolution pass over the whole image (the normal infer.py input) decides which tiles can be skipped:
+      tiles without any low-res detection above --lowres-conf are never run
+    - Tile boxes are shifted back to image coordinates and merged with the low-res boxes by class aware NMS or WBF
+
+    Used by infer.py --tile-size 1280 [--tile-overlap 0.2] [--merge wbf]
+'''
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from postprocess import nms_detections, weighted_boxes_fusion
+
+
+def make_tiles(width: int, height: int, tile_size: int = 640, overlap: float = 0.2) -> np.ndarray:
+    """
+    (T, 4) xyxy tiles covering the image, neighbours overlap by `overlap` * tile_size. Edge tiles are shifted inwards
+    so every tile has the full size (unless the image is smaller than a tile).
+    """
+    def starts(length: int) -> np.ndarray:
+        if length <= tile_size:
+            return np.array([0])
+        step = max(int(tile_size * (1 - overlap)), 1)
+        positions = np.arange(0, length - tile_size, step)
+        return np.unique(np.append(positions, length - tile_size))
+
+    xs, ys = starts(width), starts(height)
+    x0, y0 = np.meshgrid(xs, ys)
+    x0, y0 = x0.ravel(), y0.ravel()
+    return np.stack([x0, y0, np.minimum(x0 + tile_size, width), np.minimum(y0 + tile_size, height)], axis=1)
+
+
+def occupied_tiles(tiles: np.ndarray, boxes: np.ndarray, margin: float = 0.5) -> np.ndarray:
+    """
+    Boolean mask of tiles intersecting at least one box, boxes are grown by `margin` * their size first
+    (low-res boxes are coarse and a bird near a tile border may sit in the neighbour).
+    """
+    if not len(boxes):
+        return np.zeros(len(tiles), dtype=bool)
+    size = boxes[:, 2:4] - boxes[:, :2]
+    grown = np.concatenate([boxes[:, :2] - size * margin, boxes[:, 2:4] + size * margin], axis=1)
+    overlaps = (
+        (grown[None, :, 0] < tiles[:, None, 2]) & (grown[None, :, 2] > tiles[:, None, 0])
+        & (grown[None, :, 1] < tiles[:, None, 3]) & (grown[None, :, 3] > tiles[:, None, 1])
+    )
+    return overlaps.any(axis=1)
+
+
+class TiledDetector:
+    """
+    run_batch: (B, ...) preprocessed tensors -> list of (N, 6) detections in model input pixels (Detector.detect)
+    preprocess: BGR image -> one tensor (detector.preprocess with the model input size / layout bound)
+    """
+    def __init__(
+        self,
+        run_batch: Callable[[np.ndarray], List[np.ndarray]],
+        preprocess: Callable[[np.ndarray], np.ndarray],
+        input_size: Tuple[int, int] = (640, 640),
+        tile_size: int = 640,
+        overlap: float = 0.2,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.5,
+        merge: str = "nms",
+        skip_empty: bool = True,
+        lowres_conf: float = 0.05,
+    ) -> None:
+        if merge not in ("nms", "wbf"):
+            raise ValueError(f"merge must be 'nms' or 'wbf', got {merge}")
+        self.run_batch = run_batch
+        self.preprocess = preprocess
+        self.input_size = input_size
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.merge = merge
+        self.skip_empty = skip_empty
+        self.lowres_conf = lowres_conf
+        self.tiles_total = 0
+        self.tiles_run = 0
+
+    def __call__(self, frame: np.ndarray, lowres_detections: np.ndarray) -> np.ndarray:
+        """
+        frame: original BGR image, lowres_detections: (N, 6) detections of the full image pass, already in image pixels
+        and filtered at lowres_conf or lower. Returns merged (M, 6) detections in image pixels.
+        """
+        height, width = frame.shape[:2]
+        tiles = make_tiles(width, height, self.tile_size, self.overlap)
+        self.tiles_total += len(tiles)
+        if self.skip_empty:
+            tiles = tiles[occupied_tiles(tiles, lowres_detections[lowres_detections[:, 4] >= self.lowres_conf, :4])]
+        self.tiles_run += len(tiles)
+
+        detections = [lowres_detections[lowres_detections[:, 4] >= self.conf_threshold]]
+        if len(tiles):
+            batch = np.stack([self.preprocess(frame[y0:y1, x0:x1]) for x0, y0, x1, y1 in tiles.tolist()])
+            for (x0, y0, x1, y1), tile_detections in zip(tiles.tolist(), self.run_batch(batch)):
+                tile_detections = tile_detections[tile_detections[:, 4] >= self.conf_threshold].astype(np.float32)
+                # Model input pixels -> tile pixels -> image pixels
+                tile_detections[:, [0, 2]] = tile_detections[:, [0, 2]] * ((x1 - x0) / self.input_size[1]) + x0
+                tile_detections[:, [1, 3]] = tile_detections[:, [1, 3]] * ((y1 - y0) / self.input_size[0]) + y0
+                detections.append(tile_detections)
+
+        merged = np.concatenate(detections).astype(np.float32)
+        if self.merge == "wbf":
+            return weighted_boxes_fusion(merged, self.iou_threshold)
+        return nms_detections(merged, self.iou_threshold)
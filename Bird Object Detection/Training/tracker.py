@@ -0,0 +1,392 @@
+'''
+    Multi-object tracking on top of the detector + species classification per track instead of per frame
+    - SORT-style tracker: constant velocity Kalman filter on [cx, cy, area, aspect], every track is predicted / updated
+      at once with batched numpy ops, detections are matched to tracks on IoU (Hungarian with scipy, greedy otherwise)
+    - A track is (re)classified only when it is new, when its detection confidence dropped since the last
+      classification, or every --classify-every frames. Class probabilities are averaged per track (confidence weighted)
+    - The classifier is the exported species ONNX model (Bird Species Classification/Training), run on batched crops
+
+    usage: python tracker.py <video> [--model ./bestfp32_nhwc.onnx] [--classifier species.onnx --labels label_mapping.csv]
+                             [--jsonl tracks.jsonl] [--output-video tracks.mp4]
+'''
+import argparse
+import csv
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detector import Detector, create_session
+from infer import MODEL_PATH, draw_detections
+from postprocess import box_iou as iou_matrix
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def assign(cost: np.ndarray, max_cost: float) -> List[Tuple[int, int]]:
+    """
+    Minimum cost matching, pairs above max_cost are rejected.
+    """
+    if cost.size == 0:
+        return []
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+    else:
+        # Greedy on the cheapest pairs first, close to Hungarian for well separated boxes
+        order = np.argsort(cost, axis=None)
+        used_rows, used_cols, rows, cols = set(), set(), [], []
+        for flat in order:
+            row, col = divmod(int(flat), cost.shape[1])
+            if row in used_rows or col in used_cols or cost[row, col] > max_cost:
+                continue
+            used_rows.add(row)
+            used_cols.add(col)
+            rows.append(row)
+            cols.append(col)
+    return [(int(r), int(c)) for r, c in zip(rows, cols) if cost[r, c] <= max_cost]
+
+
+def xyxy_to_z(boxes: np.ndarray) -> np.ndarray:
+    """
+    xyxy -> Kalman measurement [cx, cy, area, aspect ratio].
+    """
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-6)], axis=1)
+
+
+def x_to_xyxy(state: np.ndarray) -> np.ndarray:
+    area = np.maximum(state[:, 2], 1e-6)
+    w = np.sqrt(area * np.maximum(state[:, 3], 1e-6))
+    h = area / w
+    return np.stack([state[:, 0] - w / 2, state[:, 1] - h / 2, state[:, 0] + w / 2, state[:, 1] + h / 2], axis=1)
+
+
+class SortTracker:
+    """
+    All tracks live in parallel arrays: state x (T, 7) = [cx, cy, area, aspect, vx, vy, varea], covariance P (T, 7, 7).
+
+    update(detections) takes (N, 6) [x1, y1, x2, y2, score, class_id] and returns (K, 7)
+    [x1, y1, x2, y2, track_id, score, detection index] for confirmed tracks matched in this frame.
+    Ids of the tracks it dropped (unseen for more than max_age frames) are left in `dropped`.
+    """
+    # Constant velocity model, same noise setup as the original SORT
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1.0
+    H = np.eye(4, 7)
+    R = np.diag([1.0, 1.0, 10.0, 10.0])
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+    P0 = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0])
+
+    def __init__(self, max_age: int = 30, min_hits: int = 3, iou_threshold: float = 0.3) -> None:
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.frame_count = 0
+        self._next_id = 1
+
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)          # consecutive matched frames
+        self.time_since_update = np.zeros(0, dtype=np.int64)
+        self.dropped = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def predict(self) -> np.ndarray:
+        # Area can't go negative
+        shrinking = self.x[:, 6] + self.x[:, 2] <= 0
+        self.x[shrinking, 6] = 0.0
+        self.x = self.x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.time_since_update += 1
+        self.hits[self.time_since_update > 1] = 0
+        return x_to_xyxy(self.x)
+
+    def _correct(self, rows: np.ndarray, measurements: np.ndarray) -> None:
+        P = self.P[rows]
+        S = self.H @ P @ self.H.T + self.R                    # (K, 4, 4)
+        K = P @ self.H.T @ np.linalg.inv(S)                   # (K, 7, 4)
+        innovation = measurements - self.x[rows] @ self.H.T   # (K, 4)
+        self.x[rows] += np.einsum("kij,kj->ki", K, innovation)
+        self.P[rows] = (np.eye(7) - K @ self.H) @ P
+
+    def update(self, detections: np.ndarray) -> np.ndarray:
+        self.frame_count += 1
+        predicted = self.predict() if len(self) else np.zeros((0, 4))
+
+        matches = assign(1.0 - iou_matrix(detections[:, :4], predicted), 1.0 - self.iou_threshold) if len(detections) and len(predicted) else []
+        det_rows = np.array([d for d, _ in matches], dtype=np.int64)
+        track_rows = np.array([t for _, t in matches], dtype=np.int64)
+
+        if len(matches):
+            self._correct(track_rows, xyxy_to_z(detections[det_rows, :4]))
+            self.time_since_update[track_rows] = 0
+            self.hits[track_rows] += 1
+
+        # New tracks for unmatched detections
+        unmatched = np.setdiff1d(np.arange(len(detections)), det_rows)
+        if len(unmatched):
+            z = xyxy_to_z(detections[unmatched, :4])
+            self.x = np.concatenate([self.x, np.concatenate([z, np.zeros((len(z), 3))], axis=1)])
+            self.P = np.concatenate([self.P, np.repeat(self.P0[None], len(z), axis=0)])
+            new_ids = np.arange(self._next_id, self._next_id + len(z))
+            self._next_id += len(z)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.hits = np.concatenate([self.hits, np.ones(len(z), dtype=np.int64)])
+            self.time_since_update = np.concatenate([self.time_since_update, np.zeros(len(z), dtype=np.int64)])
+            det_rows = np.concatenate([det_rows, unmatched])
+            track_rows = np.concatenate([track_rows, np.arange(len(self.ids) - len(z), len(self.ids))])
+
+        # Report confirmed tracks (or everything during the first frames, like SORT)
+        confirmed = (self.hits[track_rows] >= self.min_hits) | (self.frame_count <= self.min_hits)
+        det_rows, track_rows = det_rows[confirmed], track_rows[confirmed]
+        output = np.concatenate([
+            x_to_xyxy(self.x[track_rows]),
+            self.ids[track_rows, None].astype(np.float64),
+            detections[det_rows, 4:5].astype(np.float64),
+            det_rows[:, None].astype(np.float64),
+        ], axis=1) if len(track_rows) else np.zeros((0, 7))
+
+        # Drop tracks that weren't seen for too long
+        alive = self.time_since_update <= self.max_age
+        self.dropped = self.ids[~alive]
+        if not alive.all():
+            self.x, self.P, self.ids = self.x[alive], self.P[alive], self.ids[alive]
+            self.hits, self.time_since_update = self.hits[alive], self.time_since_update[alive]
+        return output
+
+
+# ── Species classification per track ─────────────────────────────────────────
+def load_label_names(label_mapping_csv: str) -> List[str]:
+    """
+    label_mapping.csv written by the classification training (original_label, encoded_label).
+    """
+    with open(label_mapping_csv, "r", encoding="utf-8") as f:
+        rows = sorted(csv.DictReader(f), key=lambda row: int(row["encoded_label"]))
+    return [row["original_label"] for row in rows]
+
+
+class CropClassifier:
+    """
+    Species ONNX classifier on detection crops. Same preprocessing as onnx_infer.py:
+    resize the shortest edge to 256 (bicubic), center crop 224, ImageNet normalization. NHWC / NCHW from the input shape.
+    """
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    def __init__(self, model_path: str, label_names: Optional[List[str]] = None, providers: Optional[List[str]] = None,
+                 crop_padding: float = 0.1) -> None:
+        self.session = create_session(model_path, providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+        self.layout = "NCHW" if self.session.get_inputs()[0].shape[1] == 3 else "NHWC"
+        self.label_names = label_names
+        self.crop_padding = crop_padding
+        self.calls = 0
+        self.crops = 0
+
+    def preprocess(self, crop_bgr: np.ndarray, resize: int = 256, crop: int = 224) -> np.ndarray:
+        h, w = crop_bgr.shape[:2]
+        scale = resize / min(h, w)
+        resized = cv2.resize(crop_bgr, (max(crop, round(w * scale)), max(crop, round(h * scale))), interpolation=cv2.INTER_CUBIC)
+        top = (resized.shape[0] - crop) // 2
+        left = (resized.shape[1] - crop) // 2
+        rgb = cv2.cvtColor(resized[top:top + crop, left:left + crop], cv2.COLOR_BGR2RGB)
+        tensor = (rgb.astype(np.float32) / 255.0 - self.MEAN) / self.STD
+        return tensor if self.layout == "NHWC" else tensor.transpose(2, 0, 1)
+
+    def crop(self, frame: np.ndarray, box: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = box[:4]
+        pad_x, pad_y = (x2 - x1) * self.crop_padding, (y2 - y1) * self.crop_padding
+        x1, y1 = int(max(x1 - pad_x, 0)), int(max(y1 - pad_y, 0))
+        x2, y2 = int(min(x2 + pad_x, w)), int(min(y2 + pad_y, h))
+        return frame[y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)]
+
+    def __call__(self, frame: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        """
+        (K, >=4) xyxy boxes -> (K, num_classes) probabilities, one batched session.run.
+        """
+        if not len(boxes):
+            return np.zeros((0, 0), dtype=np.float32)
+        batch = np.stack([self.preprocess(self.crop(frame, box)) for box in boxes])
+        logits = self.session.run([self.output_name], {self.input_name: batch})[0]
+        self.calls += 1
+        self.crops += len(boxes)
+        exp_logits = np.exp(logits - logits.max(axis=-1, keepdims=True))  # stable softmax
+        return exp_logits / exp_logits.sum(axis=-1, keepdims=True)
+
+
+class ClassificationScheduler:
+    """
+    Decides which tracks need the classifier this frame and aggregates their votes.
+    """
+    def __init__(self, every_n: int = 30, confidence_drop: float = 0.15) -> None:
+        self.every_n = every_n
+        self.confidence_drop = confidence_drop
+        self.votes: Dict[int, np.ndarray] = {}          # summed, confidence weighted probabilities
+        self.last_frame: Dict[int, int] = {}
+        self.last_confidence: Dict[int, float] = {}
+
+    def due(self, tracks: np.ndarray, frame_index: int) -> np.ndarray:
+        """
+        Boolean mask over tracks (rows of SortTracker.update) that should be classified now.
+        """
+        mask = np.zeros(len(tracks), dtype=bool)
+        for i, (track_id, score) in enumerate(zip(tracks[:, 4].astype(np.int64).tolist(), tracks[:, 5].tolist())):
+            if track_id not in self.votes:
+                mask[i] = True  # new track
+            elif score < self.last_confidence[track_id] - self.confidence_drop:
+                mask[i] = True  # detection got worse (occlusion, pose change): the old vote may be wrong
+            elif frame_index - self.last_frame[track_id] >= self.every_n:
+                mask[i] = True
+        return mask
+
+    def add(self, tracks: np.ndarray, probabilities: np.ndarray, frame_index: int) -> None:
+        for track_id, score, probs in zip(tracks[:, 4].astype(np.int64).tolist(), tracks[:, 5].tolist(), probabilities):
+            self.votes[track_id] = self.votes.get(track_id, 0) + probs * score
+            self.last_frame[track_id] = frame_index
+            self.last_confidence[track_id] = score
+
+    def label(self, track_id: int) -> Tuple[int, float]:
+        """
+        (class id, mean probability of that class) of a track, (-1, 0) if it was never classified.
+        """
+        votes = self.votes.get(track_id)
+        if votes is None:
+            return -1, 0.0
+        class_id = int(np.argmax(votes))
+        return class_id, float(votes[class_id] / max(votes.sum(), 1e-9))
+
+    def forget(self, track_ids: np.ndarray) -> None:
+        """
+        Drop the state of tracks the tracker gave up on, ids are never reused.
+        """
+        for track_id in track_ids.tolist():
+            self.votes.pop(track_id, None)
+            self.last_frame.pop(track_id, None)
+            self.last_confidence.pop(track_id, None)
+
+
+def track_video(
+    source: str,
+    model_path: str = MODEL_PATH,
+    classifier_path: Optional[str] = None,
+    labels_path: Optional[str] = None,
+    conf_threshold: float = 0.25,
+    classify_every: int = 30,
+    confidence_drop: float = 0.15,
+    jsonl_path: Optional[str] = None,
+    output_video: Optional[str] = None,
+    providers: Optional[List[str]] = None,
+    iou_threshold: float = 0.7,
+    backend: Optional[str] = None,
+    letterbox: bool = False,
+    num_threads: Optional[int] = None,
+) -> dict:
+    detector = Detector(model_path, backend, conf_threshold, iou_threshold, letterbox, providers, num_threads)
+
+    tracker = SortTracker()
+    scheduler = ClassificationScheduler(classify_every, confidence_drop)
+    classifier = CropClassifier(classifier_path, providers=providers) if classifier_path else None
+    label_names = load_label_names(labels_path) if labels_path else None
+
+    capture = cv2.VideoCapture(int(source)) if source.isdigit() else cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Could not open video source {source}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+
+    jsonl_file = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+    writer = None
+    frame_index = 0
+    total_detections = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            detections = detector([frame])[0]
+            total_detections += len(detections)
+            tracks = tracker.update(detections)
+            scheduler.forget(tracker.dropped)
+
+            if classifier is not None and len(tracks):
+                due = scheduler.due(tracks, frame_index)
+                if due.any():
+                    scheduler.add(tracks[due], classifier(frame, tracks[due]), frame_index)
+
+            records = []
+            for x1, y1, x2, y2, track_id, score, det_index in tracks.tolist():
+                class_id, class_confidence = scheduler.label(int(track_id))
+                records.append({
+                    "track_id": int(track_id),
+                    "box": [round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1)],
+                    "score": round(score, 4),
+                    "species": (label_names[class_id] if label_names and class_id >= 0 else class_id),
+                    "species_confidence": round(class_confidence, 4),
+                })
+            if jsonl_file:
+                jsonl_file.write(json.dumps({"frame": frame_index, "tracks": records}) + "\n")
+            if output_video:
+                if writer is None:
+                    writer = cv2.VideoWriter(output_video, cv2.VideoWriter_fourcc(*"mp4v"), fps, frame.shape[1::-1])
+                draw_detections(frame, detections)
+                for record in records:
+                    x1, y1 = int(record["box"][0]), int(record["box"][1])
+                    cv2.putText(frame, f"#{record['track_id']} {record['species']}", (x1 + 5, max(y1 - 5, 12)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 2)
+                writer.write(frame)
+            frame_index += 1
+    finally:
+        capture.release()
+        if writer is not None:
+            writer.release()
+        if jsonl_file:
+            jsonl_file.close()
+
+    elapsed = time.perf_counter() - start
+    minutes = frame_index / fps / 60
+    summary = {
+        "frames": frame_index,
+        "tracks": tracker._next_id - 1,
+        "detections": total_detections,
+        "classifier_calls": classifier.calls if classifier else 0,
+        "classified_crops": classifier.crops if classifier else 0,
+    }
+    print(f"{frame_index} frames in {elapsed:.1f}s, {summary['tracks']} tracks, {total_detections} detections")
+    if classifier:
+        print(f"Classified {classifier.crops} crops in {classifier.calls} batches "
+              f"({classifier.crops / max(minutes, 1e-9):.0f} crops / video minute, per-frame classification would need {total_detections})")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track birds across video frames and classify each track.")
+    parser.add_argument("source", type=str, help="Video path or camera index")
+    parser.add_argument("--model", type=str, default=MODEL_PATH)
+    parser.add_argument("--classifier", type=str, default=None, help="Species ONNX model, tracking only if not set")
+    parser.add_argument("--labels", type=str, default=None, help="label_mapping.csv of the species model")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold for exports without NMS")
+    parser.add_argument("--backend", type=str, default=None, choices=["onnx", "tflite"], help="Default: from the file extension")
+    parser.add_argument("--letterbox", action="store_true", help="Keep the aspect ratio (pad to the model input) instead of stretching")
+    parser.add_argument("--threads", type=int, default=None, help="Inference threads (default: runtime's choice / all cores for TFLite)")
+    parser.add_argument("--classify-every", type=int, default=30, help="Re-classify a track every n frames")
+    parser.add_argument("--confidence-drop", type=float, default=0.15, help="Re-classify when the detection score drops by this much")
+    parser.add_argument("--jsonl", type=str, default=None)
+    parser.add_argument("--output-video", type=str, default=None)
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    args = parser.parse_args()
+
+    track_video(args.source, args.model, args.classifier, args.labels, args.conf, args.classify_every,
+                args.confidence_drop, args.jsonl, args.output_video, args.providers, args.iou, args.backend, args.letterbox,
+                args.threads)
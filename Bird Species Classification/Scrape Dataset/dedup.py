@@ -0,0 +1,186 @@
+'''
+    Find exact and near duplicate images
+    - Exact: files are grouped by size, then by a hash of the first 64 KB, and only the remaining candidates get a full blake2b digest
+    - Near: 64-bit dHash (perceptual hash) per image, pairs within a Hamming distance are found with a BK-tree
+      instead of comparing all pairs
+    Hashing runs in a process pool.
+
+    usage: python dedup.py <folder> [<folder> ...] [--threshold 6] [--report duplicates.json]
+'''
+import argparse
+import hashlib
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff")
+HEAD_BYTES = 64 * 1024
+
+
+def list_images(folders: Iterable[str]) -> List[str]:
+    paths = []
+    for folder in folders:
+        for root, _dirs, files in os.walk(folder):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths
+
+
+def head_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(HEAD_BYTES), digest_size=16).hexdigest()
+
+
+def full_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dhash(path: str, hash_size: int = 8) -> Optional[int]:
+    """
+    Difference hash: compare neighbouring pixels of a (hash_size + 1) x hash_size grayscale thumbnail.
+    Robust to re-encoding and resizing. Returns None if the image can't be decoded.
+    """
+    try:
+        with Image.open(path) as image:
+            # draft() lets JPEG decode at a reduced scale, much faster for large photos
+            image.draft("L", (hash_size * 8, hash_size * 8))
+            pixels = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).tobytes()
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _groups_with_duplicates(keys: Dict[str, list]) -> List[list]:
+    return [paths for paths in keys.values() if len(paths) > 1]
+
+
+def find_exact_duplicates(paths: List[str], executor: ProcessPoolExecutor) -> List[List[str]]:
+    """
+    Returns groups of byte-identical files. Size -> head hash -> full digest, each stage only sees the previous stage's collisions.
+    """
+    by_size: Dict[int, list] = defaultdict(list)
+    for path in paths:
+        by_size[os.path.getsize(path)].append(path)
+    candidates = [path for group in _groups_with_duplicates(by_size) for path in group]
+
+    by_head: Dict[Tuple[int, str], list] = defaultdict(list)
+    for path, digest in zip(candidates, executor.map(head_hash, candidates, chunksize=64)):
+        by_head[(os.path.getsize(path), digest)].append(path)
+    candidates = [path for group in _groups_with_duplicates(by_head) for path in group]
+
+    by_digest: Dict[str, list] = defaultdict(list)
+    for path, digest in zip(candidates, executor.map(full_hash, candidates, chunksize=16)):
+        by_digest[digest].append(path)
+    return _groups_with_duplicates(by_digest)
+
+
+class BKTree:
+    """
+    Metric tree over Hamming distance. Range queries only visit children whose edge distance can still
+    be within the threshold (triangle inequality), so lookups are far below O(n).
+    """
+    def __init__(self) -> None:
+        self.root: Optional[list] = None  # [hash, items, {distance: child}]
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        return (a ^ b).bit_count()
+
+    def add(self, value: int, item) -> None:
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = self.distance(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value: int, threshold: int) -> List[Tuple[int, object]]:
+        """
+        Returns (distance, item) for every stored item within `threshold` of `value`.
+        """
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = self.distance(value, node[0])
+            if d <= threshold:
+                results.extend((d, item) for item in node[1])
+            for edge, child in node[2].items():
+                if d - threshold <= edge <= d + threshold:
+                    stack.append(child)
+        return results
+
+
+def find_near_duplicates(paths: List[str], executor: ProcessPoolExecutor, threshold: int = 6) -> List[List[str]]:
+    """
+    Groups images whose dHash differs in at most `threshold` bits (connected components).
+    """
+    hashes = list(executor.map(dhash, paths, chunksize=32))
+
+    tree = BKTree()
+    parent = list(range(len(paths)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Query before inserting: every pair is found exactly once
+    for i, value in enumerate(hashes):
+        if value is None:
+            continue
+        for _distance, j in tree.query(value, threshold):
+            parent[find(i)] = find(j)  # type: ignore
+        tree.add(value, i)
+
+    groups: Dict[int, list] = defaultdict(list)
+    for i, value in enumerate(hashes):
+        if value is not None:
+            groups[find(i)].append(paths[i])
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(folders: Iterable[str], threshold: int = 6, workers: Optional[int] = None) -> dict:
+    paths = list_images(folders)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        exact = find_exact_duplicates(paths, executor)
+        near = find_near_duplicates(paths, executor, threshold) if threshold >= 0 else []
+    return {"images": len(paths), "exact": exact, "near": near}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find exact and near duplicate images.")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--threshold", type=int, default=6, help="Max dHash Hamming distance for near duplicates, -1 to disable")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--report", type=str, default=None, help="Write the duplicate groups to this JSON file")
+    args = parser.parse_args()
+
+    result = find_duplicates(args.folders, args.threshold, args.workers)
+    print(f"Scanned {result['images']} images: {len(result['exact'])} exact duplicate groups, "
+          f"{len(result['near'])} near duplicate groups")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,193 @@
+'''
+    Concurrent image downloader shared by the scrapers
+    - One connection-pooled aiohttp session for the whole run
+    - Bounded queue feeding a fixed number of workers (submit() waits when the queue is full)
+    - Per-host rate limit (max connections + min interval between requests)
+    - Bodies are streamed to a .part file in chunks, file I/O runs in a thread so the event loop never blocks
+    - Optional on_complete(url, file_path) callback once a file is written (or already there), e.g. to record progress
+'''
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import urlparse
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0 Safari/537.36"
+
+
+@dataclass
+class DownloadStats:
+    queued: int = 0
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (f"{self.completed}/{self.queued} downloaded, {self.failed} failed, {self.skipped} skipped, "
+                f"{self.bytes / 2**20:.1f} MB in {elapsed:.1f}s ({self.bytes / 2**20 / max(elapsed, 1e-9):.2f} MB/s, "
+                f"{self.completed / max(elapsed, 1e-9):.1f} img/s)")
+
+
+class HostRateLimiter:
+    """
+    Keeps at least `interval` seconds between request starts to the same host.
+    """
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next_slot: Dict[str, float] = {}
+
+    async def wait(self, host: str) -> None:
+        if self.interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class ImageDownloader:
+    """
+    usage:
+        async with ImageDownloader(workers=32) as downloader:
+            await downloader.submit(url, file_path)
+        # leaving the block waits for every queued download
+    """
+    def __init__(
+        self,
+        workers: int = 32,
+        queue_size: int = 512,
+        per_host_connections: int = 4,
+        per_host_interval: float = 0.1,
+        timeout: float = 30,
+        retries: int = 3,
+        chunk_size: int = 64 * 1024,
+        progress_interval: float = 10,
+        skip_existing: bool = True,
+        headers: Optional[dict] = None,
+        session: Optional[ClientSession] = None,
+        on_complete: Optional[Callable[[str, str], None]] = None,
+    ) -> None:
+        self.workers = workers
+        self.per_host_connections = per_host_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.skip_existing = skip_existing
+        self.headers = headers or {"User-Agent": USER_AGENT}
+        self.stats = DownloadStats()
+        self.failed: Set[str] = set()  # file paths that could not be downloaded
+        self.rejected: Set[str] = set()  # subset of failed: client errors (404, 403...) that retrying won't fix
+        self.on_complete = on_complete
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._rate_limiter = HostRateLimiter(per_host_interval)
+        self._session = session
+        self._owns_session = session is None
+        self._tasks: list = []
+
+    async def __aenter__(self) -> "ImageDownloader":
+        if self._session is None:
+            connector = TCPConnector(ssl=False, limit=self.workers, limit_per_host=self.per_host_connections, ttl_dns_cache=300)
+            self._session = ClientSession(timeout=ClientTimeout(total=self.timeout), connector=connector, headers=self.headers)
+        self.stats = DownloadStats()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.progress_interval > 0:
+            self._tasks.append(asyncio.create_task(self._report_progress()))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            # Drain the queue on a normal exit, drop pending work on errors / cancellation
+            if exc_type is None:
+                await self._queue.join()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            if self._owns_session and self._session is not None:
+                await self._session.close()
+            print(f"Downloads: {self.stats.summary()}")
+
+    async def submit(self, url: str, file_path: str) -> None:
+        """
+        Queue a download. Only waits when the queue is full.
+        """
+        self.stats.queued += 1
+        await self._queue.put((url, file_path))
+
+    async def _worker(self) -> None:
+        while True:
+            url, file_path = await self._queue.get()
+            try:
+                if self.skip_existing and os.path.exists(file_path):
+                    self.stats.skipped += 1
+                elif await self.download(url, file_path):
+                    self.stats.completed += 1
+                else:
+                    self.stats.failed += 1
+                    self.failed.add(file_path)
+                    continue
+                if self.on_complete is not None:
+                    try:
+                        self.on_complete(url, file_path)
+                    except Exception as e:
+                        # The file is written, a failing callback must not take the worker down with it
+                        print(f"Error in on_complete for {file_path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            print(f"[downloader] {self.stats.summary()}, {self._queue.qsize()} waiting")
+
+    async def download(self, url: str, file_path: str) -> bool:
+        """
+        Download `url` to `file_path` with retries and exponential backoff. Returns True on success.
+        """
+        assert self._session is not None, "use ImageDownloader inside 'async with'"
+        host = urlparse(url).netloc
+        tmp_path = file_path + ".part"
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                await self._rate_limiter.wait(host)
+                async with self._session.get(url) as response:
+                    # Client errors (except rate limiting) won't change on retry
+                    if 400 <= response.status < 500 and response.status != 429:
+                        print(f"Failed to download image from {url}. Status: {response.status}")
+                        self.rejected.add(file_path)
+                        return False
+                    if response.status != 200:
+                        raise IOError(f"status {response.status}")
+
+                    f = await asyncio.to_thread(open, tmp_path, "wb")
+                    try:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            await asyncio.to_thread(f.write, chunk)
+                            self.stats.bytes += len(chunk)
+                    finally:
+                        await asyncio.to_thread(f.close)
+
+                await asyncio.to_thread(os.replace, tmp_path, file_path)
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error downloading image from {url}: {e} (attempt {attempt}/{self.retries})")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if attempt < self.retries:
+                    await asyncio.sleep(2**attempt)  # Exponential backoff for retries
+
+        print(f"Failed to download image from {url} after {self.retries} attempts.")
+        return False
@@ -1,63 +1,204 @@
 '''
     Scrape Bird Images from Inaturalist API to output_dir (inaturalist_images)
     You need to manually compare if downloaded images from regular scrape from google image search is same as inaturalist result or just add some code
-    Note: downloaded link is not saved automatically to json like playwright_scrape
+
+    - Observations are paged with id_above (ascending id) up to --per-species photos per species
+    - API requests share one pooled session and a global rate limit, photos download concurrently on ImageDownloader
+    - Every queued photo is recorded in inaturalist_images/manifest.jsonl and marked completed once its file is written,
+      reruns skip photos that are already there, retry the ones that never completed (even after moves.py sorted the
+      downloaded files away) and continue each species' pagination from the last observation seen
+
+    usage: python inaturalist_scrape.py [--per-species 50] [--species-concurrency 4]
 '''
-import requests
+import argparse
+import asyncio
+import json
 import os
-from urllib.parse import quote
-from pathlib import Path
+from typing import Dict, Set
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from bird_species import bird_species
+from downloader import HostRateLimiter, ImageDownloader, USER_AGENT
+
+API_URL = "https://api.inaturalist.org/v1/observations"
+MAX_PER_PAGE = 200  # API limit
 
 # Create an output folder
 current_file = os.path.abspath(__file__)
 current_dir = os.path.dirname(current_file)
 output_dir = os.path.join(current_dir, "inaturalist_images")
-os.makedirs(output_dir, exist_ok=True) 
+manifest_path = os.path.join(output_dir, "manifest.jsonl")
 
-def download_image(url, filename):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(filename, "wb") as f:
-                f.write(response.content)
-            print(f"Saved {filename}")
-        else:
-            print(f"Failed to download {url}")
-    except Exception as e:
-        print(f"Error downloading {url}: {e}")
-
-def fetch_and_download_images(species_entry, max_images=5):
+
+def scientific_name_of(species_entry):
     # Extract just the scientific name in parentheses
     if "(" in species_entry and ")" in species_entry:
-        scientific_name = species_entry.split("(")[-1].split(")")[0]
-    else:
-        scientific_name = species_entry
+        return species_entry.split("(")[-1].split(")")[0]
+    return species_entry
+
+
+class PhotoManifest:
+    """
+    Append-only JSON-lines record of every queued photo, followed by a {"completed": photo_id} line once its file is written.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.photo_ids: Set[int] = set()
+        self.count: Dict[str, int] = {}
+        self.last_observation_id: Dict[str, int] = {}
+        self.missing: list = []  # records whose download never completed (interrupted run / failed download)
+        self._photo_by_file: Dict[str, int] = {}
+
+        records, completed = [], set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if "completed" in record:
+                            completed.add(record["completed"])
+                        else:
+                            records.append(record)
+        self._file = open(path, "a", encoding="utf-8")
 
-    print(f"\nFetching: {scientific_name}")
+        for record in records:
+            self._track(record)
+            if record["photo_id"] in completed:
+                continue
+            # Manifests written before completion lines existed: a file on disk means the download finished
+            if os.path.exists(record["file"]):
+                self.complete(record["url"], record["file"])
+            else:
+                self.missing.append(record)
 
+    def _track(self, record: dict) -> None:
+        name = record["scientific_name"]
+        self.photo_ids.add(record["photo_id"])
+        self.count[name] = self.count.get(name, 0) + 1
+        self.last_observation_id[name] = max(self.last_observation_id.get(name, 0), record["observation_id"])
+        self._photo_by_file[record["file"]] = record["photo_id"]
+
+    def add(self, record: dict) -> None:
+        self._track(record)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def complete(self, _url: str, file_path: str) -> None:
+        """
+        ImageDownloader on_complete callback: the photo won't be retried on later runs, wherever its file moves to.
+        """
+        photo_id = self._photo_by_file.get(file_path)
+        if photo_id is not None and not self._file.closed:
+            self._file.write(json.dumps({"completed": photo_id}) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def fetch_observations(session: ClientSession, rate_limiter: HostRateLimiter, scientific_name: str,
+                             id_above: int, per_page: int) -> list:
     params = {
         "taxon_name": scientific_name,
         "photos": "true",
-        "per_page": 5, 
-        "order_by": "created_at"
+        "per_page": per_page,
+        "order_by": "id",
+        "order": "asc",
+        "id_above": id_above,
     }
+    for attempt in range(1, 4):
+        await rate_limiter.wait("api")
+        try:
+            async with session.get(API_URL, params=params) as response:
+                if response.status == 200:
+                    return (await response.json()).get("results", [])
+                print(f"Observations request for {scientific_name} failed with status {response.status}")
+        except Exception as e:
+            print(f"Error fetching observations for {scientific_name}: {e}")
+        await asyncio.sleep(2**attempt)
+    return []
+
+
+async def fetch_and_download_images(session: ClientSession, rate_limiter: HostRateLimiter, downloader: ImageDownloader,
+                                    manifest: PhotoManifest, species_entry: str, max_images=5):
+    scientific_name = scientific_name_of(species_entry)
+    count = manifest.count.get(scientific_name, 0)
+    # Resume at the last observation seen, not after it: the previous quota may have stopped halfway through its photos
+    # (photos already in the manifest are skipped)
+    id_above = max(manifest.last_observation_id.get(scientific_name, 0) - 1, 0)
+    if count >= max_images:
+        return
 
-    response = requests.get("https://api.inaturalist.org/v1/observations", params=params)
-    results = response.json().get("results", [])
+    print(f"Fetching: {scientific_name} ({count}/{max_images} already downloaded)")
 
-    count = 0
-    for obs in results:
-        for photo in obs.get("photos", []):
+    while count < max_images:
+        results = await fetch_observations(session, rate_limiter, scientific_name, id_above,
+                                           per_page=min(MAX_PER_PAGE, max_images - count))
+        if not results:
+            break
+
+        for obs in results:
+            for photo in obs.get("photos", []):
+                if count >= max_images:
+                    break
+                if photo["id"] in manifest.photo_ids:
+                    continue
+
+                url = photo["url"].replace("square", "large")  # higher quality
+                filename = os.path.join(output_dir, f"{scientific_name.replace(' ', '_')}_{photo['id']}.jpg")
+                manifest.add({
+                    "species": species_entry,
+                    "scientific_name": scientific_name,
+                    "observation_id": obs["id"],
+                    "photo_id": photo["id"],
+                    "url": url,
+                    "file": filename,
+                    "license": photo.get("license_code"),
+                    "attribution": photo.get("attribution"),
+                    "observed_on": obs.get("observed_on"),
+                    "quality_grade": obs.get("quality_grade"),
+                })
+                await downloader.submit(url, filename)
+                count += 1
             if count >= max_images:
                 break
-            url = photo["url"].replace("square", "large")  # higher quality
-            filename= os.path.join(output_dir, f"{scientific_name.replace(' ', '_')}_{count+1}.jpg")
-            download_image(url, filename)
-            count += 1
-        if count >= max_images:
-            break
+            # Only past an observation once all of its photos are queued
+            id_above = max(id_above, obs["id"])
+
+    print(f"Done: {scientific_name} ({count} photos)")
+
+
+async def main(per_species=5, species_concurrency=4, api_interval=1.0, download_workers=16):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = PhotoManifest(manifest_path)
+
+    # iNaturalist asks for at most ~1 API request per second, shared by every species task
+    rate_limiter = HostRateLimiter(api_interval)
+    semaphore = asyncio.Semaphore(species_concurrency)
+
+    connector = TCPConnector(limit=download_workers + species_concurrency, ttl_dns_cache=300)
+    try:
+        async with ClientSession(timeout=ClientTimeout(total=60), connector=connector, headers={"User-Agent": USER_AGENT}) as session:
+            async with ImageDownloader(workers=download_workers, session=session, on_complete=manifest.complete) as downloader:
+                # Photos recorded by an earlier run whose download never completed
+                for record in manifest.missing:
+                    await downloader.submit(record["url"], record["file"])
+
+                async def run(species):
+                    async with semaphore:
+                        await fetch_and_download_images(session, rate_limiter, downloader, manifest, species, per_species)
+
+                await asyncio.gather(*[run(species) for species in bird_species])
+    finally:
+        # After the downloader drained its queue, so the last completions are recorded
+        manifest.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download bird photos from the iNaturalist API.")
+    parser.add_argument("--per-species", type=int, default=5, help="Photo quota per species")
+    parser.add_argument("--species-concurrency", type=int, default=4)
+    parser.add_argument("--api-interval", type=float, default=1.0, help="Seconds between API requests")
+    parser.add_argument("--download-workers", type=int, default=16)
+    args = parser.parse_args()
 
-# Run for each species
-for species in bird_species:
-    fetch_and_download_images(species)
+    asyncio.run(main(args.per_species, args.species_concurrency, args.api_interval, args.download_workers))
@@ -1,9 +1,12 @@
 '''
     Move inaturalist image to destination directory
-    Todo: Need to actually compare raw bytes to check if the file is the same or not
+    Files whose bytes already exist in the destination folder are skipped (size prefilter, then blake2b digest).
+    For near duplicates (re-encoded / resized copies) run dedup.py on the merged folders.
 '''
 import os
 import shutil
+from collections import defaultdict
+from dedup import full_hash
 
 # ==== CONFIG ====
 dry_run = False  # Set to False to actually move files
@@ -25,6 +28,35 @@ for folder in os.listdir(dst_root_folder):
             sci_name_key = sci_name_original.lower()
             scientific_to_folder[sci_name_key] = os.path.join(dst_root_folder, folder)
 
+# Lazily built per destination folder: size -> {digest}, only files with a matching size are ever hashed
+folder_sizes = {}
+folder_digests = {}
+
+def is_duplicate(src_path, dst_folder):
+    if dst_folder not in folder_sizes:
+        sizes = defaultdict(list)
+        for name in os.listdir(dst_folder):
+            path = os.path.join(dst_folder, name)
+            if os.path.isfile(path):
+                sizes[os.path.getsize(path)].append(path)
+        folder_sizes[dst_folder] = sizes
+        folder_digests[dst_folder] = {}
+
+    size = os.path.getsize(src_path)
+    candidates = folder_sizes[dst_folder].get(size)
+    if not candidates:
+        return False
+    digests = folder_digests[dst_folder]
+    if size not in digests:
+        digests[size] = {full_hash(path) for path in candidates}
+    return full_hash(src_path) in digests[size]
+
+def record_move(dst_path, dst_folder):
+    size = os.path.getsize(dst_path)
+    folder_sizes[dst_folder][size].append(dst_path)
+    if size in folder_digests[dst_folder]:
+        folder_digests[dst_folder][size].add(full_hash(dst_path))
+
 # Track skipped files
 skipped = []
 
@@ -48,10 +80,13 @@ for filename in os.listdir(src_folder):
         src_path = os.path.join(src_folder, filename)
         dst_path = os.path.join(dst_folder, filename)
 
-        if dry_run:
+        if is_duplicate(src_path, dst_folder):
+            skipped.append((filename, "Exact duplicate already in destination"))
+        elif dry_run:
             print(f"[Dry Run] Would move: {filename} -> {dst_folder}")
         else:
             shutil.move(src_path, dst_path)
+            record_move(dst_path, dst_folder)
             print(f"Moved: {filename} -> {dst_folder}")
     else:
         skipped.append((filename, f"No folder for scientific name '{sci_name_key}'"))
@@ -1,16 +1,37 @@
 '''
     Scrape birds image according to bird species array on google image search
     original source: https://scrapingant.com/blog/how-to-scrape-google-images
+
+    A pool of browser contexts / pages works through a species queue, downloads run on a shared pooled downloader.
+    Progress is checkpointed after every species, rerun with --resume <download folder> to continue where it stopped.
+    Resumes re-queue unfinished downloads, except those rejected by the server (404 ...) or failed in 3 runs.
+    --search-url can point to a local static HTML fixture server (python -m http.server) for testing.
+
+    usage: python playwright_scrape.py [--pages 4] [--max-images 8] [--resume downloads/bird_images_20250604_164500]
 '''
+import argparse
 import asyncio
 from datetime import datetime
 import json
 import os
-import shutil
-from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from typing import Dict, List, Optional, Set
 from urllib.parse import urlparse, urlencode
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
 from bird_species import bird_species
+from downloader import ImageDownloader
+
+GOOGLE_SEARCH_URL = "https://www.google.com/search"
+MOSAIC_SELECTOR = 'div[data-id="mosaic"]'
+IMAGE_ELEMENT_SELECTOR = 'div[data-attrid="images universal"]'
+PREVIEW_IMAGE_SELECTOR = "img.sFlh5c.FyHeAf.iPVvYb[jsaction]"
+SOURCE_LINK_SELECTOR = '(//div[@jsname="figiqf"]/a[@class="YsLeY"])[2]'
+PROGRESS_FILE = "progress.json"
+MAX_DOWNLOAD_RUNS = 3  # Runs that may retry a failed download before a resume gives up on it
+# The preview node stays in the page between clicks, a click is done once its src differs from the previous image
+PREVIEW_CHANGED = """([selector, previous]) => {
+    const img = document.querySelector(selector);
+    return img !== null && !!img.getAttribute("src") && img.getAttribute("src") !== previous;
+}"""
 
 
 def clean_filename(name):
@@ -26,152 +47,235 @@ def extract_domain(url):
         domain = domain[4:]
     return domain
 
-# Function to download an image with retry logic
-async def download_image(session: ClientSession, img_url, file_path, retries=3):
-    attempt = 0
-    while attempt < retries:
-        try:
-            # Attempt to download the image
-            async with session.get(img_url) as response:
-                if response.status == 200:
-                    # Write the image content to the file
-                    with open(file_path, "wb") as f:
-                        f.write(await response.read())
-                    return
-                else:
-                    print(f"Failed to download image from {img_url}. Status: {response.status}")
-        except Exception as e:
-            print(f"Error downloading image from {img_url}: {e}")
-        attempt += 1
-        # Retry if the maximum number of attempts has not been reached
-        if attempt < retries:
-            print(f"Retrying download for {img_url} (attempt {attempt + 1}/{retries})")
-            await asyncio.sleep(2**attempt)  # Exponential backoff for retries
-    print(f"Failed to download image from {img_url} after {retries} attempts.")
-
-# Function to scroll to the bottom of the page
-async def scroll_to_bottom(page):
-    previous_height = await page.evaluate("document.body.scrollHeight")
-    i = 0
-    while True:
-        # Scroll to the bottom of the page
+# Function to scroll to the bottom of the page, waits for the page to grow instead of sleeping
+async def scroll_to_bottom(page: Page, max_scrolls=3, timeout=3000):
+    for _ in range(max_scrolls):
+        previous_height = await page.evaluate("document.body.scrollHeight")
         await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        await asyncio.sleep(1)
-        new_height = await page.evaluate("document.body.scrollHeight")
-        i += 1
-        if new_height == previous_height or i == 1:
+        try:
+            await page.wait_for_function("h => document.body.scrollHeight > h", arg=previous_height, timeout=timeout)
+        except PlaywrightTimeoutError:
+            # Nothing more was loaded
             break
-        previous_height = new_height
 
-# Main function to scrape Google Images
-async def scrape_google_images(search_query="macbook m3", max_images=None, timeout_duration=10):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)  # Launch a Chromium browser
-        page = await browser.new_page()  # Open a new browser page
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+class ScrapeProgress:
+    """
+    Completed species, image metadata and failed download counts, saved to the download folder after every species.
+    """
+    def __init__(self, download_folder: str) -> None:
+        self.path = os.path.join(download_folder, PROGRESS_FILE)
+        self.completed: List[str] = []
+        self.metadata: dict = {}
+        self.failed_downloads: Dict[str, int] = {}  # image file -> runs in which its download failed
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            self.completed = state.get("completed", [])
+            self.metadata = state.get("metadata", {})
+            self.failed_downloads = state.get("failed_downloads", {})
 
-        current_file = os.path.abspath(__file__)
-        current_dir = os.path.dirname(current_file)
+    def should_download(self, image_file: str) -> bool:
+        return not os.path.exists(image_file) and self.failed_downloads.get(image_file, 0) < MAX_DOWNLOAD_RUNS
 
-        # Use it in your paths
-        download_folder = os.path.join(current_dir, "downloads", f"bird_images_{timestamp}")
-        os.makedirs(download_folder) 
-        json_file_path = os.path.join(download_folder, f"birds_metadata_{timestamp}.json")
+    def record_failures(self, failed: Set[str], rejected: Set[str]) -> None:
+        """
+        Count this run's failed downloads. Rejected ones (client errors) are given up on right away.
+        """
+        if not failed:
+            return
+        for image_file in failed:
+            attempts = MAX_DOWNLOAD_RUNS if image_file in rejected else self.failed_downloads.get(image_file, 0) + 1
+            self.failed_downloads[image_file] = attempts
+        self.save()
 
-        # Initialize the JSON file to store image metadata
-        with open(json_file_path, "w") as json_file:
-            json.dump({}, json_file)
+    def mark_done(self, species: str, species_key: str, images: List[dict]) -> None:
+        self.metadata[species_key] = images
+        self.completed.append(species)
+        self.save()
 
-        image_data_list = {}
+    def save(self) -> None:
+        # Write then rename so a crash mid-write never corrupts the checkpoint
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"completed": self.completed, "metadata": self.metadata, "failed_downloads": self.failed_downloads}, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+# Scrape one species on an already open page
+async def scrape_species(page: Page, species: str, download_folder: str, downloader: ImageDownloader,
+                         search_url: str, max_images=None, max_scrolls=3, timeout_duration=10):
+    common_name = species.split('(')[0].strip()
+    latin_name = species.split('(')[1].replace(')', '').strip()
+    clean_common = clean_filename(common_name)
+    clean_latin = clean_filename(latin_name)
+
+    output_dir = os.path.join(download_folder, f"{clean_common}__{clean_latin}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Build the Google Images search URL with the query
+    query_names = f"{common_name} {latin_name}"
+    query_params = urlencode({"q": query_names, "tbm": "isch"})
+    await page.goto(f"{search_url}?{query_params}", wait_until="domcontentloaded")
+
+    # Wait for the image section to appear, then scroll to load more images
+    await page.wait_for_selector(MOSAIC_SELECTOR, timeout=timeout_duration * 1000)
+    await scroll_to_bottom(page, max_scrolls=max_scrolls)
+
+    # Find all image elements on the page
+    image_elements = await page.query_selector_all(IMAGE_ELEMENT_SELECTOR)
+    print(f"[{common_name}] Found {len(image_elements)} image elements on the page.")
+
+    images = []
+    seen_urls = set()
+    previous_url = None
+    for idx, image_element in enumerate(image_elements):
+        if max_images is not None and len(images) >= max_images:
+            break
         try:
-            for index, species in enumerate(bird_species):
-                try:
-                    common_name = species.split('(')[0].strip()
-                    latin_name = species.split('(')[1].replace(')', '').strip()
-                    clean_common = clean_filename(common_name)
-                    clean_latin = clean_filename(latin_name)
-
-                    output_dir = os.path.join(download_folder, f"{clean_common}__{clean_latin}")
-                    os.makedirs(output_dir, exist_ok=True)
-
-                    # Build the Google Images search URL with the query
-                    query_names = f"{common_name} {latin_name}"
-                    query_params = urlencode({"q": query_names, "tbm": "isch"})
-                    search_url = f"https://www.google.com/search?{query_params}"
-
-                    print(f"[{index+1}/{len(bird_species)}]. search URL: {search_url}")
-                    await page.goto(search_url) 
-
-                    # Scroll to the bottom of the page to load more images
-                    await scroll_to_bottom(page)
-                    await page.wait_for_selector('div[data-id="mosaic"]', timeout=10000)  # Wait for the image section to appear
-                    # Find all image elements on the page
-                    image_elements = await page.query_selector_all('div[data-attrid="images universal"]')
-                    print(f"Found {len(image_elements)} image elements on the page.")
-
-                    connector = TCPConnector(ssl=False)
-                    async with ClientSession(timeout=ClientTimeout(total=timeout_duration), connector=connector) as session:
-                        images_downloaded = 0
-
-                        # Iterate through the image elements
-                        for idx, image_element in enumerate(image_elements):
-                            if max_images is not None and images_downloaded >= max_images:
-                                print(f"Reached max image limit of {max_images}. Stopping download.")
-                                break
-                            try:
-                                print(f"Processing image {idx + 1}...")
-                                # Click on the image to get a full view
-                                await image_element.click()
-                                await page.wait_for_selector("img.sFlh5c.FyHeAf.iPVvYb[jsaction]", timeout=7000)
-
-                                img_tag = await page.query_selector("img.sFlh5c.FyHeAf.iPVvYb[jsaction]")
-                                if not img_tag:
-                                    print(f"Failed to find image tag for element {idx + 1}")
-                                    continue
-
-                                # Get the image URL
-                                img_url = await img_tag.get_attribute("src")
-                                file_extension = os.path.splitext(urlparse(img_url).path)[1] or ".png"
-                                file_path = os.path.join(output_dir, f"{clean_common}_{clean_latin}_{idx + 1}{file_extension}")
-
-                                # Download the image
-                                await download_image(session, img_url, file_path)
-
-                                # Extract source URL and image description
-                                source_url = await page.query_selector('(//div[@jsname="figiqf"]/a[@class="YsLeY"])[2]')
-                                source_url = await source_url.get_attribute("href") if source_url else "N/A"
-                                image_description = await img_tag.get_attribute("alt")
-                                source_name = extract_domain(source_url)
-
-                                # Store image metadata
-                                image_data = {
-                                    "image_description": image_description,
-                                    "source_url": source_url,
-                                    "source_name": source_name,
-                                    "image_file": file_path,
-                                }
-
-                                species_key = f"{common_name}__{latin_name}"
-                                image_data_list.setdefault(species_key, []).append(image_data)
-                                print(f"Image {idx + 1} metadata prepared.")
-                                images_downloaded += 1
-                            except Exception as e:
-                                print(f"Error processing image {idx + 1}: {e}")
-                                continue
-
-                    print(f"Finished downloading {images_downloaded} images.")
-                    await asyncio.sleep(5)
-                except Exception as e:
-                    print(f"error {e}")
-        except (KeyboardInterrupt, asyncio.CancelledError):
-            pass
-        finally:  
-            # Save updated data
-            with open(json_file_path, "w") as json_file:
-                json.dump(image_data_list, json_file, indent=4)
-            await browser.close() 
+            # Click on the image to get a full view, then wait for the preview to show a new image
+            await image_element.click()
+            try:
+                await page.wait_for_function(PREVIEW_CHANGED, arg=[PREVIEW_IMAGE_SELECTOR, previous_url], timeout=7000)
+            except PlaywrightTimeoutError:
+                print(f"[{common_name}] Preview did not change for element {idx + 1}")
+                continue
+            img_tag = await page.query_selector(PREVIEW_IMAGE_SELECTOR)
+            if not img_tag:
+                print(f"[{common_name}] Failed to find image tag for element {idx + 1}")
+                continue
+
+            # Get the image URL
+            img_url = await img_tag.get_attribute("src")
+            if not img_url:
+                continue
+            previous_url = img_url
+            if img_url in seen_urls:
+                continue
+            seen_urls.add(img_url)
+
+            file_extension = os.path.splitext(urlparse(img_url).path)[1] or ".png"
+            file_path = os.path.join(output_dir, f"{clean_common}_{clean_latin}_{idx + 1}{file_extension}")
+
+            # Queue the download, it runs concurrently with the next clicks
+            await downloader.submit(img_url, file_path)
+
+            # Extract source URL and image description
+            source_url = await page.query_selector(SOURCE_LINK_SELECTOR)
+            source_url = await source_url.get_attribute("href") if source_url else "N/A"
+            image_description = await img_tag.get_attribute("alt")
+
+            # Store image metadata
+            images.append({
+                "image_description": image_description,
+                "source_url": source_url,
+                "source_name": extract_domain(source_url),
+                "image_file": file_path,
+                "image_url": img_url,
+            })
+        except Exception as e:
+            print(f"[{common_name}] Error processing image {idx + 1}: {e}")
+
+    print(f"[{common_name}] Queued {len(images)} images.")
+    return f"{common_name}__{latin_name}", images
+
+
+# One browser context + page working through the shared species queue
+async def page_worker(worker_id: int, browser, queue: asyncio.Queue, progress: ScrapeProgress, total: int, **scrape_args):
+    context = await browser.new_context()
+    page = await context.new_page()
+    try:
+        while True:
+            try:
+                species = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                print(f"[page {worker_id}] [{len(progress.completed) + 1}/{total}] {species}")
+                species_key, images = await scrape_species(page, species, **scrape_args)
+                progress.mark_done(species, species_key, images)
+            except Exception as e:
+                # Not marked as done: a resumed run retries it
+                print(f"[page {worker_id}] error on {species}: {e}")
+            finally:
+                queue.task_done()
+    finally:
+        await context.close()
+
+
+# Main function to scrape Google Images
+async def scrape_google_images(species_list=bird_species, max_images=None, timeout_duration=10, pages=4,
+                               download_workers=32, resume_folder: Optional[str] = None, search_url=GOOGLE_SEARCH_URL,
+                               max_scrolls=3, headless=True):
+    if resume_folder:
+        download_folder = resume_folder
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        download_folder = os.path.join(current_dir, "downloads", f"bird_images_{timestamp}")
+    os.makedirs(download_folder, exist_ok=True)
+
+    progress = ScrapeProgress(download_folder)
+    completed = set(progress.completed)
+    pending = [species for species in species_list if species not in completed]
+    print(f"{len(progress.completed)} species already done, {len(pending)} to go. Output: {download_folder}")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for species in pending:
+        queue.put_nowait(species)
+
+    downloader = ImageDownloader(workers=download_workers, timeout=timeout_duration)
+    try:
+        async with async_playwright() as p, downloader:
+            # Species are checkpointed once their downloads are queued, re-queue files a previous run didn't finish
+            for images in progress.metadata.values():
+                for image in images:
+                    if "image_url" in image and progress.should_download(image["image_file"]):
+                        await downloader.submit(image["image_url"], image["image_file"])
+
+            browser = await p.chromium.launch(headless=headless)  # Launch a Chromium browser
+            try:
+                await asyncio.gather(*[
+                    page_worker(
+                        worker_id, browser, queue, progress, len(species_list),
+                        download_folder=download_folder, downloader=downloader, search_url=search_url,
+                        max_images=max_images, max_scrolls=max_scrolls, timeout_duration=timeout_duration,
+                    )
+                    for worker_id in range(min(pages, max(len(pending), 1)))
+                ])
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                pass
+            finally:
+                # Save metadata in the original format next to the checkpoint
+                timestamp = os.path.basename(os.path.normpath(download_folder)).replace("bird_images_", "")
+                json_file_path = os.path.join(download_folder, f"birds_metadata_{timestamp}.json")
+                with open(json_file_path, "w") as json_file:
+                    json.dump(progress.metadata, json_file, indent=4)
+                await browser.close()
+    finally:
+        # After the downloader drained its queue: permanently failing URLs aren't retried on every resume
+        progress.record_failures(downloader.failed, downloader.rejected)
 
 # Run the main function with specified query and limits
 if __name__ == "__main__":
-    asyncio.run(scrape_google_images(max_images=8, timeout_duration=10))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape bird images from Google Images.")
+    parser.add_argument("--pages", type=int, default=4, help="Browser pages scraping species in parallel")
+    parser.add_argument("--max-images", type=int, default=8, help="Images per species")
+    parser.add_argument("--download-workers", type=int, default=32)
+    parser.add_argument("--timeout", type=int, default=10, help="Seconds to wait for a page / download")
+    parser.add_argument("--max-scrolls", type=int, default=3)
+    parser.add_argument("--resume", type=str, default=None, help="Download folder of a previous run to continue")
+    parser.add_argument("--search-url", type=str, default=GOOGLE_SEARCH_URL, help="Search endpoint (e.g. a local fixture server)")
+    parser.add_argument("--headful", action="store_true", help="Show the browser windows")
+    args = parser.parse_args()
+
+    asyncio.run(scrape_google_images(
+        max_images=args.max_images,
+        timeout_duration=args.timeout,
+        pages=args.pages,
+        download_workers=args.download_workers,
+        resume_folder=args.resume,
+        search_url=args.search_url,
+        max_scrolls=args.max_scrolls,
+        headless=not args.headful,
+    ))
@@ -1,7 +1,131 @@
 # Adjust the config here
+# Keep this module free of heavy imports: inference and export scripts import it too
+
+import json
+import os
+import tomllib
+from dataclasses import asdict, dataclass, fields
+from typing import Optional, Union
 
 BASE_MODEL_NAME = "facebook/dinov2-with-registers-base"
 NUM_CLASSES = 131
 HIDDEN_DIM = 256
-DATASET_DIR = r".\dataset"
+DATASET_DIR = os.path.join(".", "dataset")
+
+# Training speed / memory options. Unsupported options fall back automatically on the current device (see precision.py)
+MIXED_PRECISION        = "auto"  # "auto", "bf16", "fp16" or "no". "auto" picks bf16 > fp16 > fp32
+GRADIENT_CHECKPOINTING = False   # Recompute activations in backward: lower memory for a larger batch size, slower steps
+FUSED_OPTIMIZER        = True    # Fused AdamW kernel (CUDA only)
+TORCH_COMPILE          = False   # torch.compile the model: slow first steps, faster afterwards
+
+
+@dataclass
+class TrainConfig:
+    """
+    Training run configuration. Defaults match the values above, override them with a TOML / YAML file (see train.toml).
+    """
+    # Model
+    base_model_name: str = BASE_MODEL_NAME
+    num_classes: int = NUM_CLASSES
+    hidden_dim: Optional[int] = HIDDEN_DIM
+    freeze_backbone: bool = False
+    cache_dir: str = "./cache"
+
+    # Data
+    dataset_dir: str = DATASET_DIR
+    manifest_path: str = "./cache/dataset_manifest.npz"
+    rebuild_manifest: bool = False  # train.py: rescan dataset_dir on start instead of using the saved manifest
+    split_store_path: str = "./splits/split_store.npz"
+    legacy_split_file: str = "./pickle/split_indices.pkl"  # Only read once, to migrate an old split into the store
+    test_size: float = 0.2
+    seed: int = 42
+
+    # Output. A fixed run_name resumes from its latest checkpoint, None starts a new timestamped run
+    output_root: str = "./results"
+    logging_root: str = "./logs"
+    run_name: Optional[str] = None
+
+    # Optimization
+    batch_size: int = 32
+    num_epochs: int = 50
+    learning_rate: float = 4e-5          # use 1e-5 if batch size = 16
+    weight_decay: float = 0.01
+    lr_scheduler_type: str = "cosine"
+    warmup_ratio: float = 0.04
+    max_grad_norm: float = 1.0
+    save_total_limit: int = 5
+    early_stopping_patience: int = 5     # Stop after 5 epochs without improvement
+    early_stopping_threshold: float = 0.0001
+
+    # DataLoader
+    dataloader_num_workers: Union[int, str] = "auto"  # "auto" benchmarks worker / prefetch combinations
+    dataloader_prefetch_factor: int = 2               # Ignored when dataloader_num_workers = "auto"
+    dataloader_pin_memory: Optional[bool] = None      # None = pin when CUDA is available
+    train_eval_samples: Optional[int] = 2000          # Train-set evaluation per epoch. None = full train set, 0 = disabled
+    profile_steps: bool = True                        # Print data wait vs compute time per step
+
+    # Speed / memory
+    mixed_precision: str = MIXED_PRECISION
+    gradient_checkpointing: bool = GRADIENT_CHECKPOINTING
+    fused_optimizer: bool = FUSED_OPTIMIZER
+    torch_compile: bool = TORCH_COMPILE
+
+    # Distillation (see distill.py). A teacher checkpoint trains base_model_name as a student on its soft targets
+    distill_teacher_dir: Optional[str] = None
+    distill_temperature: float = 4.0
+    distill_alpha: float = 0.7                        # Weight of the soft target loss, 1 - alpha for the label loss
+    teacher_logits_path: str = "./cache/teacher_logits.npz"
+
+    def override(self, key: str, value) -> None:
+        if key not in {f.name for f in fields(self)}:
+            raise ValueError(f"Unknown config key: {key}")
+        setattr(self, key, value)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(asdict(self), f, indent=4)
+
+
+def load_train_config(path: Optional[str] = None) -> TrainConfig:
+    """
+    Load a TrainConfig from a .toml, .yaml / .yml or .json file. Missing keys keep their defaults.
+    """
+    config = TrainConfig()
+    if path is None:
+        return config
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        with open(path, "rb") as f:
+            values = tomllib.load(f)
+    elif extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("YAML configs need PyYAML: pip install pyyaml") from e
+        with open(path, "r") as f:
+            values = yaml.safe_load(f) or {}
+    elif extension == ".json":
+        with open(path, "r") as f:
+            values = json.load(f)
+    else:
+        raise ValueError(f"Unsupported config format: {path}")
+
+    for key, value in values.items():
+        config.override(key, value)
+    return config
+
 
+def parse_override(assignment: str) -> tuple:
+    """
+    Parse a "key=value" command line override, e.g. learning_rate=2e-5 or run_name="lr-sweep".
+    Values are read as TOML and fall back to a plain string.
+    """
+    key, sep, raw = assignment.partition("=")
+    if not sep:
+        raise ValueError(f"Override must look like key=value, got: {assignment}")
+    try:
+        value = tomllib.loads(f"value = {raw}")["value"]
+    except tomllib.TOMLDecodeError:
+        value = raw
+    return key.strip(), value
@@ -0,0 +1,41 @@
+from typing import List
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import transforms
+from transformers import AutoImageProcessor
+
+
+# Custom Dataset class for HuggingFace Trainer
+class BirdDataset(Dataset):
+    def __init__(self, image_paths: List[str], labels: List[int], processor: AutoImageProcessor, augment = False):
+        self.image_paths = image_paths
+        self.labels = labels
+        self.processor = processor
+        self.augment = augment
+        self.augmentations = transforms.Compose([
+            transforms.RandomResizedCrop(224, scale=(0.8, 1.0)),
+            transforms.RandomHorizontalFlip(),
+            transforms.ColorJitter(0.1, 0.1, 0.1, 0.05),
+        ])
+
+
+    def __len__(self) -> int:
+        """Returns the total number of images in the dataset."""
+        return len(self.image_paths)
+
+    def __getitem__(self, idx: int) -> dict:
+        # Load the image (using PIL)
+        image = Image.open(self.image_paths[idx]).convert("RGB")
+
+        # Retrieve the label (already encoded as an integer)
+        label = self.labels[idx]
+
+        if self.augment:
+            image = self.augmentations(image)
+
+        # Use processor to prepare the image for the model
+        encoding = self.processor(images=image, return_tensors="pt") # type: ignore
+
+        # Return the processed image (pixel_values) and the label
+        return {"pixel_values": encoding["pixel_values"].squeeze(0), "label": torch.tensor(label)}
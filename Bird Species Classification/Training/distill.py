@@ -0,0 +1,222 @@
+'''
+    Knowledge distillation of the fine-tuned DINOv2-base classifier into a smaller student for CPU / mobile serving
+    - The teacher (a CustomDinoV2ClassifierWithReg checkpoint) runs once over the train split, its logits are cached
+      keyed by image content hash, so student epochs never rerun it and new images only add their own rows.
+      The teacher sees the un-augmented view (same preprocessing as evaluate.py), the student its augmented crops
+    - DistillationTrainer: Trainer whose loss is alpha * T^2 * KL(teacher || student at temperature T)
+      + (1 - alpha) * cross entropy on the labels. train.py switches to it when distill_teacher_dir is set,
+      the student is base_model_name (dinov2-with-registers-small in distill.toml) with the same classifier head
+    - report: exports the trained student (export_pipeline.py) and evaluates teacher, student and the student's ONNX
+      variants in one pass over the validation split (evaluate.py): accuracy vs the teacher next to latency / throughput
+
+    usage: python distill.py cache --config distill.toml                  (optional, train.py builds the cache itself)
+           python train.py --config distill.toml
+           python distill.py report --config distill.toml --student ./results/dinov2-reg-small-distill [--teacher ./configs/]
+'''
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+from transformers.trainer import Trainer
+
+from config import TrainConfig, load_train_config, parse_override
+
+TEACHER_CACHE_VERSION = 1
+
+
+# ── Teacher logits cache ──────────────────────────────────────────────────────
+def teacher_fingerprint(teacher_dir: str) -> str:
+    """
+    Weight files (name, size, mtime) of the teacher checkpoint: a retrained teacher invalidates the cache.
+    """
+    weights = sorted(name for name in os.listdir(teacher_dir) if name.endswith((".safetensors", ".bin")))
+    if not weights:
+        raise FileNotFoundError(f"No model weights found in teacher checkpoint '{teacher_dir}'")
+    stats = [(name, os.stat(os.path.join(teacher_dir, name))) for name in weights]
+    return ";".join(f"{name}:{stat.st_size}:{stat.st_mtime_ns}" for name, stat in stats)
+
+
+def teacher_config(cfg: TrainConfig) -> TrainConfig:
+    """
+    The teacher's own training config (num_classes / hidden_dim of its head) when train.py saved one next to it.
+    """
+    saved = os.path.join(cfg.distill_teacher_dir, "train_config.json")
+    return load_train_config(saved) if os.path.exists(saved) else cfg
+
+
+def cached_teacher_logits(cfg: TrainConfig, image_paths: List[str], hashes: np.ndarray, batch_size: int = 64,
+                          workers: int = 8) -> np.ndarray:
+    """
+    (N, num_classes) float32 teacher logits for image_paths, in order. Only images whose content hash isn't cached
+    yet go through the teacher, the cache is rewritten (write then rename) when rows were added.
+    """
+    fingerprint = teacher_fingerprint(cfg.distill_teacher_dir)
+    cached_hashes, cached_logits = np.zeros(0, dtype=np.uint64), None
+    if os.path.exists(cfg.teacher_logits_path):
+        with np.load(cfg.teacher_logits_path, allow_pickle=False) as data:
+            if int(data["version"]) == TEACHER_CACHE_VERSION and str(data["teacher"]) == fingerprint:
+                cached_hashes, cached_logits = data["hashes"], data["logits"]
+            else:
+                print(f"Teacher changed since {cfg.teacher_logits_path} was written, recomputing the teacher logits")
+
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    missing = np.unique(hashes[~np.isin(hashes, cached_hashes)])
+    if len(missing):
+        from evaluate import TorchBackend, iter_batches
+
+        print(f"Teacher logits: {len(hashes) - np.isin(hashes, missing).sum()} cached, computing {len(missing)}")
+        teacher = TorchBackend(cfg.distill_teacher_dir, teacher_config(cfg))
+        first = {int(h): i for i, h in reversed(list(enumerate(hashes.tolist())))}
+        rows = np.array([first[int(h)] for h in missing])
+        # iter_batches skips unreadable images, carry the position in `missing` as the label to know which came back
+        computed_hashes, computed_logits = [], []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch, positions in iter_batches([image_paths[i] for i in rows], np.arange(len(missing)), batch_size,
+                                                 executor, prefetch=4 * batch_size):
+                computed_logits.append(teacher.run(batch))
+                computed_hashes.append(missing[positions])
+        if computed_logits:
+            new_hashes, new_logits = np.concatenate(computed_hashes), np.concatenate(computed_logits)
+            cached_logits = new_logits if cached_logits is None else np.concatenate([cached_logits, new_logits])
+            cached_hashes = np.concatenate([cached_hashes, new_hashes])
+            order = np.argsort(cached_hashes, kind="stable")
+            cached_hashes, cached_logits = cached_hashes[order], cached_logits[order]
+
+            os.makedirs(os.path.dirname(cfg.teacher_logits_path) or ".", exist_ok=True)
+            tmp_path = cfg.teacher_logits_path + ".tmp.npz"
+            np.savez(tmp_path, version=np.int32(TEACHER_CACHE_VERSION), teacher=np.str_(fingerprint), hashes=cached_hashes,
+                     logits=cached_logits.astype(np.float32))
+            os.replace(tmp_path, cfg.teacher_logits_path)
+        del teacher
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    found = np.isin(hashes, cached_hashes)
+    if not found.all():
+        raise ValueError(f"{(~found).sum()} images have no teacher logits (unreadable?), rebuild the manifest first")
+    return cached_logits[np.searchsorted(cached_hashes, hashes)].astype(np.float32)
+
+
+class TeacherLogitsDataset(Dataset):
+    """
+    Adds the cached "teacher_logits" of each item to a BirdDataset sample.
+    """
+    def __init__(self, dataset: Dataset, teacher_logits: np.ndarray) -> None:
+        self.dataset = dataset
+        self.teacher_logits = torch.from_numpy(teacher_logits)
+
+    def __len__(self) -> int:
+        return len(self.dataset)  # type: ignore
+
+    def __getitem__(self, idx: int) -> dict:
+        item = self.dataset[idx]
+        item["teacher_logits"] = self.teacher_logits[idx]
+        return item
+
+
+# ── Training ──────────────────────────────────────────────────────────────────
+def distillation_loss(student_logits: torch.Tensor, teacher_logits: torch.Tensor, labels: torch.Tensor,
+                      temperature: float = 4.0, alpha: float = 0.7) -> torch.Tensor:
+    """
+    Hinton et al. soft target loss, scaled by T^2 so its gradients keep their size when T changes.
+    """
+    student_logits, teacher_logits = student_logits.float(), teacher_logits.float()
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=-1), F.log_softmax(teacher_logits / temperature, dim=-1),
+                    reduction="batchmean", log_target=True) * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
+class DistillationTrainer(Trainer):
+    """
+    Batches with "teacher_logits" use distillation_loss, others (the validation set) the model's own cross entropy,
+    so eval_loss and accuracy stay comparable with regular training runs.
+    """
+    def __init__(self, *args, temperature: float = 4.0, alpha: float = 0.7, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def _set_signature_columns_if_needed(self) -> None:
+        # remove_unused_columns keeps only the model's forward arguments, teacher_logits has to survive the collator
+        super()._set_signature_columns_if_needed()
+        if "teacher_logits" not in self._signature_columns:
+            self._signature_columns.append("teacher_logits")
+
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):  # type: ignore
+        teacher_logits = inputs.pop("teacher_logits", None)
+        if teacher_logits is None:
+            return super().compute_loss(model, inputs, return_outputs=return_outputs, **kwargs)
+        outputs = model(pixel_values=inputs["pixel_values"])
+        loss = distillation_loss(outputs.logits, teacher_logits, inputs["labels"], self.temperature, self.alpha)
+        return (loss, outputs) if return_outputs else loss
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+def report(
+    cfg: TrainConfig,
+    student_dir: str,
+    teacher: Optional[str] = None,
+    output_dir: str = "./quant/student",
+    variants: List[str] = ("fp32", "fp16", "int8_dynamic"),
+    batch_size: int = 32,
+    max_images: Optional[int] = None,
+    providers: Optional[List[str]] = None,
+) -> dict:
+    """
+    Exports the student to ONNX and evaluates [teacher, student, student ONNX variants] on the validation split.
+    The teacher is the reference: accuracy_drop / agreement_with_reference of every student row are against it.
+    """
+    from evaluate import evaluate, print_table
+    from export_pipeline import VARIANT_FILES, run_pipeline
+
+    export = run_pipeline(cfg, output_dir, checkpoint_dir=student_dir, variants=[v for v in variants if v != "fp32"],
+                          nhwc=False, batch_size=8, providers=providers)
+    onnx_paths = [os.path.join(output_dir, VARIANT_FILES[variant]) for variant in variants]
+    models = ([teacher] if teacher else []) + [student_dir] + onnx_paths
+    results = evaluate(models, cfg, batch_size=batch_size, max_images=max_images, providers=providers)
+    print_table(results)
+
+    summary = {"evaluation": results, "export": export}
+    with open(os.path.join(output_dir, "distill_report.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Report written to {os.path.join(output_dir, 'distill_report.json')}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teacher logits cache and student speed / accuracy report for distillation.")
+    parser.add_argument("command", choices=["cache", "report"])
+    parser.add_argument("--config", type=str, default=None, help="Distillation training config (see distill.toml)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--student", type=str, default=None, help="report: trained student checkpoint directory")
+    parser.add_argument("--teacher", type=str, default=None,
+                        help="report: teacher checkpoint or ONNX export to compare against (default: distill_teacher_dir)")
+    parser.add_argument("--output-dir", type=str, default="./quant/student", help="report: student ONNX exports + report")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    args = parser.parse_args()
+
+    cfg = load_train_config(args.config)
+    for assignment in args.overrides:
+        cfg.override(*parse_override(assignment))
+    if cfg.distill_teacher_dir is None and (args.command == "cache" or args.teacher is None):
+        parser.error("Set distill_teacher_dir in the config (or --set distill_teacher_dir=...)")
+
+    if args.command == "cache":
+        from train import load_dataset_split
+        image_paths, _labels, hashes, train_idx, _val_idx = load_dataset_split(cfg)
+        logits = cached_teacher_logits(cfg, [image_paths[i] for i in train_idx], hashes[train_idx], args.batch_size)
+        print(f"Teacher logits for {len(logits)} train images in {cfg.teacher_logits_path}")
+    else:
+        if args.student is None:
+            parser.error("report needs --student")
+        report(cfg, args.student, args.teacher or cfg.distill_teacher_dir, args.output_dir, batch_size=args.batch_size,
+               max_images=args.max_images, providers=args.providers)
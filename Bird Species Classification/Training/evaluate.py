@@ -0,0 +1,404 @@
+'''
+    Validation of the classifier checkpoint and its exports (QUInt8 / FP16 / slimmed ONNX) in one pass
+    - Streams the validation split of the split store (split_store.py, same split as training) from a thread pool
+    - Every image is decoded / preprocessed once and each batch goes through every --models backend:
+      a checkpoint directory runs in PyTorch (CustomDinoV2ClassifierWithReg), .onnx files in ONNX Runtime (NCHW or NHWC)
+    - Per model: accuracy, top-5, weighted F1, per-class precision / recall / F1, confusion matrix, calibration (ECE, NLL),
+      images / sec and batch latency percentiles. The first model is the reference for accuracy drop and top-1 agreement
+    - --adaptive adds, after every checkpoint, the same model in early exit mode (model.predict_adaptive: low resolution
+      pass with pruned patch tokens, full model only for uncertain images) with its full resolution fallback rate
+
+    usage: python evaluate.py --models ./configs ./quant/baseQUInt8_quantized_dynamic.onnx [--config train.toml]
+                              [--batch-size 32] [--max-images 2000] [--report eval.json] [--confusion-dir ./eval]
+           python evaluate.py --models ./configs --adaptive [--low-resolution 168 --keep-ratio 0.5 --confidence-threshold 0.8]
+'''
+import argparse
+import copy
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from config import TrainConfig, load_train_config, parse_override
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def load_image(path: str, resize: int = 256, crop: int = 224) -> np.ndarray:
+    """
+    Same preprocessing as the DINOv2 image processor / onnx_infer.py: shortest side to 256 (bicubic), center crop 224,
+    ImageNet normalization. Returns a (3, 224, 224) float32 tensor.
+    """
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        width, height = image.size
+        scale = resize / min(width, height)
+        image = image.resize((max(int(width * scale), resize), max(int(height * scale), resize)), Image.BICUBIC)
+    width, height = image.size
+    left, top = int(round((width - crop) / 2.0)), int(round((height - crop) / 2.0))
+    array = np.asarray(image.crop((left, top, left + crop, top + crop)), dtype=np.float32) / 255.0
+    return ((array - IMAGENET_MEAN) / IMAGENET_STD).transpose(2, 0, 1)
+
+
+def load_validation_split(cfg: TrainConfig) -> Tuple[List[str], np.ndarray, List[str]]:
+    """
+    Returns (validation image paths, encoded labels, class names) from the manifest and split store.
+    """
+    from manifest import load_or_build_manifest
+    from split_store import load_split
+
+    manifest = load_or_build_manifest(cfg.dataset_dir, cfg.manifest_path)
+    image_paths = manifest.image_paths(cfg.dataset_dir)
+    _train_idx, val_idx, labels_encoded, classes = load_split(
+        manifest,
+        store_path=cfg.split_store_path,
+        test_size=cfg.test_size,
+        seed=cfg.seed,
+        legacy_split_file=cfg.legacy_split_file,
+    )
+    return [image_paths[i] for i in val_idx], labels_encoded[val_idx], list(classes)
+
+
+def iter_batches(paths: List[str], labels: np.ndarray, batch_size: int, executor: ThreadPoolExecutor,
+                 prefetch: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yields (NCHW float32 batch, labels) in split order, decoding at most `prefetch` images ahead. Unreadable images are skipped.
+    """
+    remaining = iter(zip(paths, labels.tolist()))
+    pending = deque((path, label, executor.submit(load_image, path)) for path, label in islice(remaining, prefetch))
+    tensors, batch_labels = [], []
+    while pending:
+        path, label, future = pending.popleft()
+        following = next(remaining, None)
+        if following is not None:
+            pending.append((*following, executor.submit(load_image, following[0])))
+        try:
+            tensors.append(future.result())
+        except OSError as e:
+            print(f"[Warning] Skipping {path}: {e}")
+            continue
+        batch_labels.append(label)
+        if len(tensors) == batch_size:
+            yield np.stack(tensors), np.array(batch_labels)
+            tensors, batch_labels = [], []
+    if tensors:
+        yield np.stack(tensors), np.array(batch_labels)
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+class TorchBackend:
+    """
+    Fine-tuned checkpoint directory (config.json + weights), loaded like infer.py.
+    """
+    name = "pytorch"
+
+    def __init__(self, checkpoint_dir: str, cfg: TrainConfig) -> None:
+        import torch
+        from transformers import Dinov2WithRegistersConfig
+        from model import CustomDinoV2ClassifierWithReg
+
+        self.torch = torch
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        config = Dinov2WithRegistersConfig.from_pretrained(checkpoint_dir, cache_dir=cfg.cache_dir)
+        self.model = CustomDinoV2ClassifierWithReg.from_pretrained(
+            checkpoint_dir,
+            config=config,
+            num_classes=cfg.num_classes,
+            hidden_dim=cfg.hidden_dim,
+            cache_dir=cfg.cache_dir,
+        ).eval().to(self.device)
+
+        self.adaptive: Optional[Dict[str, float]] = None
+        self.images = self.full_resolution = 0
+
+    def adaptive_variant(self, options: Dict[str, float]) -> "TorchBackend":
+        """
+        Same loaded model, run through predict_adaptive(**options).
+        """
+        variant = copy.copy(self)
+        variant.name, variant.adaptive = "adaptive", options
+        return variant
+
+    def run(self, batch: np.ndarray, count: bool = True) -> np.ndarray:
+        """
+        count=False leaves the full resolution counters alone (warm-up runs).
+        """
+        with self.torch.inference_mode():
+            pixel_values = self.torch.from_numpy(batch).to(self.device)
+            if self.adaptive is None:
+                logits = self.model(pixel_values=pixel_values).logits
+            else:
+                logits, fell_back = self.model.predict_adaptive(pixel_values, **self.adaptive)
+                if count:
+                    self.images += len(batch)
+                    self.full_resolution += int(fell_back.sum())
+        return logits.float().cpu().numpy()
+
+
+class OnnxBackend:
+    """
+    ONNX classifier export. Layout, fixed batch size and float16 inputs are read from the model input.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path: str, providers: Optional[List[str]] = None) -> None:
+        import onnxruntime as ort
+
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.log_severity_level = 4
+        self.session = ort.InferenceSession(model_path, sess_options, providers=providers or ["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        self.nhwc = model_input.shape[-1] == 3
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+
+    def run(self, batch: np.ndarray, count: bool = True) -> np.ndarray:
+        # count: same signature as TorchBackend.run, nothing to count here
+        if self.nhwc:
+            batch = np.ascontiguousarray(batch.transpose(0, 2, 3, 1))
+        batch = batch.astype(self.input_dtype, copy=False)
+        step = self.fixed_batch or len(batch)
+        logits = []
+        for start in range(0, len(batch), step):
+            chunk = batch[start:start + step]
+            if self.fixed_batch is not None and len(chunk) < step:
+                # Static batch axis: pad the last batch
+                chunk = np.concatenate([chunk, np.zeros((step - len(chunk),) + chunk.shape[1:], chunk.dtype)])
+            output = self.session.run([self.output_name], {self.input_name: chunk})[0]
+            logits.append(output[:min(step, len(batch) - start)])
+        return np.concatenate(logits).astype(np.float32)
+
+
+def load_backend(model_path: str, cfg: TrainConfig, providers: Optional[List[str]] = None):
+    if model_path.lower().endswith(".onnx"):
+        return OnnxBackend(model_path, providers)
+    if os.path.isdir(model_path):
+        return TorchBackend(model_path, cfg)
+    raise ValueError(f"Expected an .onnx file or a checkpoint directory, got {model_path}")
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+class ClassificationMetrics:
+    """
+    Streaming metrics: everything is accumulated per batch (confusion matrix, calibration bins, NLL sum),
+    so the validation split is read once.
+    """
+    def __init__(self, num_classes: int, num_bins: int = 15) -> None:
+        self.num_classes = num_classes
+        self.num_bins = num_bins
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)  # rows: true label, columns: prediction
+        self.bin_counts = np.zeros(num_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(num_bins)
+        self.bin_correct = np.zeros(num_bins)
+        self.top5_correct = 0
+        self.nll_sum = 0.0
+        self.predictions: List[np.ndarray] = []
+        self.batch_seconds: List[float] = []
+        self.batch_sizes: List[int] = []
+
+    def update(self, logits: np.ndarray, labels: np.ndarray, seconds: float) -> None:
+        logits = logits.astype(np.float64)
+        shifted = logits - logits.max(axis=1, keepdims=True)
+        log_probs = shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+        predictions = log_probs.argmax(axis=1)
+        confidence = np.exp(log_probs[np.arange(len(labels)), predictions])
+        correct = predictions == labels
+
+        self.confusion += np.bincount(labels * self.num_classes + predictions,
+                                      minlength=self.num_classes ** 2).reshape(self.num_classes, self.num_classes)
+        top_k = min(5, logits.shape[1])
+        self.top5_correct += int((np.argpartition(-logits, top_k - 1, axis=1)[:, :top_k] == labels[:, None]).any(axis=1).sum())
+        self.nll_sum -= float(log_probs[np.arange(len(labels)), labels].sum())
+
+        bins = np.minimum((confidence * self.num_bins).astype(np.int64), self.num_bins - 1)
+        self.bin_counts += np.bincount(bins, minlength=self.num_bins)
+        self.bin_confidence += np.bincount(bins, weights=confidence, minlength=self.num_bins)
+        self.bin_correct += np.bincount(bins, weights=correct, minlength=self.num_bins)
+
+        self.predictions.append(predictions)
+        self.batch_seconds.append(seconds)
+        self.batch_sizes.append(len(labels))
+
+    def per_class(self) -> Dict[str, np.ndarray]:
+        true_positives = np.diag(self.confusion).astype(np.float64)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+        recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+        denominator = precision + recall
+        f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(denominator), where=denominator > 0)
+        return {"precision": precision, "recall": recall, "f1": f1, "support": support}
+
+    def summary(self) -> Dict[str, float]:
+        total = int(self.confusion.sum())
+        per_class = self.per_class()
+        bin_weights = self.bin_counts / max(total, 1)
+        bin_gap = np.abs(self.bin_correct - self.bin_confidence) / np.maximum(self.bin_counts, 1)
+        batch_ms = np.array(self.batch_seconds) * 1000
+        return {
+            "images": total,
+            "accuracy": float(np.trace(self.confusion) / max(total, 1)),
+            "top5_accuracy": self.top5_correct / max(total, 1),
+            "f1_weighted": float((per_class["f1"] * per_class["support"]).sum() / max(total, 1)),
+            "f1_macro": float(per_class["f1"][per_class["support"] > 0].mean()) if total else 0.0,
+            "ece": float((bin_weights * bin_gap).sum()),
+            "nll": self.nll_sum / max(total, 1),
+            "images_per_second": total / max(sum(self.batch_seconds), 1e-9),
+            "batch_latency_p50_ms": float(np.percentile(batch_ms, 50)),
+            "batch_latency_p90_ms": float(np.percentile(batch_ms, 90)),
+            "batch_latency_p99_ms": float(np.percentile(batch_ms, 99)),
+        }
+
+    def top_confusions(self, class_names: List[str], count: int = 10) -> List[Tuple[str, str, int]]:
+        off_diagonal = self.confusion.copy()
+        np.fill_diagonal(off_diagonal, 0)
+        flat = np.argsort(-off_diagonal, axis=None, kind="stable")[:count]
+        rows, cols = np.unravel_index(flat, off_diagonal.shape)
+        return [(class_names[r], class_names[c], int(off_diagonal[r, c])) for r, c in zip(rows, cols) if off_diagonal[r, c]]
+
+
+def write_confusion(metrics: ClassificationMetrics, class_names: List[str], output_dir: str, model_name: str) -> None:
+    """
+    <model>_confusion.csv (true label rows, predicted label columns) and <model>_per_class.csv.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, f"{model_name}_confusion.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["true \\ predicted"] + class_names)
+        for name, row in zip(class_names, metrics.confusion.tolist()):
+            writer.writerow([name] + row)
+    per_class = metrics.per_class()
+    with open(os.path.join(output_dir, f"{model_name}_per_class.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["class", "precision", "recall", "f1", "support"])
+        for index, name in enumerate(class_names):
+            writer.writerow([name, f"{per_class['precision'][index]:.4f}", f"{per_class['recall'][index]:.4f}",
+                             f"{per_class['f1'][index]:.4f}", int(per_class["support"][index])])
+
+
+def evaluate(
+    model_paths: List[str],
+    cfg: TrainConfig,
+    batch_size: int = 32,
+    workers: int = 8,
+    max_images: Optional[int] = None,
+    providers: Optional[List[str]] = None,
+    confusion_dir: Optional[str] = None,
+    warmup_batches: int = 1,
+    adaptive: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    paths, labels, class_names = load_validation_split(cfg)
+    if max_images is not None:
+        paths, labels = paths[:max_images], labels[:max_images]
+    print(f"Validation split: {len(paths)} images, {len(class_names)} classes")
+
+    backends = [load_backend(model_path, cfg, providers) for model_path in model_paths]
+    if adaptive is not None:
+        # Early exit variant right after each checkpoint, sharing its weights
+        model_paths = list(model_paths)
+        for position in reversed(range(len(backends))):
+            if isinstance(backends[position], TorchBackend):
+                backends.insert(position + 1, backends[position].adaptive_variant(adaptive))
+                model_paths.insert(position + 1, f"{model_paths[position]} (adaptive)")
+    metrics = [ClassificationMetrics(len(class_names)) for _ in backends]
+    all_labels = []
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batches = iter_batches(paths, labels, batch_size, executor, prefetch=4 * batch_size)
+        for batch_index, (batch, batch_labels) in enumerate(tqdm(batches, total=-(-len(paths) // batch_size), desc="Evaluating")):
+            for backend, model_metrics in zip(backends, metrics):
+                if batch_index < warmup_batches:
+                    backend.run(batch, count=False)  # first runs include allocations / kernel selection, not timed
+                start = time.perf_counter()
+                logits = backend.run(batch)
+                model_metrics.update(logits, batch_labels, time.perf_counter() - start)
+            all_labels.append(batch_labels)
+    wall_time = time.perf_counter() - start_time
+    print(f"Pass over the split took {wall_time:.1f}s ({sum(len(b) for b in all_labels) / max(wall_time, 1e-9):.1f} img/s "
+          f"end to end for {len(backends)} models)")
+
+    reference_predictions = np.concatenate(metrics[0].predictions) if metrics[0].predictions else np.zeros(0)
+    results = []
+    for model_path, backend, model_metrics in zip(model_paths, backends, metrics):
+        summary = model_metrics.summary()
+        predictions = np.concatenate(model_metrics.predictions) if model_metrics.predictions else np.zeros(0)
+        summary.update({
+            "model": model_path,
+            "backend": backend.name,
+            "accuracy_drop": results[0]["accuracy"] - summary["accuracy"] if results else 0.0,
+            "agreement_with_reference": float((predictions == reference_predictions).mean()) if len(predictions) else 0.0,
+            "top_confusions": model_metrics.top_confusions(class_names),
+        })
+        if getattr(backend, "adaptive", None) is not None:
+            summary["full_resolution_rate"] = backend.full_resolution / max(backend.images, 1)
+        results.append(summary)
+        if confusion_dir:
+            write_confusion(model_metrics, class_names, confusion_dir, os.path.splitext(os.path.basename(os.path.normpath(model_path)))[0])
+    return results
+
+
+def print_table(results: List[dict]) -> None:
+    header = (f"{'model':<40} {'backend':<8} {'acc':>7} {'drop':>7} {'agree':>7} {'top5':>7} {'F1 (w)':>7} {'ECE':>6} "
+              f"{'img/s':>8} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{os.path.basename(os.path.normpath(r['model'])):<40} {r['backend']:<8} {r['accuracy']:>7.4f} {r['accuracy_drop']:>+7.4f} "
+              f"{r['agreement_with_reference']:>7.4f} {r['top5_accuracy']:>7.4f} {r['f1_weighted']:>7.4f} {r['ece']:>6.4f} "
+              f"{r['images_per_second']:>8.1f} {r['batch_latency_p50_ms']:>7.1f} {r['batch_latency_p90_ms']:>7.1f} {r['batch_latency_p99_ms']:>7.1f}")
+    for r in results:
+        if "full_resolution_rate" in r:
+            print(f"{os.path.basename(os.path.normpath(r['model']))}: {r['full_resolution_rate']:.1%} of the images fell back to full resolution")
+    for r in results:
+        if r["top_confusions"]:
+            print(f"\nMost confused ({os.path.basename(os.path.normpath(r['model']))}): "
+                  + ", ".join(f"{true} -> {predicted} ({count})" for true, predicted, count in r["top_confusions"][:5]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy / calibration / speed of the classifier and its exports on the validation split.")
+    parser.add_argument("--models", type=str, nargs="+", required=True,
+                        help="Checkpoint directories (PyTorch) and / or .onnx exports, the first one is the reference")
+    parser.add_argument("--config", type=str, default=None, help="Training config (dataset / split store paths, num_classes)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--batch-size", type=int, default=32, help="Use 1 for per image latency")
+    parser.add_argument("--workers", type=int, default=8, help="Decode / preprocess threads")
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    parser.add_argument("--confusion-dir", type=str, default=None, help="Write confusion matrix / per-class CSVs per model")
+    parser.add_argument("--report", type=str, default=None, help="Write all results as JSON")
+    parser.add_argument("--adaptive", action="store_true", help="Also evaluate every checkpoint in early exit mode")
+    parser.add_argument("--low-resolution", type=int, default=168, help="Cheap pass resolution, a multiple of 14")
+    parser.add_argument("--keep-ratio", type=float, default=0.5, help="Patch tokens kept after --prune-after-layer blocks")
+    parser.add_argument("--prune-after-layer", type=int, default=4)
+    parser.add_argument("--confidence-threshold", type=float, default=0.8, help="Below it the image reruns at full resolution")
+    args = parser.parse_args()
+
+    cfg = load_train_config(args.config)
+    for assignment in args.overrides:
+        cfg.override(*parse_override(assignment))
+
+    adaptive = None
+    if args.adaptive:
+        adaptive = {"low_resolution": args.low_resolution, "keep_ratio": args.keep_ratio,
+                    "prune_after_layer": args.prune_after_layer, "confidence_threshold": args.confidence_threshold}
+    results = evaluate(args.models, cfg, args.batch_size, args.workers, args.max_images, args.providers, args.confusion_dir,
+                       adaptive=adaptive)
+    print_table(results)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {args.report}")
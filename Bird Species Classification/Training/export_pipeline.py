@@ -0,0 +1,509 @@
+'''
+    Reproducible ONNX export of the classifier: one command replaces the export.ipynb / quant.ipynb / convert.py steps
+    1. export      checkpoint -> basefp32.onnx (torch.onnx, dynamic batch axis)
+    2. simplify    onnxslim (constant folding, redundant op removal)
+    3. cleanup     graphsurgeon: Resize antialias fix, fold constants, dead node cleanup, toposort,
+                   IR version capped to what onnxruntime loads (instead of forcing ir_version = 10)
+                   -> basefp32_slimmed.onnx
+    4. variants    basefp16_slimmed.onnx (FP16 weights, FP32 I/O), baseQUInt8_quantized_dynamic.onnx,
+                   baseint8_static.onnx (QDQ, calibrated on train split images from the manifest),
+                   basefp32_fused.onnx / basefp16_fused.onnx (onnxruntime transformer optimizer: Attention,
+                   SkipLayerNormalization, LayerNormalization, BiasGelu / FastGelu fusions over the backbone and the
+                   CLS + mean patch head) and an NHWC input copy of each (*_nhwc.onnx, dynamic batch kept)
+    5. checks      numeric parity against the PyTorch checkpoint (or the FP32 export) on validation images, and
+                   latency (batch 1 p50 / p95) + throughput per variant, --profile adds the onnxruntime time per op type
+                   (before / after fusion) -> export_report.json
+
+    The fusions match the TorchScript export of eager attention best, export with --exporter torchscript when the fused
+    variants are wanted. Which fusions applied is printed and stored in the report: DINOv2's LayerScale Mul between the
+    attention output projection and the residual Add can keep Attention unfused while the LayerNorm / GELU fusions apply.
+
+    Needs: onnx, onnxruntime, onnxslim, onnx-graphsurgeon, onnxconverter-common (+ torch / transformers for step 1)
+
+    usage: python export_pipeline.py --checkpoint ./configs/ [--output-dir ./quant] [--variants fp32 fp16 int8_dynamic int8_static]
+           python export_pipeline.py --checkpoint ./configs/ --exporter torchscript --variants fp32 fp32_fused fp16_fused --profile
+           python export_pipeline.py --onnx ./quant/basefp32.onnx  (start from an existing export, skips step 1)
+'''
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import TrainConfig, load_train_config, parse_override
+
+MAX_IR_VERSION = 10  # Highest ONNX IR version the deployed onnxruntime builds load
+INPUT_NAME = "pixel_values"
+ALL_VARIANTS = ("fp32", "fp16", "int8_dynamic", "int8_static", "fp32_fused", "fp16_fused")
+VARIANT_FILES = {
+    "fp32": "basefp32_slimmed.onnx",
+    "fp16": "basefp16_slimmed.onnx",
+    "int8_dynamic": "baseQUInt8_quantized_dynamic.onnx",
+    "int8_static": "baseint8_static.onnx",
+    "fp32_fused": "basefp32_fused.onnx",
+    "fp16_fused": "basefp16_fused.onnx",
+}
+# Minimum top-1 agreement with the reference on the parity images
+PARITY_AGREEMENT = {"fp32": 0.999, "fp16": 0.99, "int8_dynamic": 0.95, "int8_static": 0.95, "fp32_fused": 0.999, "fp16_fused": 0.99}
+
+
+def _require(module: str, package: str):
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise ImportError(f"The export pipeline needs {package}: pip install {package}") from e
+
+
+def nhwc_path(path: str) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}_nhwc{extension}"
+
+
+# ── Steps ─────────────────────────────────────────────────────────────────────
+def export_classifier(checkpoint_dir: str, output_path: str, cfg: TrainConfig, opset: int = 20, exporter: str = "dynamo") -> None:
+    """
+    exporter "dynamo" is the export.ipynb export, "torchscript" traces eager attention, the graph pattern the
+    onnxruntime transformer fusions recognize. Batch axis dynamic in both.
+    """
+    import torch
+    from evaluate import TorchBackend
+
+    model = TorchBackend(checkpoint_dir, cfg).model.to("cpu")
+    dummy = torch.randn(2, 3, 224, 224)
+    if exporter == "torchscript":
+        # SDPA traces into ops the fusion doesn't match, the backbone layers read the shared config at forward time
+        model.config._attn_implementation = "eager"
+        # The antialiased bicubic position embedding resize has no TorchScript ONNX symbolic, and tracing always runs it:
+        # bake the 224 x 224 table in as a constant (same values, spatial size fixed like the dynamo export)
+        embeddings = model.backbone.embeddings
+        with torch.no_grad():
+            num_patches = (224 // model.config.patch_size) ** 2
+            position_embeddings = embeddings.interpolate_pos_encoding(torch.zeros(1, 1 + num_patches, model.config.hidden_size), 224, 224)
+        embeddings.interpolate_pos_encoding = lambda _embeddings, _height, _width: position_embeddings
+        torch.onnx.export(
+            model,
+            (dummy,),
+            output_path,
+            export_params=True,
+            opset_version=opset,
+            input_names=[INPUT_NAME],
+            output_names=["logits"],
+            dynamic_axes={INPUT_NAME: {0: "batch_size"}, "logits": {0: "batch_size"}},
+            dynamo=False,
+            do_constant_folding=True,
+        )
+        return
+    torch.onnx.export(
+        model,
+        (dummy,),
+        output_path,
+        export_params=True,
+        opset_version=opset,
+        input_names=[INPUT_NAME],
+        output_names=["logits"],
+        dynamic_shapes={INPUT_NAME: {0: "batch_size"}},
+        dynamo=True,
+        optimize=True,
+        report=False,
+        do_constant_folding=True,
+    )
+
+
+def simplify(model_path: str, output_path: str) -> None:
+    onnxslim = _require("onnxslim", "onnxslim")
+    onnxslim.slim(model_path, output_path)
+
+
+def cleanup(model_path: str, output_path: str, max_ir_version: int = MAX_IR_VERSION, resize_antialias: Optional[int] = 1) -> None:
+    """
+    graphsurgeon pass. resize_antialias: value forced on Resize nodes (export.ipynb sets 1 so the position embedding
+    interpolation matches PyTorch), None leaves them alone.
+    """
+    onnx = _require("onnx", "onnx")
+    gs = _require("onnx_graphsurgeon", "onnx-graphsurgeon")
+
+    graph = gs.import_onnx(onnx.load(model_path))
+    if resize_antialias is not None:
+        for node in graph.nodes:
+            if node.op == "Resize" and "antialias" in node.attrs:
+                node.attrs["antialias"] = resize_antialias
+    graph.fold_constants().cleanup().toposort()
+    model = gs.export_onnx(graph)
+    # Newer onnx packages stamp an IR version older onnxruntime releases refuse, only lower it when needed
+    model.ir_version = min(model.ir_version, max_ir_version)
+    onnx.checker.check_model(model)
+    onnx.save(model, output_path)
+
+
+def to_fp16(model_path: str, output_path: str) -> None:
+    """
+    FP16 weights / compute with FP32 inputs and outputs (same as convert.py).
+    """
+    onnx = _require("onnx", "onnx")
+    converter = _require("onnxconverter_common", "onnxconverter-common")
+    onnx.save(converter.convert_float_to_float16(onnx.load(model_path), keep_io_types=True), output_path)
+
+
+def to_nhwc(model_path: str, output_path: str, input_name: str = INPUT_NAME) -> None:
+    """
+    NHWC input: a Transpose (NHWC -> NCHW) is inserted after the input, batch / spatial axes keep their dynamic names.
+    """
+    onnx = _require("onnx", "onnx")
+    gs = _require("onnx_graphsurgeon", "onnx-graphsurgeon")
+
+    graph = gs.import_onnx(onnx.load(model_path))
+    input_var = next((inp for inp in graph.inputs if inp.name == input_name), None)
+    if input_var is None:
+        raise ValueError(f"Input '{input_name}' not found in {model_path}")
+    batch, channels, height, width = input_var.shape
+    transposed = gs.Variable(name=f"{input_name}_nchw", dtype=input_var.dtype, shape=[batch, channels, height, width])
+    input_var.shape = [batch, height, width, channels]
+
+    # Every consumer of the input reads the transposed tensor instead
+    for node in graph.nodes:
+        node.inputs = [transposed if inp is input_var else inp for inp in node.inputs]
+    graph.nodes.insert(0, gs.Node(op="Transpose", name="Transpose_NHWC_to_NCHW", inputs=[input_var], outputs=[transposed],
+                                  attrs={"perm": [0, 3, 1, 2]}))
+    graph.cleanup().toposort()
+    model = gs.export_onnx(graph)
+    model.ir_version = min(model.ir_version, MAX_IR_VERSION)
+    onnx.save(model, output_path)
+
+
+def quantize_dynamic_int8(model_path: str, output_path: str) -> None:
+    """
+    Dynamic QUInt8 weights, as in quant.ipynb.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared = output_path + ".prep.onnx"
+    quant_pre_process(model_path, prepared, skip_symbolic_shape=False)
+    try:
+        quantize_dynamic(model_input=prepared, model_output=output_path, weight_type=QuantType.QUInt8,
+                         extra_options={"ActivationSymmetric": False, "WeightSymmetric": True})
+    finally:
+        os.remove(prepared)
+
+
+def quantize_static_int8(model_path: str, output_path: str, calibration: np.ndarray, batch_size: int = 8) -> None:
+    """
+    Static QDQ INT8 (per-channel weights), activation ranges calibrated on `calibration` (N, 3, 224, 224) images.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class Reader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self._batches = iter([calibration[i:i + batch_size] for i in range(0, len(calibration), batch_size)])
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {INPUT_NAME: batch}
+
+    prepared = output_path + ".prep.onnx"
+    quant_pre_process(model_path, prepared, skip_symbolic_shape=False)
+    try:
+        quantize_static(model_input=prepared, model_output=output_path, calibration_data_reader=Reader(),
+                        quant_format=QuantFormat.QDQ, per_channel=True, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, calibrate_method=CalibrationMethod.MinMax)
+    finally:
+        os.remove(prepared)
+
+
+def optimize_transformer(model_path: str, output_path: str, num_heads: int = 0, hidden_size: int = 0, fp16: bool = False,
+                         gelu_approximation: bool = False, use_gpu: bool = False) -> Dict[str, int]:
+    """
+    onnxruntime transformer optimizer (ViT rules) on the FP32 graph, returns the fused op counts. Only the fusions are
+    applied (opt_level 0), the session applies its own graph optimizations at load so the file stays provider neutral.
+    num_heads / hidden_size 0: read from the graph. gelu_approximation swaps the exact (erf) GELU DINOv2 uses for
+    FastGelu (tanh), faster but not bit exact, the parity check shows what it costs.
+    """
+    onnx = _require("onnx", "onnx")
+    from onnxruntime.transformers.fusion_options import FusionOptions
+    from onnxruntime.transformers.optimizer import optimize_model
+
+    options = FusionOptions("vit")
+    options.enable_gelu_approximation = gelu_approximation
+    optimized = optimize_model(model_path, model_type="vit", num_heads=num_heads, hidden_size=hidden_size,
+                               optimization_options=options, opt_level=0, use_gpu=use_gpu)
+    if fp16:
+        optimized.convert_float_to_float16(keep_io_types=True)
+    optimized.model.ir_version = min(optimized.model.ir_version, MAX_IR_VERSION)
+    onnx.save(optimized.model, output_path)
+    return {op: count for op, count in optimized.get_fused_operator_statistics().items() if count}
+
+
+# ── Data / checks ─────────────────────────────────────────────────────────────
+def sample_images(cfg: TrainConfig, split: str, count: int, seed: int = 0) -> np.ndarray:
+    """
+    (count, 3, 224, 224) preprocessed images of the "train" or "val" split, sampled with a fixed seed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from evaluate import load_image
+    from manifest import load_or_build_manifest
+    from split_store import load_split
+
+    manifest = load_or_build_manifest(cfg.dataset_dir, cfg.manifest_path)
+    image_paths = manifest.image_paths(cfg.dataset_dir)
+    train_idx, val_idx, _labels, _classes = load_split(manifest, store_path=cfg.split_store_path, test_size=cfg.test_size,
+                                                       seed=cfg.seed, legacy_split_file=cfg.legacy_split_file)
+    indices = train_idx if split == "train" else val_idx
+    chosen = np.random.default_rng(seed).choice(indices, size=min(count, len(indices)), replace=False)
+    with ThreadPoolExecutor() as executor:
+        return np.stack(list(executor.map(load_image, [image_paths[i] for i in np.sort(chosen)])))
+
+
+def create_session(model_path: str, providers: Optional[List[str]] = None):
+    import onnxruntime as ort
+
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.log_severity_level = 3
+    return ort.InferenceSession(model_path, sess_options, providers=providers or ["CPUExecutionProvider"])
+
+
+def run_onnx(session, images: np.ndarray, batch_size: int = 8) -> np.ndarray:
+    """
+    NCHW images through an NCHW or NHWC session, in batches.
+    """
+    model_input = session.get_inputs()[0]
+    nhwc = model_input.shape[-1] == 3
+    outputs = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        if nhwc:
+            batch = np.ascontiguousarray(batch.transpose(0, 2, 3, 1))
+        outputs.append(session.run(None, {model_input.name: batch})[0])
+    return np.concatenate(outputs).astype(np.float32)
+
+
+def parity(reference: np.ndarray, logits: np.ndarray) -> Dict[str, float]:
+    cosine = (reference * logits).sum(axis=1) / np.maximum(np.linalg.norm(reference, axis=1) * np.linalg.norm(logits, axis=1), 1e-12)
+    return {
+        "max_abs_diff": float(np.abs(reference - logits).max()),
+        "mean_abs_diff": float(np.abs(reference - logits).mean()),
+        "min_cosine": float(cosine.min()),
+        "top1_agreement": float((reference.argmax(axis=1) == logits.argmax(axis=1)).mean()),
+    }
+
+
+def measure_latency(session, batch_size: int = 8, runs: int = 30, warmup: int = 3) -> Dict[str, float]:
+    model_input = session.get_inputs()[0]
+    nhwc = model_input.shape[-1] == 3
+
+    def timed(batch: int, count: int) -> np.ndarray:
+        shape = (batch, 224, 224, 3) if nhwc else (batch, 3, 224, 224)
+        data = np.random.default_rng(0).standard_normal(shape, dtype=np.float32)
+        for _ in range(warmup):
+            session.run(None, {model_input.name: data})
+        times = []
+        for _ in range(count):
+            start = time.perf_counter()
+            session.run(None, {model_input.name: data})
+            times.append(time.perf_counter() - start)
+        return np.array(times) * 1000
+
+    single = timed(1, runs)
+    batched = timed(batch_size, max(runs // 3, 5))
+    return {
+        "latency_p50_ms": float(np.percentile(single, 50)),
+        "latency_p95_ms": float(np.percentile(single, 95)),
+        "batch_size": batch_size,
+        "images_per_second": float(batch_size * 1000 / batched.mean()),
+    }
+
+
+def profile_ops(model_path: str, providers: Optional[List[str]] = None, batch_size: int = 1, runs: int = 10,
+                top: int = 12) -> List[dict]:
+    """
+    onnxruntime profiler on `runs` batches: kernel time per op type, most expensive first.
+    """
+    import onnxruntime as ort
+
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.log_severity_level = 3
+    sess_options.enable_profiling = True
+    sess_options.profile_file_prefix = os.path.join(os.path.dirname(os.path.abspath(model_path)), "ort_profile")
+    session = ort.InferenceSession(model_path, sess_options, providers=providers or ["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    shape = (batch_size, 224, 224, 3) if model_input.shape[-1] == 3 else (batch_size, 3, 224, 224)
+    data = np.random.default_rng(0).standard_normal(shape, dtype=np.float32)
+    for _ in range(runs):
+        session.run(None, {model_input.name: data})
+    profile_path = session.end_profiling()
+    with open(profile_path, encoding="utf-8") as f:
+        events = json.load(f)
+    os.remove(profile_path)
+
+    # Node events come in pairs (fence / kernel), only the kernel time is the op itself
+    totals: Dict[str, List[float]] = {}
+    for event in events:
+        if event.get("cat") == "Node" and event.get("name", "").endswith("_kernel_time"):
+            entry = totals.setdefault(event["args"]["op_name"], [0.0, 0])
+            entry[0] += event["dur"]
+            entry[1] += 1
+    overall = sum(total for total, _calls in totals.values()) or 1.0
+    ranked = sorted(totals.items(), key=lambda item: -item[1][0])[:top]
+    return [{"op": op, "ms_per_run": total / 1000 / runs, "share": total / overall, "calls_per_run": calls // runs}
+            for op, (total, calls) in ranked]
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+def run_pipeline(
+    cfg: TrainConfig,
+    output_dir: str = "./quant",
+    checkpoint_dir: Optional[str] = None,
+    onnx_path: Optional[str] = None,
+    variants: List[str] = ALL_VARIANTS,
+    nhwc: bool = True,
+    opset: int = 20,
+    parity_images: int = 64,
+    calibration_images: int = 200,
+    batch_size: int = 8,
+    skip_simplify: bool = False,
+    providers: Optional[List[str]] = None,
+    exporter: str = "dynamo",
+    num_heads: int = 0,
+    hidden_size: int = 0,
+    gelu_approximation: bool = False,
+    profile: bool = False,
+) -> dict:
+    os.makedirs(output_dir, exist_ok=True)
+    timings: Dict[str, float] = {}
+    report: dict = {"variants": {}, "steps_seconds": timings}
+
+    def step(name: str, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[name] = round(time.perf_counter() - start, 2)
+        print(f"[export] {name} done in {timings[name]:.1f}s")
+        return result
+
+    # 1-3: FP32 base
+    exported = os.path.join(output_dir, "basefp32.onnx")
+    if onnx_path is None:
+        if checkpoint_dir is None:
+            raise ValueError("Pass --checkpoint (export from PyTorch) or --onnx (start from an existing export)")
+        step("export", export_classifier, checkpoint_dir, exported, cfg, opset, exporter)
+    elif os.path.abspath(onnx_path) != os.path.abspath(exported):
+        shutil.copyfile(onnx_path, exported)
+    fp32_path = os.path.join(output_dir, VARIANT_FILES["fp32"])
+    if skip_simplify:
+        shutil.copyfile(exported, fp32_path)
+    else:
+        step("simplify", simplify, exported, fp32_path)
+    step("cleanup", cleanup, fp32_path, fp32_path)
+
+    # Parity reference: the PyTorch checkpoint when we have it, else the FP32 export
+    images = sample_images(cfg, "val", parity_images) if parity_images else None
+    reference, reference_name = None, None
+    if images is not None:
+        if checkpoint_dir is not None:
+            from evaluate import TorchBackend
+            torch_backend = TorchBackend(checkpoint_dir, cfg)
+            reference = np.concatenate([torch_backend.run(images[i:i + batch_size]) for i in range(0, len(images), batch_size)])
+            reference_name = "pytorch"
+        else:
+            reference = run_onnx(create_session(fp32_path, providers), images, batch_size)
+            reference_name = "fp32"
+    report["parity_reference"] = reference_name
+
+    # Fusion shapes from the checkpoint config (dinov2 small: 6 heads x 384) when not given
+    config_path = os.path.join(checkpoint_dir, "config.json") if checkpoint_dir else None
+    if (not num_heads or not hidden_size) and config_path and os.path.exists(config_path):
+        with open(config_path, encoding="utf-8") as f:
+            backbone_config = json.load(f)
+        num_heads = num_heads or backbone_config.get("num_attention_heads", 0)
+        hidden_size = hidden_size or backbone_config.get("hidden_size", 0)
+
+    # 4: variants
+    paths = {"fp32": fp32_path}
+    for variant in variants:
+        path = os.path.join(output_dir, VARIANT_FILES[variant])
+        if variant == "fp16":
+            step("fp16", to_fp16, fp32_path, path)
+        elif variant == "int8_dynamic":
+            step("int8_dynamic", quantize_dynamic_int8, fp32_path, path)
+        elif variant == "int8_static":
+            calibration = sample_images(cfg, "train", calibration_images, seed=1)
+            step("int8_static", quantize_static_int8, fp32_path, path, calibration, batch_size)
+        elif variant in ("fp32_fused", "fp16_fused"):
+            fused = step(variant, optimize_transformer, fp32_path, path, num_heads, hidden_size, variant == "fp16_fused",
+                         gelu_approximation, "CUDAExecutionProvider" in (providers or []))
+            report.setdefault("fusion", {})[variant] = fused
+            print(f"[export] {variant} fused ops: {', '.join(f'{op} x{count}' for op, count in fused.items()) or 'none'}")
+        paths[variant] = path
+    if nhwc:
+        for variant in list(paths):
+            paths[f"{variant}_nhwc"] = nhwc_path(paths[variant])
+            step(f"{variant}_nhwc", to_nhwc, paths[variant], paths[f"{variant}_nhwc"])
+
+    # 5: checks
+    all_passed = True
+    for name, path in paths.items():
+        session = create_session(path, providers)
+        entry = {"path": path, "size_mb": round(os.path.getsize(path) / 2 ** 20, 2)}
+        if reference is not None:
+            entry.update(parity(reference, run_onnx(session, images, batch_size)))
+            entry["parity_passed"] = entry["top1_agreement"] >= PARITY_AGREEMENT[name.replace("_nhwc", "")]
+            all_passed &= entry["parity_passed"]
+        entry.update(measure_latency(session, batch_size))
+        if profile:
+            entry["op_profile"] = profile_ops(path, providers)
+        report["variants"][name] = entry
+        print(f"[export] {name:<18} {entry['size_mb']:>8.1f} MB  p50 {entry['latency_p50_ms']:.1f} ms  "
+              f"{entry['images_per_second']:.1f} img/s" + (f"  agreement {entry['top1_agreement']:.4f}  max |diff| {entry['max_abs_diff']:.2e}"
+                                                           f"  {'PASS' if entry['parity_passed'] else 'FAIL'}" if "parity_passed" in entry else ""))
+    report["parity_passed"] = all_passed
+
+    if profile:
+        # Where the time goes per variant, e.g. MatMul / Softmax / LayerNormalization before fusion vs Attention after
+        for name, entry in report["variants"].items():
+            print(f"[profile] {name:<18} " + "  ".join(f"{op['op']} {op['ms_per_run']:.2f} ms ({op['share']:.0%})"
+                                                      for op in entry["op_profile"][:6]))
+
+    with open(os.path.join(output_dir, "export_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[export] Report written to {os.path.join(output_dir, 'export_report.json')}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, simplify, clean, convert and check the classifier ONNX variants.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--checkpoint", type=str, help="Fine-tuned checkpoint directory (e.g. ./configs/)")
+    source.add_argument("--onnx", type=str, help="Existing FP32 export, skips the PyTorch export")
+    parser.add_argument("--output-dir", type=str, default="./quant")
+    parser.add_argument("--variants", type=str, nargs="+", default=list(ALL_VARIANTS), choices=ALL_VARIANTS)
+    parser.add_argument("--no-nhwc", action="store_true", help="Don't emit the NHWC input copies")
+    parser.add_argument("--opset", type=int, default=20)
+    parser.add_argument("--parity-images", type=int, default=64, help="Validation images for the parity check, 0 to skip")
+    parser.add_argument("--calibration-images", type=int, default=200, help="Train images for static INT8 calibration")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--skip-simplify", action="store_true")
+    parser.add_argument("--exporter", type=str, default="dynamo", choices=["dynamo", "torchscript"],
+                        help="torchscript exports eager attention, which the fusions of the *_fused variants match best")
+    parser.add_argument("--num-heads", type=int, default=0, help="Attention heads for the fusion, 0: checkpoint config or graph")
+    parser.add_argument("--hidden-size", type=int, default=0, help="Hidden size for the fusion, 0: checkpoint config or graph")
+    parser.add_argument("--gelu-approximation", action="store_true", help="FastGelu (tanh) instead of the exact GELU in the fused variants")
+    parser.add_argument("--profile", action="store_true", help="Per op type onnxruntime profile of every variant")
+    parser.add_argument("--providers", type=str, nargs="+", default=None)
+    parser.add_argument("--strict", action="store_true", help="Exit with an error when a variant fails its parity check")
+    parser.add_argument("--config", type=str, default=None, help="Training config (dataset / split store paths, num_classes)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE")
+    args = parser.parse_args()
+
+    cfg = load_train_config(args.config)
+    for assignment in args.overrides:
+        cfg.override(*parse_override(assignment))
+
+    report = run_pipeline(cfg, args.output_dir, args.checkpoint, args.onnx, args.variants, not args.no_nhwc, args.opset,
+                          args.parity_images, args.calibration_images, args.batch_size, args.skip_simplify, args.providers,
+                          args.exporter, args.num_heads, args.hidden_size, args.gelu_approximation, args.profile)
+    if args.strict and not report["parity_passed"]:
+        raise SystemExit("Parity check failed, see export_report.json")
@@ -7,6 +7,8 @@ from model import CustomDinoV2ClassifierWithReg
 from config import BASE_MODEL_NAME, NUM_CLASSES , HIDDEN_DIM
 
 checkpoint_path = "./configs/"
+# Early exit mode (model.predict_adaptive): 168px pass with pruned patch tokens, the full model only when it's unsure
+ADAPTIVE = False
 
 # Load processor and fine-tuned DinoV2
 processor = AutoImageProcessor.from_pretrained(BASE_MODEL_NAME, cache_dir="./cache", use_fast=True)
@@ -39,8 +41,12 @@ print(f"{inputs['pixel_values'].shape, inputs['pixel_values'].dtype}")
 print(inputs.keys())
 
 with torch.no_grad():
-    outputs = model(**inputs)
-    probs = F.softmax(outputs.logits, dim=-1)
+    if ADAPTIVE:
+        logits, fell_back = model.predict_adaptive(inputs["pixel_values"])
+        print(f"Full resolution fallback: {bool(fell_back[0])}")
+    else:
+        logits = model(**inputs).logits
+    probs = F.softmax(logits, dim=-1)
     pred_id = int(torch.argmax(probs, dim=-1).item()) 
     confidence = probs[0][pred_id].item()  
 
@@ -0,0 +1,250 @@
+'''
+    Validate and normalize raw (scraped) images into the training dataset folder
+    - Every file is fully decoded in a process pool: truncated / corrupt files and non-images are rejected
+    - The real format is detected from the file content, not the extension scraped from the URL
+    - EXIF orientation is applied, then the image is downscaled to --max-side and re-encoded as RGB JPEG / WebP without EXIF
+    - Width, height and content hash of the written files go straight into the dataset manifest
+    - Incremental: outputs newer than their source are kept as they are
+
+    Re-encoding changes the content hashes: the train/val assignment of the source file (or of the output it replaces)
+    is recorded in the split store under the new hash, so validation images stay in validation.
+
+    usage: python ingest.py <raw dataset dir> [--output ./dataset] [--max-side 512] [--format jpeg]
+'''
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import DATASET_DIR
+from manifest import MANIFEST_PATH, build_manifest, hash_file
+from split_store import SPLIT_STORE_PATH, SplitStore
+
+OUTPUT_FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+# Extensions that count as "correctly labelled" for each detected format
+FORMAT_EXTENSIONS = {
+    "JPEG": (".jpg", ".jpeg", ".jfif"),
+    "PNG": (".png",),
+    "WEBP": (".webp",),
+    "GIF": (".gif",),
+    "BMP": (".bmp",),
+    "TIFF": (".tif", ".tiff"),
+    "MPO": (".jpg", ".jpeg"),
+}
+# Anything larger is treated as a broken / malicious file instead of a photo
+Image.MAX_IMAGE_PIXELS = 100_000_000
+
+
+def normalize_image(
+    src_path: str,
+    dst_path: str,
+    max_side: int = 512,
+    output_format: str = "jpeg",
+    quality: int = 90,
+) -> Tuple[str, str, int, int, int, int, str]:
+    """
+    Decode `src_path`, write the normalized image to `dst_path`.
+    Returns (status, detected format, width, height, content hash, output bytes, reason), status is "ok" or "rejected".
+    """
+    try:
+        with Image.open(src_path) as image:
+            detected = image.format or "unknown"
+            # JPEG can decode straight at a reduced scale (never below max_side)
+            image.draft("RGB", (max_side, max_side))
+            # load() decodes every pixel, this is what catches truncated downloads
+            image.load()
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+                # Flatten transparency on white instead of the black convert("RGB") would give
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+                image = background
+            else:
+                image = image.convert("RGB")
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    except Exception as e:
+        return "rejected", "unknown", -1, -1, 0, 0, f"{type(e).__name__}: {e}"
+
+    # Encode in memory: the bytes are hashed for the manifest before being written, no extra read
+    buffer = io.BytesIO()
+    if output_format == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+
+    tmp_path = dst_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, dst_path)
+
+    content_hash = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+    return "ok", detected, image.width, image.height, content_hash, len(data), ""
+
+
+def _normalize_job(job: tuple) -> tuple:
+    # Hashes the image was known by before re-encoding: the output it replaces first, then the source file
+    src_path, dst_path = job[0], job[1]
+    previous = [hash_file(dst_path)] if os.path.exists(dst_path) else []
+    previous.append(hash_file(src_path))
+    return previous, normalize_image(*job)
+
+
+def carry_over_splits(store_path: str, previous: Dict[int, List[int]]) -> int:
+    """
+    Record the split of each image's previous hashes under its new content hash. Images the store has never seen
+    are left to split_store.load_split. Returns the number of hashes added.
+    """
+    if not previous or not os.path.exists(store_path):
+        return 0
+    store = SplitStore.load(store_path)
+    new_hashes = np.array(list(previous), dtype=np.uint64)
+    unknown = store.lookup(new_hashes) < 0
+    carried_hashes, carried_splits = [], []
+    for new_hash in new_hashes[unknown].tolist():
+        old_splits = store.lookup(np.array(previous[new_hash], dtype=np.uint64))
+        old_splits = old_splits[old_splits >= 0]
+        if len(old_splits):
+            carried_hashes.append(new_hash)
+            carried_splits.append(old_splits[0])
+    if carried_hashes:
+        store.add(np.array(carried_hashes, dtype=np.uint64), np.array(carried_splits, dtype=np.uint8))
+        store.save(store_path)
+    return len(carried_hashes)
+
+
+def plan_outputs(source_dir: str, output_dir: str, extension: str) -> List[Tuple[str, str, str]]:
+    """
+    Returns (class folder, source path, output path) for every file in `source_dir`/<class>/.
+    Output names keep the source stem, files that would collide (bird.png + bird.jpg) keep their old extension in the name.
+    """
+    jobs = []
+    for class_folder in sorted(os.listdir(source_dir)):
+        class_path = os.path.join(source_dir, class_folder)
+        if not os.path.isdir(class_path):
+            continue
+        used = set()
+        for name in sorted(os.listdir(class_path)):
+            src_path = os.path.join(class_path, name)
+            if name.startswith(".") or not os.path.isfile(src_path) or name.endswith((".part", ".tmp", ".json")):
+                continue
+            stem, old_extension = os.path.splitext(name)
+            out_name = stem + extension
+            if out_name in used:
+                out_name = f"{stem}_{old_extension.lstrip('.').lower()}{extension}"
+            used.add(out_name)
+            jobs.append((class_folder, src_path, os.path.join(output_dir, class_folder, out_name)))
+    return jobs
+
+
+def ingest(
+    source_dir: str,
+    output_dir: str = DATASET_DIR,
+    manifest_path: Optional[str] = MANIFEST_PATH,
+    split_store_path: Optional[str] = SPLIT_STORE_PATH,
+    max_side: int = 512,
+    output_format: str = "jpeg",
+    quality: int = 90,
+    workers: Optional[int] = None,
+    force: bool = False,
+    prune: bool = False,
+    report_path: Optional[str] = None,
+) -> dict:
+    start = time.perf_counter()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format {output_format}, expected one of {list(OUTPUT_FORMATS)}")
+
+    planned = plan_outputs(source_dir, output_dir, OUTPUT_FORMATS[output_format])
+    for class_folder in {class_folder for class_folder, _, _ in planned}:
+        os.makedirs(os.path.join(output_dir, class_folder), exist_ok=True)
+
+    # Skip outputs that are already newer than their source
+    pending = [
+        (src_path, dst_path) for _, src_path, dst_path in planned
+        if force or not os.path.exists(dst_path) or os.path.getmtime(dst_path) < os.path.getmtime(src_path)
+    ]
+    print(f"Ingest: {len(planned)} source images, {len(pending)} to process, {len(planned) - len(pending)} up to date")
+
+    formats: Counter = Counter()
+    mislabelled: List[str] = []
+    rejected: Dict[str, str] = {}
+    known: Dict[str, Tuple[int, int, int]] = {}
+    previous_hashes: Dict[int, List[int]] = {}
+    bytes_in = bytes_out = 0
+
+    jobs = [(src_path, dst_path, max_side, output_format, quality) for src_path, dst_path in pending]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_normalize_job, jobs, chunksize=16)
+        for (src_path, dst_path), (previous, result) in zip(pending, results):
+            status, detected, width, height, content_hash, size, reason = result
+            bytes_in += os.path.getsize(src_path)
+            if status != "ok":
+                rejected[src_path] = reason
+                # A stale output from an older, valid version of the file must not stay in the dataset
+                if os.path.exists(dst_path):
+                    os.remove(dst_path)
+                continue
+            formats[detected] += 1
+            bytes_out += size
+            if not src_path.lower().endswith(FORMAT_EXTENSIONS.get(detected, ())):
+                mislabelled.append(src_path)
+            known[os.path.relpath(dst_path, output_dir)] = (width, height, content_hash)
+            previous_hashes.setdefault(content_hash, previous)
+
+    if prune:
+        # Remove outputs whose source no longer exists (or is rejected)
+        expected = {dst_path for _, src_path, dst_path in planned if src_path not in rejected}
+        for class_folder in os.listdir(output_dir):
+            class_path = os.path.join(output_dir, class_folder)
+            if os.path.isdir(class_path):
+                for name in os.listdir(class_path):
+                    path = os.path.join(class_path, name)
+                    if path not in expected and os.path.isfile(path):
+                        os.remove(path)
+
+    print(f"Processed {len(pending) - len(rejected)} images, {len(rejected)} rejected, {len(mislabelled)} with a wrong extension")
+    print(f"Detected formats: {dict(formats)}")
+    if bytes_in:
+        print(f"Size: {bytes_in / 2**20:.1f} MB -> {bytes_out / 2**20:.1f} MB ({time.perf_counter() - start:.1f}s)")
+
+    if split_store_path:
+        carried = carry_over_splits(split_store_path, previous_hashes)
+        if carried:
+            print(f"Kept the train/val split of {carried} re-encoded images in {split_store_path}")
+
+    manifest = build_manifest(output_dir, manifest_path, known_info=known)
+
+    report = {"formats": dict(formats), "mislabelled": mislabelled, "rejected": rejected}
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    report["manifest_size"] = len(manifest)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate and normalize raw images into the training dataset.")
+    parser.add_argument("source_dir", type=str, help="Raw dataset, one folder per class")
+    parser.add_argument("--output", type=str, default=DATASET_DIR)
+    parser.add_argument("--manifest", type=str, default=MANIFEST_PATH)
+    parser.add_argument("--split-store", type=str, default=SPLIT_STORE_PATH,
+                        help="Split store whose train/val assignments follow the re-encoded images")
+    parser.add_argument("--max-side", type=int, default=512)
+    parser.add_argument("--format", type=str, default="jpeg", choices=list(OUTPUT_FORMATS))
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Re-encode every image, even if its output is up to date")
+    parser.add_argument("--prune", action="store_true", help="Delete outputs without a valid source image")
+    parser.add_argument("--report", type=str, default=None, help="Write rejected / mislabelled files to this JSON file")
+    args = parser.parse_args()
+
+    ingest(args.source_dir, args.output, args.manifest, args.split_store, args.max_side, args.format, args.quality,
+           args.workers, args.force, args.prune, args.report)
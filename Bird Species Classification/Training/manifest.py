@@ -0,0 +1,227 @@
+'''
+    Dataset manifest: one row per image (class folder, file name, size, mtime, width, height, content hash)
+    stored as numpy columns in a .npz
+    - Class folders are scanned concurrently with os.scandir
+    - Rebuilding is incremental: image headers and content hashes are only read for new or changed files (size / mtime)
+    - Rows keep the directory listing order (same order as the old os.listdir + glob scan),
+      so index based splits from split_indices.pkl keep pointing at the same files
+
+    usage: python manifest.py [--dataset-dir ./dataset] [--output ./cache/dataset_manifest.npz]
+'''
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import DATASET_DIR
+
+MANIFEST_VERSION = 2
+MANIFEST_PATH = os.path.join(".", "cache", "dataset_manifest.npz")
+
+
+@dataclass
+class Manifest:
+    classes: np.ndarray   # (C,) class folder names, sorted (same order as LabelEncoder.classes_)
+    labels: np.ndarray    # (N,) int32 index into classes
+    names: np.ndarray     # (N,) file name inside the class folder
+    sizes: np.ndarray     # (N,) int64 bytes
+    mtimes: np.ndarray    # (N,) int64 nanoseconds
+    widths: np.ndarray    # (N,) int32, -1 if the header could not be read
+    heights: np.ndarray   # (N,) int32, -1 if the header could not be read
+    hashes: np.ndarray    # (N,) uint64 blake2b-64 of the file content, stable across renames and listing order
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def relative_paths(self) -> List[str]:
+        return [os.path.join(self.classes[label], name) for label, name in zip(self.labels, self.names)]
+
+    def image_paths(self, dataset_dir: str) -> List[str]:
+        return [os.path.join(dataset_dir, path) for path in self.relative_paths()]
+
+    def label_names(self) -> np.ndarray:
+        return self.classes[self.labels]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write then rename so an interrupted save never leaves a truncated manifest behind
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            version=np.int32(MANIFEST_VERSION),
+            classes=self.classes,
+            labels=self.labels,
+            names=self.names,
+            sizes=self.sizes,
+            mtimes=self.mtimes,
+            widths=self.widths,
+            heights=self.heights,
+            hashes=self.hashes,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version {int(data['version'])} in {path}")
+            return cls(
+                classes=data["classes"],
+                labels=data["labels"],
+                names=data["names"],
+                sizes=data["sizes"],
+                mtimes=data["mtimes"],
+                widths=data["widths"],
+                heights=data["heights"],
+                hashes=data["hashes"],
+            )
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> int:
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def read_image_info(path: str) -> Tuple[int, int, int]:
+    """
+    Returns (width, height, content hash). Width / height are -1 if the image header can't be read.
+    """
+    # Image.open only parses the header, pixel data is not decoded
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except Exception:
+        width, height = -1, -1
+    return width, height, hash_file(path)
+
+
+def scan_class_folder(class_path: str) -> List[Tuple[str, int, int]]:
+    """
+    Returns (file name, size, mtime_ns) for every "*.*" file in the folder, in directory listing order.
+    """
+    entries = []
+    with os.scandir(class_path) as it:
+        for entry in it:
+            if entry.name.startswith(".") or "." not in entry.name or not entry.is_file():
+                continue
+            stat = entry.stat()
+            entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return entries
+
+
+def build_manifest(
+    dataset_dir: str = DATASET_DIR,
+    manifest_path: Optional[str] = MANIFEST_PATH,
+    workers: Optional[int] = None,
+    known_info: Optional[Dict[str, Tuple[int, int, int]]] = None,
+) -> Manifest:
+    """
+    Scan `dataset_dir` (one folder per class) and return its manifest.
+    If `manifest_path` exists, unchanged files reuse the stored dimensions and hashes. The result is saved back to `manifest_path`.
+    `known_info` maps "class/file" to (width, height, content hash) for files the caller just wrote (see ingest.py), they aren't read again.
+    """
+    start = time.perf_counter()
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+
+    previous: Dict[str, Tuple[int, int, int, int, int]] = {}
+    if manifest_path and os.path.exists(manifest_path):
+        try:
+            old = Manifest.load(manifest_path)
+            columns = zip(old.relative_paths(), old.sizes, old.mtimes, old.widths, old.heights, old.hashes)
+            for path, size, mtime, width, height, content_hash in columns:
+                previous[path] = (int(size), int(mtime), int(width), int(height), int(content_hash))
+        except Exception as e:
+            print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+
+    class_folders = [name for name in os.listdir(dataset_dir) if os.path.isdir(os.path.join(dataset_dir, name))]
+    classes = np.array(sorted(class_folders), dtype=str)
+    class_index = {name: idx for idx, name in enumerate(classes)}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        listings = list(executor.map(scan_class_folder, [os.path.join(dataset_dir, name) for name in class_folders]))
+
+        labels: List[int] = []
+        names: List[str] = []
+        sizes: List[int] = []
+        mtimes: List[int] = []
+        infos: List[Tuple[int, int, int]] = []
+        stale: List[int] = []
+        for class_folder, listing in zip(class_folders, listings):
+            for name, size, mtime in listing:
+                relative_path = os.path.join(class_folder, name)
+                cached = previous.get(relative_path)
+                if cached is not None and cached[0] == size and cached[1] == mtime:
+                    infos.append(cached[2:])
+                elif known_info and relative_path in known_info:
+                    infos.append(known_info[relative_path])
+                else:
+                    infos.append((-1, -1, 0))
+                    stale.append(len(names))
+                labels.append(class_index[class_folder])
+                names.append(name)
+                sizes.append(size)
+                mtimes.append(mtime)
+
+        # Only new / modified files need their header read and content hashed
+        stale_paths = [os.path.join(dataset_dir, classes[labels[i]], names[i]) for i in stale]
+        for i, info in zip(stale, executor.map(read_image_info, stale_paths)):
+            infos[i] = info
+
+    dims = np.array([info[:2] for info in infos], dtype=np.int32).reshape(-1, 2)
+    manifest = Manifest(
+        classes=classes,
+        labels=np.array(labels, dtype=np.int32),
+        names=np.array(names, dtype=str),
+        sizes=np.array(sizes, dtype=np.int64),
+        mtimes=np.array(mtimes, dtype=np.int64),
+        widths=dims[:, 0],
+        heights=dims[:, 1],
+        hashes=np.array([info[2] for info in infos], dtype=np.uint64),
+    )
+    if manifest_path:
+        manifest.save(manifest_path)
+
+    unreadable = int(np.count_nonzero(manifest.widths < 0))
+    print(f"Manifest: {len(manifest)} images, {len(classes)} classes, {len(stale)} (re)read, "
+          f"{unreadable} unreadable, {time.perf_counter() - start:.2f}s")
+    return manifest
+
+
+def load_manifest(manifest_path: str = MANIFEST_PATH) -> Manifest:
+    return Manifest.load(manifest_path)
+
+
+def load_or_build_manifest(dataset_dir: str = DATASET_DIR, manifest_path: str = MANIFEST_PATH, rebuild: bool = False) -> Manifest:
+    """
+    The saved manifest as it is, without scanning `dataset_dir` (consumers of an ingested dataset).
+    Falls back to build_manifest when it is missing / unreadable or `rebuild` is set.
+    """
+    if not rebuild and manifest_path and os.path.exists(manifest_path):
+        start = time.perf_counter()
+        try:
+            manifest = load_manifest(manifest_path)
+            print(f"Manifest: {len(manifest)} images, {len(manifest.classes)} classes loaded from {manifest_path} "
+                  f"({time.perf_counter() - start:.3f}s, rebuild it to pick up dataset changes)")
+            return manifest
+        except Exception as e:
+            print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+    return build_manifest(dataset_dir, manifest_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the dataset manifest.")
+    parser.add_argument("--dataset-dir", type=str, default=DATASET_DIR)
+    parser.add_argument("--output", type=str, default=MANIFEST_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    build_manifest(args.dataset_dir, args.output, workers=args.workers)
@@ -1,6 +1,7 @@
-from typing import Optional
+from typing import Optional, Tuple
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from transformers import Dinov2WithRegistersConfig, Dinov2WithRegistersPreTrainedModel, Dinov2WithRegistersPreTrainedModel, Dinov2WithRegistersModel
 from transformers.modeling_outputs import ImageClassifierOutput
 
@@ -42,16 +43,7 @@ class CustomDinoV2ClassifierWithReg(Dinov2WithRegistersPreTrainedModel):
         # (batch_size, sequence_length, hidden_size)
         sequence_output = outputs[0] 
 
-        # Extract tokens
-        cls_token = sequence_output[:, 0]
-
-        patch_tokens = sequence_output[:, 1 + self.config.num_register_tokens :]  # Exclude register tokens
-
-        # Combine [CLS] and mean of patch tokens
-        linear_input = torch.cat([cls_token, patch_tokens.mean(dim=1)], dim=1)
-
-        # Classifier head
-        logits = self.classifier(linear_input)
+        logits = self.classify_tokens(sequence_output)
 
         # Loss (if labels provided)
         loss = None
@@ -65,4 +57,88 @@ class CustomDinoV2ClassifierWithReg(Dinov2WithRegistersPreTrainedModel):
             logits=logits,
             hidden_states=outputs.hidden_states if output_hidden_states else None,
             attentions=outputs.attentions if output_attentions else None,
-        )
\ No newline at end of file
+        )
+
+    def classify_tokens(self, sequence_output: torch.Tensor) -> torch.Tensor:
+        # Extract tokens
+        cls_token = sequence_output[:, 0]
+
+        patch_tokens = sequence_output[:, 1 + self.config.num_register_tokens :]  # Exclude register tokens
+
+        # Combine [CLS] and mean of patch tokens
+        linear_input = torch.cat([cls_token, patch_tokens.mean(dim=1)], dim=1)
+
+        # Classifier head
+        return self.classifier(linear_input)
+
+    # Inference only: cheaper forward passes for CPU serving
+    def prune_tokens(self, hidden_states: torch.Tensor, layer: nn.Module, keep_ratio: float) -> torch.Tensor:
+        """
+        Keeps the keep_ratio patch tokens the [CLS] token attends to most in `layer` (mean over heads), plus [CLS] and
+        the register tokens. Only the [CLS] query is computed, the kept tokens stay in their original order.
+        """
+        num_prefix = 1 + self.config.num_register_tokens
+        batch_size, num_patches = hidden_states.shape[0], hidden_states.shape[1] - num_prefix
+        attention = layer.attention
+        if hasattr(attention, "q_proj"):  # transformers >= 5
+            query_proj, key_proj = attention.q_proj, attention.k_proj
+            heads, head_size = attention.num_attention_heads, attention.head_dim
+        else:
+            query_proj, key_proj = attention.attention.query, attention.attention.key
+            heads, head_size = attention.attention.num_attention_heads, attention.attention.attention_head_size
+
+        normed = layer.norm1(hidden_states)
+        query = query_proj(normed[:, :1]).view(batch_size, 1, heads, head_size).transpose(1, 2)
+        key = key_proj(normed[:, num_prefix:]).view(batch_size, num_patches, heads, head_size).transpose(1, 2)
+        importance = (query @ key.transpose(-1, -2) / head_size ** 0.5).softmax(dim=-1).mean(dim=1).squeeze(1)
+
+        keep = max(1, int(round(num_patches * keep_ratio)))
+        index = importance.topk(keep, dim=1).indices.sort(dim=1).values + num_prefix
+        patches = hidden_states.gather(1, index.unsqueeze(-1).expand(-1, -1, hidden_states.shape[-1]))
+        return torch.cat([hidden_states[:, :num_prefix], patches], dim=1)
+
+    def forward_pruned(
+        self,
+        pixel_values: torch.Tensor,
+        resolution: Optional[int] = None,
+        keep_ratio: float = 1.0,
+        prune_after_layer: int = 4,
+    ) -> torch.Tensor:
+        """
+        Logits at `resolution` (a multiple of the patch size, e.g. 168 = 12 x 12 patches instead of 16 x 16 at 224;
+        DINOv2 interpolates its position embeddings to the patch grid) with only keep_ratio of the patch tokens kept
+        after the first prune_after_layer blocks. The head averages the kept patch tokens.
+        """
+        if resolution is not None and resolution != pixel_values.shape[-1]:
+            if resolution % self.config.patch_size:
+                raise ValueError(f"resolution must be a multiple of the patch size ({self.config.patch_size}), got {resolution}")
+            pixel_values = F.interpolate(pixel_values, size=(resolution, resolution), mode="bicubic", align_corners=False,
+                                         antialias=True)
+
+        hidden_states = self.backbone.embeddings(pixel_values)
+        for index, layer in enumerate(self.backbone.encoder.layer):
+            if index == prune_after_layer and keep_ratio < 1.0:
+                hidden_states = self.prune_tokens(hidden_states, layer, keep_ratio)
+            layer_outputs = layer(hidden_states)
+            # Older transformers releases return a tuple per layer
+            hidden_states = layer_outputs[0] if isinstance(layer_outputs, tuple) else layer_outputs
+        return self.classify_tokens(self.backbone.layernorm(hidden_states))
+
+    def predict_adaptive(
+        self,
+        pixel_values: torch.Tensor,
+        low_resolution: int = 168,
+        keep_ratio: float = 0.5,
+        prune_after_layer: int = 4,
+        confidence_threshold: float = 0.8,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Early exit: a cheap pass (forward_pruned at low_resolution) for the whole batch, then only the images whose
+        top-1 probability is below confidence_threshold go through the full model at the input resolution.
+        Returns (logits, bool mask of the images that fell back to the full model).
+        """
+        logits = self.forward_pruned(pixel_values, low_resolution, keep_ratio, prune_after_layer)
+        fell_back = logits.softmax(dim=-1).amax(dim=-1) < confidence_threshold
+        if fell_back.any():
+            logits[fell_back] = self(pixel_values=pixel_values[fell_back]).logits.to(logits.dtype)
+        return logits, fell_back
\ No newline at end of file
@@ -0,0 +1,166 @@
+'''
+    Mixed precision, gradient checkpointing, fused optimizer and torch.compile options
+    - detect_capabilities: what the current device supports
+    - resolve_training_args: turn config.py options into TrainingArguments keyword arguments (with CPU fallback)
+    - benchmark: step time and peak memory for each combination
+
+    Benchmark usage: python precision.py --batch-size 32 --steps 10
+'''
+import argparse
+import itertools
+import sys
+import time
+from typing import List, Optional
+
+import torch
+
+
+def detect_capabilities() -> dict:
+    cuda = torch.cuda.is_available()
+    return {
+        "device": "cuda" if cuda else "cpu",
+        "device_name": torch.cuda.get_device_name(0) if cuda else "cpu",
+        "bf16": cuda and torch.cuda.is_bf16_supported(),
+        "fp16": cuda,
+        "fused_optimizer": cuda,
+        # Inductor needs triton / a C++ toolchain, which is not usable on Windows
+        "torch_compile": hasattr(torch, "compile") and sys.platform != "win32",
+    }
+
+
+def resolve_precision(mixed_precision: str, capabilities: dict) -> str:
+    """
+    Returns "bf16", "fp16" or "no" for the requested mode, falling back when the device can't run it.
+    """
+    if mixed_precision == "auto":
+        if capabilities["bf16"]:
+            return "bf16"
+        return "fp16" if capabilities["fp16"] else "no"
+
+    if mixed_precision not in ("bf16", "fp16", "no"):
+        raise ValueError(f"Unknown mixed precision mode: {mixed_precision}")
+
+    if mixed_precision != "no" and not capabilities[mixed_precision]:
+        print(f"{mixed_precision} is not supported on {capabilities['device_name']}, falling back to fp32")
+        return "no"
+    return mixed_precision
+
+
+def resolve_training_args(
+    mixed_precision: str = "auto",
+    gradient_checkpointing: bool = False,
+    fused_optimizer: bool = True,
+    torch_compile: bool = False,
+    capabilities: Optional[dict] = None,
+) -> dict:
+    """
+    Returns bf16 / fp16 / gradient_checkpointing / optim / torch_compile for TrainingArguments.
+    """
+    if capabilities is None:
+        capabilities = detect_capabilities()
+
+    precision = resolve_precision(mixed_precision, capabilities)
+
+    if fused_optimizer and not capabilities["fused_optimizer"]:
+        print(f"Fused AdamW is not supported on {capabilities['device_name']}, using adamw_torch")
+        fused_optimizer = False
+
+    if torch_compile and not capabilities["torch_compile"]:
+        print("torch.compile is not supported on this platform, running eager")
+        torch_compile = False
+
+    return {
+        "bf16": precision == "bf16",
+        "fp16": precision == "fp16",
+        "gradient_checkpointing": gradient_checkpointing,
+        "optim": "adamw_torch_fused" if fused_optimizer else "adamw_torch",
+        "torch_compile": torch_compile,
+    }
+
+
+def load_model():
+    from config import TrainConfig
+    from train import build_model
+    return build_model(TrainConfig())
+
+
+def benchmark_step(precision: str, gradient_checkpointing: bool, torch_compile: bool, fused_optimizer: bool,
+                   batch_size: int, steps: int, warmup: int, device: str) -> dict:
+    from config import NUM_CLASSES
+
+    model = load_model().to(device)  # type: ignore
+    model.train()
+    if gradient_checkpointing:
+        model.gradient_checkpointing_enable()
+    forward = torch.compile(model) if torch_compile else model
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=4e-5, fused=fused_optimizer)
+    scaler = torch.amp.GradScaler(device, enabled=precision == "fp16")  # type: ignore
+    dtype = {"bf16": torch.bfloat16, "fp16": torch.float16}.get(precision, torch.float32)
+
+    pixel_values = torch.randn(batch_size, 3, 224, 224, device=device)
+    labels = torch.randint(0, NUM_CLASSES, (batch_size,), device=device)
+
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+
+    # Warmup steps absorb cudnn autotuning and torch.compile time
+    timings: List[float] = []
+    for step in range(warmup + steps):
+        start = time.perf_counter()
+        with torch.autocast(device_type=device, dtype=dtype, enabled=precision != "no"):
+            loss = forward(pixel_values=pixel_values, labels=labels).loss
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+        optimizer.zero_grad(set_to_none=True)
+        if device == "cuda":
+            torch.cuda.synchronize()
+        if step >= warmup:
+            timings.append(time.perf_counter() - start)
+
+    peak_memory = torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else float("nan")
+    del model, forward, optimizer
+    if device == "cuda":
+        torch.cuda.empty_cache()
+
+    step_time = sum(timings) / len(timings)
+    return {"step_ms": 1000 * step_time, "samples_per_sec": batch_size / step_time, "peak_memory_mb": peak_memory}
+
+
+def benchmark(batch_size: int = 32, steps: int = 10, warmup: int = 3) -> List[dict]:
+    """
+    Runs a few synthetic training steps for every supported precision / checkpointing / compile combination.
+    """
+    capabilities = detect_capabilities()
+    device = capabilities["device"]
+    print(f"Device: {capabilities['device_name']}")
+
+    precisions = ["no"] + [p for p in ("bf16", "fp16") if capabilities[p]]
+    compile_options = [False, True] if capabilities["torch_compile"] else [False]
+
+    results = []
+    print(f"{'Precision':<11}{'Checkpoint':<12}{'Compile':<9}{'Step (ms)':<11}{'Samples/sec':<13}{'Peak Mem (MB)':<14}")
+    for precision, gradient_checkpointing, torch_compile in itertools.product(precisions, [False, True], compile_options):
+        try:
+            result = benchmark_step(precision, gradient_checkpointing, torch_compile, capabilities["fused_optimizer"],
+                                    batch_size, steps, warmup, device)
+        except torch.cuda.OutOfMemoryError:
+            torch.cuda.empty_cache()
+            result = {"step_ms": float("nan"), "samples_per_sec": 0.0, "peak_memory_mb": float("inf")}
+
+        result.update(precision=precision, gradient_checkpointing=gradient_checkpointing, torch_compile=torch_compile)
+        results.append(result)
+        print(f"{precision:<11}{str(gradient_checkpointing):<12}{str(torch_compile):<9}"
+              f"{result['step_ms']:<11.1f}{result['samples_per_sec']:<13.1f}{result['peak_memory_mb']:<14.0f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark training step time and peak memory per precision option.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--steps", type=int, default=10, help="Timed steps per combination")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed steps per combination")
+    args = parser.parse_args()
+
+    benchmark(batch_size=args.batch_size, steps=args.steps, warmup=args.warmup)
@@ -0,0 +1,168 @@
+'''
+    Training throughput helpers
+    - autotune_dataloader: benchmark DataLoader worker / prefetch combinations and pick the fastest
+    - StepTimingCallback: report data-wait vs compute time per training step
+'''
+import os
+import time
+from typing import Callable, List, Optional, Sequence
+
+import torch
+from torch.utils.data import DataLoader, Dataset, Subset
+from transformers.trainer_callback import TrainerCallback
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_worker_candidates() -> List[int]:
+    cpus = available_cpus()
+    candidates = [0]
+    workers = 2
+    while workers <= cpus:
+        candidates.append(workers)
+        workers *= 2
+    return candidates
+
+
+def measure_loader_throughput(loader: DataLoader, num_batches: int) -> float:
+    """
+    Returns samples/sec for `num_batches` batches of `loader`.
+    The first batch is excluded because it includes worker startup.
+    """
+    iterator = iter(loader)
+    next(iterator)
+
+    samples = 0
+    start = time.perf_counter()
+    for _ in range(num_batches):
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            break
+        samples += len(batch["labels" if "labels" in batch else "label"])
+    elapsed = time.perf_counter() - start
+
+    # Shut down the workers before the next candidate starts its own
+    del iterator
+    return samples / elapsed if elapsed > 0 else 0.0
+
+
+def autotune_dataloader(
+    dataset: Dataset,
+    batch_size: int,
+    collate_fn: Optional[Callable] = None,
+    worker_candidates: Optional[Sequence[int]] = None,
+    prefetch_candidates: Sequence[int] = (2, 4),
+    pin_memory: bool = False,
+    num_batches: int = 20,
+    seed: int = 42,
+) -> dict:
+    """
+    Benchmark DataLoader configurations on a random subset of `dataset` and return the best one
+    as TrainingArguments keyword arguments (dataloader_num_workers, dataloader_prefetch_factor, ...).
+    """
+    if worker_candidates is None:
+        worker_candidates = default_worker_candidates()
+
+    # Only load as many samples as the benchmark needs (+1 warmup batch per candidate)
+    generator = torch.Generator().manual_seed(seed)
+    num_samples = min(len(dataset), batch_size * (num_batches + 1))  # type: ignore
+    subset = Subset(dataset, torch.randperm(len(dataset), generator=generator)[:num_samples].tolist())  # type: ignore
+
+    best: dict = {}
+    best_throughput = -1.0
+    print(f"{'Workers':<10}{'Prefetch':<10}{'Samples/sec':<12}")
+    for num_workers in worker_candidates:
+        # prefetch_factor is only valid with worker processes
+        for prefetch_factor in (prefetch_candidates if num_workers > 0 else [None]):
+            loader = DataLoader(
+                subset,
+                batch_size=batch_size,
+                collate_fn=collate_fn,
+                num_workers=num_workers,
+                prefetch_factor=prefetch_factor,
+                pin_memory=pin_memory,
+            )
+            throughput = measure_loader_throughput(loader, num_batches)
+            print(f"{num_workers:<10}{str(prefetch_factor):<10}{throughput:<12.1f}")
+
+            if throughput > best_throughput:
+                best_throughput = throughput
+                best = {
+                    "dataloader_num_workers": num_workers,
+                    "dataloader_prefetch_factor": prefetch_factor,
+                    "dataloader_persistent_workers": num_workers > 0,
+                    "dataloader_pin_memory": pin_memory,
+                }
+
+    print(f"Selected DataLoader config: {best} ({best_throughput:.1f} samples/sec)")
+    return best
+
+
+class StepTimingCallback(TrainerCallback):
+    """
+    Splits every optimizer step into data wait (previous step end -> this step begin, i.e. fetching the batch)
+    and compute (step begin -> step end). Eval / save / log time is excluded from data wait.
+    """
+    def __init__(self, log_every: int = 50) -> None:
+        super().__init__()
+        self.log_every = log_every
+        self.history: List[dict] = []
+        self._last_step_end: Optional[float] = None
+        self._step_begin = 0.0
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self._data_wait = 0.0
+        self._compute = 0.0
+        self._steps = 0
+
+    def _pause(self, *args, **kwargs) -> None:
+        self._last_step_end = None
+
+    # Time spent outside of the training loop must not count as data wait
+    on_epoch_begin = _pause
+    on_evaluate = _pause
+    on_save = _pause
+    on_log = _pause
+
+    def on_step_begin(self, args, state, control, **kwargs):  # type: ignore
+        now = time.perf_counter()
+        if self._last_step_end is not None:
+            self._data_wait += now - self._last_step_end
+        self._step_begin = now
+
+    def on_step_end(self, args, state, control, **kwargs):  # type: ignore
+        # CUDA kernels run asynchronously, wait for them so compute time is real
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self._compute += now - self._step_begin
+        self._last_step_end = now
+        self._steps += 1
+
+        if self._steps >= self.log_every:
+            self._report(state)
+
+    def on_epoch_end(self, args, state, control, **kwargs):  # type: ignore
+        if self._steps:
+            self._report(state)
+
+    def _report(self, state) -> None:
+        total = self._data_wait + self._compute
+        record = {
+            "step": state.global_step,
+            "data_wait_ms": 1000 * self._data_wait / self._steps,
+            "compute_ms": 1000 * self._compute / self._steps,
+            "data_wait_ratio": self._data_wait / total if total > 0 else 0.0,
+        }
+        self.history.append(record)
+        print(
+            f"[step {record['step']}] data wait {record['data_wait_ms']:.1f} ms | "
+            f"compute {record['compute_ms']:.1f} ms | data wait {100 * record['data_wait_ratio']:.1f}%"
+        )
+        self._reset_window()
@@ -0,0 +1,226 @@
+'''
+    Versioned train/val split store keyed by file content hash (replaces pickle/label_encoder.pkl + pickle/split_indices.pkl)
+    - Saved as plain numpy arrays (.npz, no pickle) with a schema version and a checksum that is verified on load
+    - Splits follow the image content, not the directory listing order
+    - New images are assigned to train/val per class without reshuffling the existing split
+    - Class ids are stable: new classes are appended, existing ids never move
+
+    usage: python split_store.py [--dataset-dir ./dataset]  (creates / updates the store and prints a summary)
+'''
+import argparse
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import DATASET_DIR
+from manifest import MANIFEST_PATH, Manifest, build_manifest
+
+SPLIT_STORE_VERSION = 1
+SPLIT_STORE_PATH = os.path.join(".", "splits", "split_store.npz")
+LEGACY_SPLIT_FILE = os.path.join(".", "pickle", "split_indices.pkl")
+
+TRAIN = 0
+VAL = 1
+
+
+@dataclass
+class SplitStore:
+    classes: np.ndarray  # (C,) class names, index = encoded label
+    hashes: np.ndarray   # (N,) uint64 content hashes, sorted
+    splits: np.ndarray   # (N,) uint8, TRAIN or VAL
+
+    def checksum(self) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.int32(SPLIT_STORE_VERSION).tobytes())
+        digest.update("\n".join(self.classes.tolist()).encode("utf-8"))
+        digest.update(np.ascontiguousarray(self.hashes, dtype=np.uint64).tobytes())
+        digest.update(np.ascontiguousarray(self.splits, dtype=np.uint8).tobytes())
+        return digest.hexdigest()
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            version=np.int32(SPLIT_STORE_VERSION),
+            classes=self.classes,
+            hashes=self.hashes,
+            splits=self.splits,
+            checksum=np.array(self.checksum()),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SplitStore":
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version != SPLIT_STORE_VERSION:
+                raise ValueError(f"Unsupported split store version {version} in {path}")
+            store = cls(classes=data["classes"], hashes=data["hashes"], splits=data["splits"])
+            expected = str(data["checksum"])
+
+        if store.checksum() != expected:
+            raise ValueError(f"Split store {path} failed its integrity check, refusing to use it")
+        return store
+
+    @classmethod
+    def empty(cls) -> "SplitStore":
+        return cls(classes=np.array([], dtype=str), hashes=np.array([], dtype=np.uint64), splits=np.array([], dtype=np.uint8))
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Returns the split of every hash, -1 for hashes that are not in the store.
+        """
+        result = np.full(len(hashes), -1, dtype=np.int8)
+        if len(self.hashes) == 0:
+            return result
+        positions = np.searchsorted(self.hashes, hashes)
+        positions = np.minimum(positions, len(self.hashes) - 1)
+        found = self.hashes[positions] == hashes
+        result[found] = self.splits[positions[found]]
+        return result
+
+    def add(self, hashes: np.ndarray, splits: np.ndarray) -> None:
+        all_hashes = np.concatenate([self.hashes, hashes.astype(np.uint64)])
+        all_splits = np.concatenate([self.splits, splits.astype(np.uint8)])
+        order = np.argsort(all_hashes, kind="stable")
+        self.hashes = all_hashes[order]
+        self.splits = all_splits[order]
+
+    def encode_labels(self, class_names: np.ndarray) -> np.ndarray:
+        """
+        Map class names to stable ids, registering classes that are not in the store yet.
+        """
+        known = {name: idx for idx, name in enumerate(self.classes.tolist())}
+        new_classes = sorted(set(class_names.tolist()) - known.keys())
+        if new_classes:
+            print(f"Adding {len(new_classes)} new classes to the split store")
+            self.classes = np.concatenate([self.classes, np.array(new_classes, dtype=str)])
+            known.update({name: len(known) + i for i, name in enumerate(new_classes)})
+        return np.array([known[name] for name in class_names.tolist()], dtype=np.int64)
+
+
+def assign_new(hashes: np.ndarray, labels: np.ndarray, current: np.ndarray, test_size: float) -> np.ndarray:
+    """
+    Assign rows with current == -1 to TRAIN / VAL. Each class is topped up towards `test_size` validation images,
+    in hash order, so the result is deterministic and existing assignments are untouched.
+    """
+    splits = current.copy()
+    for label in np.unique(labels[current < 0]):
+        in_class = labels == label
+        new_rows = np.flatnonzero(in_class & (current < 0))
+        new_rows = new_rows[np.argsort(hashes[new_rows], kind="stable")]
+
+        val_count = int(np.count_nonzero(current[in_class] == VAL))
+        total = int(np.count_nonzero(current[in_class] >= 0))
+        for row in new_rows:
+            total += 1
+            if val_count < round(total * test_size):
+                splits[row] = VAL
+                val_count += 1
+            else:
+                splits[row] = TRAIN
+    return splits
+
+
+def initial_split(hashes: np.ndarray, labels: np.ndarray, test_size: float, seed: int) -> np.ndarray:
+    """
+    Stratified random split for a fresh store (same behaviour as train_test_split(stratify=...), no sklearn needed).
+    """
+    rng = np.random.default_rng(seed)
+    splits = np.full(len(hashes), TRAIN, dtype=np.int8)
+    for label in np.unique(labels):
+        rows = rng.permutation(np.flatnonzero(labels == label))
+        splits[rows[: int(round(len(rows) * test_size))]] = VAL
+    return splits
+
+
+def migrate_legacy_split(manifest: Manifest, legacy_split_file: str) -> Optional[np.ndarray]:
+    """
+    Read split_indices.pkl (indices into the directory listing order, which the manifest preserves).
+    Only used once, to carry an existing split over to the store. Returns None if it doesn't match the dataset.
+    """
+    with open(legacy_split_file, "rb") as f:
+        indices = pickle.load(f)
+
+    train_idx = np.asarray(list(indices["train"]), dtype=np.int64)
+    val_idx = np.asarray(list(indices["val"]), dtype=np.int64)
+    if len(train_idx) + len(val_idx) != len(manifest):
+        print(f"Warning: {legacy_split_file} has {len(train_idx) + len(val_idx)} entries but the dataset has "
+              f"{len(manifest)} images, its indices can't be trusted")
+        return None
+
+    splits = np.full(len(manifest), -1, dtype=np.int8)
+    splits[train_idx] = TRAIN
+    splits[val_idx] = VAL
+    return splits
+
+
+def load_split(
+    manifest: Manifest,
+    store_path: str = SPLIT_STORE_PATH,
+    test_size: float = 0.2,
+    seed: int = 42,
+    legacy_split_file: str = LEGACY_SPLIT_FILE,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """
+    Returns (train_idx, val_idx, labels_encoded, classes) for the manifest rows, creating or updating the store as needed.
+    Identical images (same content hash) always land in the same split.
+    """
+    if os.path.exists(store_path):
+        store = SplitStore.load(store_path)
+        print(f"Loading train/val split from {store_path}")
+    else:
+        store = SplitStore.empty()
+
+    labels_encoded = store.encode_labels(manifest.label_names())
+    splits = store.lookup(manifest.hashes)
+    changed = len(store.hashes) == 0 or bool(np.any(splits < 0))
+
+    if len(store.hashes) == 0:
+        legacy_splits = None
+        if legacy_split_file and os.path.exists(legacy_split_file):
+            print(f"Migrating train/val split from {legacy_split_file} to {store_path}")
+            legacy_splits = migrate_legacy_split(manifest, legacy_split_file)
+
+        if legacy_splits is not None:
+            splits = legacy_splits
+        else:
+            print(f"Generating new train/val split and saving to {store_path}")
+            splits = initial_split(manifest.hashes, labels_encoded, test_size, seed)
+
+    # Duplicated files share a hash: give every copy the split of its first occurrence
+    unique_hashes, first, inverse = np.unique(manifest.hashes, return_index=True, return_inverse=True)
+    unique_splits = splits[first]
+    missing = unique_splits < 0
+    if np.any(missing):
+        print(f"Assigning {int(np.count_nonzero(missing))} new images to train/val")
+        unique_splits = assign_new(unique_hashes, labels_encoded[first], unique_splits, test_size)
+    splits = unique_splits[inverse]
+
+    if changed:
+        new_in_store = store.lookup(unique_hashes) < 0
+        store.add(unique_hashes[new_in_store], unique_splits[new_in_store])
+        store.save(store_path)
+
+    train_idx = np.flatnonzero(splits == TRAIN)
+    val_idx = np.flatnonzero(splits == VAL)
+    return train_idx, val_idx, labels_encoded, store.classes.tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create / update the train/val split store.")
+    parser.add_argument("--dataset-dir", type=str, default=DATASET_DIR)
+    parser.add_argument("--manifest", type=str, default=MANIFEST_PATH)
+    parser.add_argument("--store", type=str, default=SPLIT_STORE_PATH)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--legacy-split-file", type=str, default=LEGACY_SPLIT_FILE)
+    args = parser.parse_args()
+
+    manifest = build_manifest(args.dataset_dir, args.manifest)
+    train_idx, val_idx, _, classes = load_split(manifest, args.store, args.test_size, legacy_split_file=args.legacy_split_file)
+    print(f"Train: {len(train_idx)}, Val: {len(val_idx)}, classes: {len(classes)}")
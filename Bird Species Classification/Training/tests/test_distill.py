@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import torch
+from torch import nn
+from torch.utils.data import Dataset
+from transformers.modeling_outputs import ImageClassifierOutput
+from transformers.training_args import TrainingArguments
+
+import distill
+from distill import DistillationTrainer, TeacherLogitsDataset, distillation_loss
+
+NUM_CLASSES = 4
+
+
+class TinyClassifier(nn.Module):
+    """
+    Same forward signature as CustomDinoV2ClassifierWithReg (pixel_values, labels), no teacher_logits argument.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.head = nn.Linear(3 * 8 * 8, NUM_CLASSES)
+
+    def forward(self, pixel_values=None, labels=None):
+        logits = self.head(pixel_values.flatten(1))
+        loss = nn.functional.cross_entropy(logits, labels) if labels is not None else None
+        return ImageClassifierOutput(loss=loss, logits=logits)
+
+
+class TinyDataset(Dataset):
+    def __init__(self, size: int = 8) -> None:
+        generator = torch.Generator().manual_seed(0)
+        self.pixel_values = torch.randn(size, 3, 8, 8, generator=generator)
+        self.labels = torch.arange(size) % NUM_CLASSES
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __getitem__(self, idx: int) -> dict:
+        return {"pixel_values": self.pixel_values[idx], "labels": self.labels[idx]}
+
+
+def test_distillation_loss_matches_cross_entropy_without_soft_targets():
+    """
+    alpha = 0 leaves only the hard label cross entropy.
+    """
+    student, teacher = torch.randn(6, NUM_CLASSES), torch.randn(6, NUM_CLASSES)
+    labels = torch.arange(6) % NUM_CLASSES
+    expected = nn.functional.cross_entropy(student, labels)
+    assert torch.allclose(distillation_loss(student, teacher, labels, alpha=0.0), expected)
+
+
+def test_distillation_loss_is_zero_kl_for_identical_logits():
+    """
+    With alpha = 1 and the student equal to the teacher, the soft target loss is zero.
+    """
+    logits = torch.randn(6, NUM_CLASSES)
+    labels = torch.arange(6) % NUM_CLASSES
+    assert distillation_loss(logits, logits.clone(), labels, alpha=1.0).item() == pytest.approx(0.0, abs=1e-6)
+
+
+def test_trainer_uses_soft_target_loss(tmp_path, monkeypatch):
+    """
+    Train batches carry teacher_logits through the default remove_unused_columns collator, so every training
+    step goes through distillation_loss with the cached teacher logits.
+    """
+    dataset = TinyDataset()
+    teacher_logits = np.random.default_rng(0).standard_normal((len(dataset), NUM_CLASSES)).astype(np.float32)
+
+    calls = []
+
+    def recording_loss(student_logits, batch_teacher_logits, labels, temperature, alpha):
+        calls.append(batch_teacher_logits.detach().cpu())
+        return distillation_loss(student_logits, batch_teacher_logits, labels, temperature, alpha)
+
+    monkeypatch.setattr(distill, "distillation_loss", recording_loss)
+
+    args = TrainingArguments(
+        output_dir=str(tmp_path),
+        per_device_train_batch_size=4,
+        max_steps=2,
+        report_to=[],
+        save_strategy="no",
+        use_cpu=True,
+    )
+    assert args.remove_unused_columns
+    trainer = DistillationTrainer(
+        model=TinyClassifier(),
+        args=args,
+        train_dataset=TeacherLogitsDataset(dataset, teacher_logits),
+        temperature=2.0,
+        alpha=0.5,
+    )
+    trainer.train()
+
+    assert len(calls) == 2
+    seen = torch.cat(calls).numpy()
+    # Every batch row is one of the cached teacher rows (the sampler shuffles)
+    assert all(np.isclose(teacher_logits, row, atol=1e-6).all(axis=1).any() for row in seen)
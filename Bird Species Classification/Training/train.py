@@ -1,147 +1,110 @@
 '''
-    Original File. Use train.ipynb for newer version
+    Train the DINOv2 classifier
+    usage: python train.py [--config train.toml] [--set learning_rate=2e-5 --set run_name="lr-2e-5"] [--no-resume]
+
+    Runs with a fixed run_name resume from their latest checkpoint automatically.
+    Nothing expensive happens at import time: processor, model, datasets and Trainer are built in main().
 '''
+import argparse
+import csv
 import os
-import pickle
-import torch
-import torch.nn as nn
-from typing import List, Optional, cast
-import numpy as np
-from PIL import Image
-from glob import glob
 from copy import deepcopy
 from datetime import datetime
-from sklearn.model_selection import train_test_split
-from transformers import AutoImageProcessor, Dinov2WithRegistersModel, Dinov2WithRegistersConfig
-from transformers.trainer import Trainer
-from transformers.training_args import TrainingArguments
-from torch.utils.data import Dataset
-from transformers.data.data_collator import default_data_collator
-from sklearn.metrics import accuracy_score, f1_score
-from sklearn.preprocessing import LabelEncoder
+from typing import List, Optional, Tuple, cast
+
+import numpy as np
+import torch
+from torch.utils.data import Subset
 from transformers.trainer_callback import EarlyStoppingCallback, TrainerCallback
-from torchvision import transforms
-from config import BASE_MODEL_NAME, NUM_CLASSES , HIDDEN_DIM, DATASET_DIR
-from model import CustomDinoV2ClassifierWithReg
 
-# Train Config
-BATCH_SIZE  = 32
-NUM_EPOCHS  = 50
+from config import TrainConfig, load_train_config, parse_override
+
 
 # 1. Load pretrained DINOv2 backbone + processor
-processor = AutoImageProcessor.from_pretrained(BASE_MODEL_NAME, cache_dir="./cache", use_fast=True)
-config = cast(Dinov2WithRegistersConfig, Dinov2WithRegistersConfig.from_pretrained(BASE_MODEL_NAME, cache_dir="./cache"))
-
-model = CustomDinoV2ClassifierWithReg.from_pretrained(
-    BASE_MODEL_NAME,
-    config=config,
-    num_classes=NUM_CLASSES,
-    hidden_dim=HIDDEN_DIM,
-    cache_dir="./cache",
-)
-
-# Optionally Freeze backbone
-'''
-model.backbone.requires_grad_(False)
-for param in model.backbone.parameters():
-    param.requires_grad = False
-'''
+def build_processor(cfg: TrainConfig):
+    from transformers import AutoImageProcessor
+    return AutoImageProcessor.from_pretrained(cfg.base_model_name, cache_dir=cfg.cache_dir, use_fast=True)
+
+
+def build_model(cfg: TrainConfig):
+    from transformers import Dinov2WithRegistersConfig
+    from model import CustomDinoV2ClassifierWithReg
+
+    config = cast(Dinov2WithRegistersConfig, Dinov2WithRegistersConfig.from_pretrained(cfg.base_model_name, cache_dir=cfg.cache_dir))
+    model = CustomDinoV2ClassifierWithReg.from_pretrained(
+        cfg.base_model_name,
+        config=config,
+        num_classes=cfg.num_classes,
+        hidden_dim=cfg.hidden_dim,
+        cache_dir=cfg.cache_dir,
+    )
+
+    # Optionally Freeze backbone
+    if cfg.freeze_backbone:
+        model.backbone.requires_grad_(False)
+    return model
+
+
+# 2. Load image from DATASET DIR (saved manifest, --rebuild-manifest rescans: only new / changed files are re-read)
+# 3. Encode labels as integers and split train / val (content-hash keyed split store)
+def load_dataset_split(cfg: TrainConfig):
+    from manifest import load_or_build_manifest
+    from split_store import load_split
 
-# 2. Load image from DATASET DIR
-image_paths = []
-labels = []
-for class_folder in os.listdir(DATASET_DIR):
-    class_path = os.path.join(DATASET_DIR, class_folder)
-    if os.path.isdir(class_path):
-        # Assume images are jpg/png inside
-        for img_file in glob(os.path.join(class_path, "*.*")):
-            image_paths.append(img_file)
-            labels.append(class_folder)
-
-print(f"Total images: {len(image_paths)}, classes: {len(set(labels))}")
-
-# 3. Encode labels as integers
-label_encoder_path = "./pickle/label_encoder.pkl"
-if os.path.exists(label_encoder_path):
-    with open(label_encoder_path, "rb") as f:
-        le = pickle.load(f)
-    print("LabelEncoder loaded from file.")
-else:
-    le = LabelEncoder()
-    with open(label_encoder_path, "wb") as f:
-        pickle.dump(le, f)
-    print("LabelEncoder created and saved to file.")
-
-labels_encoded = le.fit_transform(labels)
-for original_label, encoded_label in zip(le.classes_, range(len(le.classes_))):
-    print(f"{original_label} -> {encoded_label}")
-
-# 4. Generate Train and Test Split
-split_file = "./pickle/split_indices.pkl"
-if os.path.exists(split_file):
-    print(f"Loading train/val split from {split_file}")
-    with open(split_file, "rb") as f:
-        indices = pickle.load(f)
-        train_idx = indices["train"]
-        val_idx = indices["val"]
-else:
-    print(f"Generating new train/val split and saving to {split_file}")
-    train_idx, val_idx = train_test_split(
-        range(len(image_paths)), test_size=0.2, stratify=labels_encoded, random_state=42
+    manifest = load_or_build_manifest(cfg.dataset_dir, cfg.manifest_path, rebuild=cfg.rebuild_manifest)
+    image_paths = manifest.image_paths(cfg.dataset_dir)
+    print(f"Total images: {len(image_paths)}, classes: {len(manifest.classes)}")
+
+    train_idx, val_idx, labels_encoded, classes = load_split(
+        manifest,
+        store_path=cfg.split_store_path,
+        test_size=cfg.test_size,
+        seed=cfg.seed,
+        legacy_split_file=cfg.legacy_split_file,
     )
-    with open(split_file, "wb") as f:
-        pickle.dump({"train": train_idx, "val": val_idx}, f)
-
-# 5. Custom Dataset
-class BirdDataset(Dataset):
-    def __init__(self, image_paths: List[str], labels: List[int], processor: AutoImageProcessor, augment = False):
-        self.image_paths = image_paths
-        self.labels = labels
-        self.processor = processor
-        self.augment = augment
-        self.augmentations = transforms.Compose([
-            transforms.RandomResizedCrop(224, scale=(0.8, 1.0)),
-            transforms.RandomHorizontalFlip(),
-            transforms.ColorJitter(0.1, 0.1, 0.1, 0.05),
-        ])
-
-
-    def __len__(self) -> int:
-        """Returns the total number of images in the dataset."""
-        return len(self.image_paths)
-
-    def __getitem__(self, idx: int) -> dict:
-        # Load the image (using PIL)
-        image = Image.open(self.image_paths[idx]).convert("RGB")
-        
-        # Retrieve the label (already encoded as an integer)
-        label = self.labels[idx]
-
-        if self.augment:
-            image = self.augmentations(image)
-        
-        # Use processor to prepare the image for the model
-        encoding = self.processor(images=image, return_tensors="pt") # type: ignore
-        
-        # Return the processed image (pixel_values) and the label
-        return {"pixel_values": encoding["pixel_values"].squeeze(0), "label": torch.tensor(label)}
-
-# 6. Split data into training and validation sets using the indices
-train_image_paths = [image_paths[i] for i in train_idx]
-train_labels = [labels_encoded[i] for i in train_idx] # type: ignore
-
-val_image_paths = [image_paths[i] for i in val_idx]
-val_labels = [labels_encoded[i] for i in val_idx] # type: ignore
-
-# Create dataset objects for train and validation
-train_dataset = BirdDataset(train_image_paths, train_labels, processor, augment=True) # type: ignore
-val_dataset = BirdDataset(val_image_paths, val_labels, processor) # type: ignore
-
-# Use default data collator to handle batching
-data_collator = default_data_collator
-
-# 7. Add Callback and Metrics for Training
+    for encoded_label, original_label in enumerate(classes):
+        print(f"{original_label} -> {encoded_label}")
+    write_label_mapping(classes)
+
+    return image_paths, labels_encoded, manifest.hashes, train_idx, val_idx
+
+
+def write_label_mapping(classes: List[str], path: str = "label_mapping.csv") -> None:
+    with open(path, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["original_label", "encoded_label"])
+        for encoded_label, original_label in enumerate(classes):
+            writer.writerow([original_label, encoded_label])
+
+
+# 4. Split data into training and validation sets using the indices
+def build_datasets(cfg: TrainConfig, processor):
+    from dataset import BirdDataset
+
+    image_paths, labels_encoded, hashes, train_idx, val_idx = load_dataset_split(cfg)
+
+    train_image_paths = [image_paths[i] for i in train_idx]
+    train_labels = labels_encoded[train_idx].tolist()
+
+    val_image_paths = [image_paths[i] for i in val_idx]
+    val_labels = labels_encoded[val_idx].tolist()
+
+    # Create dataset objects for train and validation
+    train_dataset = BirdDataset(train_image_paths, train_labels, processor, augment=True) # type: ignore
+    val_dataset = BirdDataset(val_image_paths, val_labels, processor) # type: ignore
+
+    # Distillation: cached teacher logits ride along with every train sample
+    if cfg.distill_teacher_dir:
+        from distill import TeacherLogitsDataset, cached_teacher_logits
+        teacher_logits = cached_teacher_logits(cfg, train_image_paths, hashes[train_idx])
+        train_dataset = TeacherLogitsDataset(train_dataset, teacher_logits)
+    return train_dataset, val_dataset
+
+
+# 5. Add Callback and Metrics for Training
 def compute_metrics(eval_pred):
+    from sklearn.metrics import accuracy_score, f1_score
+
     logits, labels = eval_pred.predictions, eval_pred.label_ids
     preds = np.argmax(logits, axis=-1)
     return {
@@ -149,70 +112,184 @@ def compute_metrics(eval_pred):
         "f1": f1_score(labels, preds, average="weighted"),
     }
 
-early_stopping_callback = EarlyStoppingCallback(
-    early_stopping_patience=5,  # Stop after 5 epochs without improvement
-    early_stopping_threshold=0.0001,  # Minimum improvement to reset the patience counter
-)
 
+# Will print training metrics if used in regular py file (not ipynb)
+# Also saved to results/{directory}/checkpoint-{number}/trainer_state.json
 class TrainingDataInfoCallback(TrainerCallback):
-    def __init__(self, trainer) -> None:
+    def __init__(self, trainer, max_samples: Optional[int] = None, seed: int = 42) -> None:
         super().__init__()
         self._trainer = trainer
         self._header_printed = False
-    
+
+        # Evaluate on a fixed random subset so the metric stays comparable between epochs
+        dataset = trainer.train_dataset
+        if max_samples is not None and max_samples < len(dataset):
+            generator = torch.Generator().manual_seed(seed)
+            indices = torch.randperm(len(dataset), generator=generator)[:max_samples].tolist()
+            dataset = Subset(dataset, indices)
+        self._eval_dataset = dataset
+
     def on_epoch_end(self, args, state, control, **kwargs): # type: ignore
         if control.should_evaluate:
             control_copy = deepcopy(control)
-            self._trainer.evaluate(eval_dataset=self._trainer.train_dataset, metric_key_prefix="train")
+            metrics = self._trainer.evaluate(eval_dataset=self._eval_dataset, metric_key_prefix="train")
+            train_loss = metrics.get("train_loss", float("nan"))
+            train_acc = metrics.get("train_accuracy", float("nan"))
+            train_f1 = metrics.get("train_f1", float("nan"))
+
+            if not self._header_printed:
+                print(f"{'Epoch':<8}{'Train Loss':<15}{'Train Accuracy':<15}{'F1':<10}")
+                self._header_printed = True
+
+            print(f"{state.epoch:<8.0f}{train_loss:<15.6f}{train_acc:<15.6f}{train_f1:<10.6f}")
             return control_copy
-        
-
-current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-output_dir = f"./results/{current_time}"
-logging_dir = f"./logs/{current_time}"
-
-# Change to "steps" strategy for non aggressive model saving
-training_args = TrainingArguments(
-    output_dir=output_dir,                   # output directory where the model checkpoints will be saved
-    eval_strategy="epoch",                   # Evaluate after each epoch
-    save_strategy="epoch",
-    learning_rate=4e-5,                      # Learning rate for Adam optimizer . use 1e-5 if batch size = 16
-    per_device_train_batch_size=BATCH_SIZE,  # Batch size for training
-    per_device_eval_batch_size=BATCH_SIZE,   # Batch size for evaluation
-    num_train_epochs=NUM_EPOCHS,             # Number of training epochs
-    weight_decay=0.01,                       # Weight decay for optimization
-    logging_dir=logging_dir,                 # Directory for logs
-    logging_strategy="epoch",                # log after every epoch
-    save_steps=2000,                         # Save checkpoint every 500 steps
-    save_total_limit= 5,
-    load_best_model_at_end=True,             # Load the best model when training finishes
-    metric_for_best_model="accuracy",        # Metric to use for best model selection
-    lr_scheduler_type = "cosine",
-    warmup_ratio= 0.04,
-    max_grad_norm=1.0, 
-)
-
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=train_dataset,
-    eval_dataset=val_dataset,
-    data_collator=data_collator,
-    compute_metrics=compute_metrics,
-    callbacks=[early_stopping_callback],
-)
-trainer.add_callback(TrainingDataInfoCallback(trainer)) 
-
-print(output_dir)
-print(logging_dir)
+
+
+def dataloader_args(cfg: TrainConfig, train_dataset, data_collator) -> dict:
+    pin_memory = torch.cuda.is_available() if cfg.dataloader_pin_memory is None else cfg.dataloader_pin_memory
+
+    # Pick DataLoader workers / prefetch by measured samples/sec
+    if cfg.dataloader_num_workers == "auto":
+        from profiling import autotune_dataloader
+        return autotune_dataloader(
+            train_dataset,
+            batch_size=cfg.batch_size,
+            collate_fn=data_collator,
+            pin_memory=pin_memory,
+            seed=cfg.seed,
+        )
+
+    num_workers = int(cfg.dataloader_num_workers)
+    return {
+        "dataloader_num_workers": num_workers,
+        "dataloader_prefetch_factor": cfg.dataloader_prefetch_factor if num_workers > 0 else None,
+        "dataloader_persistent_workers": num_workers > 0,
+        "dataloader_pin_memory": pin_memory,
+    }
+
+
+def run_dirs(cfg: TrainConfig) -> Tuple[str, str]:
+    run_name = cfg.run_name or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(cfg.output_root, run_name), os.path.join(cfg.logging_root, run_name)
+
+
+# 6. Build Trainer
+def build_trainer(cfg: TrainConfig, model, train_dataset, val_dataset, output_dir: str, logging_dir: str):
+    from transformers.data.data_collator import default_data_collator
+    from transformers.trainer import Trainer
+    from transformers.training_args import TrainingArguments
+    from precision import resolve_training_args
+
+    # Use default data collator to handle batching
+    data_collator = default_data_collator
+
+    # bf16 / fp16, gradient checkpointing, fused AdamW and torch.compile according to device support
+    precision_args = resolve_training_args(
+        mixed_precision=cfg.mixed_precision,
+        gradient_checkpointing=cfg.gradient_checkpointing,
+        fused_optimizer=cfg.fused_optimizer,
+        torch_compile=cfg.torch_compile,
+    )
+    print(f"Precision config: {precision_args}")
+
+    # Change to "steps" strategy for non aggressive model saving
+    training_args = TrainingArguments(
+        output_dir=output_dir,                       # output directory where the model checkpoints will be saved
+        eval_strategy="epoch",                       # Evaluate after each epoch
+        save_strategy="epoch",
+        learning_rate=cfg.learning_rate,             # Learning rate for Adam optimizer
+        per_device_train_batch_size=cfg.batch_size,  # Batch size for training
+        per_device_eval_batch_size=cfg.batch_size,   # Batch size for evaluation
+        num_train_epochs=cfg.num_epochs,             # Number of training epochs
+        weight_decay=cfg.weight_decay,               # Weight decay for optimization
+        logging_dir=logging_dir,                     # Directory for logs
+        logging_strategy="epoch",                    # log after every epoch
+        save_total_limit=cfg.save_total_limit,
+        load_best_model_at_end=True,                 # Load the best model when training finishes
+        metric_for_best_model="accuracy",            # Metric to use for best model selection
+        lr_scheduler_type=cfg.lr_scheduler_type,
+        warmup_ratio=cfg.warmup_ratio,
+        max_grad_norm=cfg.max_grad_norm,
+        seed=cfg.seed,
+        **dataloader_args(cfg, train_dataset, data_collator),  # Workers, prefetch, pin memory and persistent workers
+        **precision_args,                            # Mixed precision, gradient checkpointing, optimizer and torch.compile
+    )
+
+    early_stopping_callback = EarlyStoppingCallback(
+        early_stopping_patience=cfg.early_stopping_patience,
+        early_stopping_threshold=cfg.early_stopping_threshold,  # Minimum improvement to reset the patience counter
+    )
+
+    # Distillation runs swap in the soft target loss, evaluation is unchanged
+    trainer_class, trainer_kwargs = Trainer, {}
+    if cfg.distill_teacher_dir:
+        from distill import DistillationTrainer
+        trainer_class, trainer_kwargs = DistillationTrainer, {"temperature": cfg.distill_temperature, "alpha": cfg.distill_alpha}
+
+    trainer = trainer_class(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        data_collator=data_collator,
+        compute_metrics=compute_metrics,
+        callbacks=[early_stopping_callback],
+        **trainer_kwargs,
+    )
+    if cfg.train_eval_samples != 0:
+        trainer.add_callback(TrainingDataInfoCallback(trainer, max_samples=cfg.train_eval_samples, seed=cfg.seed))
+    if cfg.profile_steps:
+        from profiling import StepTimingCallback
+        trainer.add_callback(StepTimingCallback())
+    return trainer
+
+
+def main(cfg: TrainConfig, resume: bool = True) -> None:
+    from transformers.trainer_utils import get_last_checkpoint
+
+    output_dir, logging_dir = run_dirs(cfg)
+    print(output_dir)
+    print(logging_dir)
+
+    last_checkpoint = None
+    if resume and os.path.isdir(output_dir):
+        last_checkpoint = get_last_checkpoint(output_dir)
+        if last_checkpoint:
+            print(f"Resuming from {last_checkpoint}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    cfg.save(os.path.join(output_dir, "train_config.json"))
+
+    processor = build_processor(cfg)
+    model = build_model(cfg)
+    train_dataset, val_dataset = build_datasets(cfg, processor)
+    trainer = build_trainer(cfg, model, train_dataset, val_dataset, output_dir, logging_dir)
+
+    trainer.train(resume_from_checkpoint=last_checkpoint)
+    model.save_pretrained(output_dir)
+    processor.save_pretrained(output_dir)
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tune the DINOv2 bird species classifier.")
+    parser.add_argument("--config", type=str, default=None, help="TOML / YAML / JSON training config (see train.toml)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value, can be repeated (e.g. --set learning_rate=2e-5)")
+    parser.add_argument("--no-resume", action="store_true", help="Start from scratch even if the run has checkpoints")
+    parser.add_argument("--rebuild-manifest", action="store_true",
+                        help="Rescan dataset_dir for new / changed images instead of using the saved manifest")
+    args = parser.parse_args()
+
+    cfg = load_train_config(args.config)
+    for assignment in args.overrides:
+        cfg.override(*parse_override(assignment))
+    if args.rebuild_manifest:
+        cfg.rebuild_manifest = True
+
     try:
         os.environ["TRANSFORMERS_NO_TF"] = "1"
-        trainer.train()
-        model.save_pretrained(output_dir)
-        processor.save_pretrained(output_dir)
+        main(cfg, resume=not args.no_resume)
     except (KeyboardInterrupt, InterruptedError):
         pass
     except Exception as e:
-        print(f"{e}")
\ No newline at end of file
+        print(f"{e}")
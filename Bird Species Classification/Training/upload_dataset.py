@@ -1,46 +1,27 @@
-import os
-import pickle
-from datasets import load_dataset, DatasetDict
+from datasets import ClassLabel, Dataset, DatasetDict, Image
 from huggingface_hub import login
+from config import DATASET_DIR
+from manifest import MANIFEST_PATH, load_or_build_manifest
+from split_store import SPLIT_STORE_PATH, load_split
 
 login()
 
-# Load dataset
-dataset = load_dataset(path='./dataset', cache_dir='./cache')  # expects ImageFolder-style
-train_dataset = dataset["train"]  # type: ignore # The entire dataset is under "train" split
+# Load dataset from the cached manifest, labels and train/val split from the split store (same as train.py)
+manifest = load_or_build_manifest(DATASET_DIR, MANIFEST_PATH)
+train_idx, val_idx, labels_encoded, classes = load_split(manifest, SPLIT_STORE_PATH)
 
-split_file = "./pickle/split_indices.pkl"
-
-if os.path.exists(split_file):
-    print(f"Loading train/val split from {split_file}")
-    with open(split_file, "rb") as f:
-        indices = pickle.load(f)
-        train_idx = indices["train"]
-        val_idx = indices["val"]
-else:
-    print(f"Generating new train/val split and saving to {split_file}")
-    
-    # Get stratification labels (e.g., class indices)
-    labels = train_dataset["label"] # type: ignore
-    
-    from sklearn.model_selection import train_test_split
-    train_idx, val_idx = train_test_split(
-        list(range(len(train_dataset))),
-        test_size=0.2,
-        stratify=labels,
-        random_state=42,
-    )
-
-    with open(split_file, "wb") as f:
-        pickle.dump({"train": train_idx, "val": val_idx}, f)
+full_dataset = Dataset.from_dict({
+    "image": manifest.image_paths(DATASET_DIR),
+    "label": labels_encoded.tolist(),
+})
+full_dataset = full_dataset.cast_column("image", Image())
+full_dataset = full_dataset.cast_column("label", ClassLabel(names=classes))
 
 # Use Hugging Face select() to create splits
 split_dataset = DatasetDict({
-    "train": train_dataset.select(train_idx), # type: ignore
-    "validation": train_dataset.select(val_idx), # type: ignore
+    "train": full_dataset.select(train_idx),
+    "validation": full_dataset.select(val_idx),
 })
 
 # change hub name
 split_dataset.push_to_hub("__HUB__NAME")
-
-